@@ -0,0 +1,1285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, ProfitBricks GmbH, Berlin
+@summary: module for copying data between file descriptors, preferably
+          inside the kernel by copy_file_range(), sendfile() or splice(),
+          with a fallback to a reused user space buffer.
+"""
+
+# Standard modules
+import os
+import io
+import time
+import json
+import stat
+import mmap
+import errno
+import fcntl
+import struct
+import logging
+import threading
+
+# Own modules
+from pb_base.translate import pb_gettext, pb_ngettext
+
+from pb_base.syscalls import splice, SPLICE_F_MOVE, SPLICE_F_MORE
+from pb_base.syscalls import fallocate, FALLOC_FL_PUNCH_HOLE, FALLOC_FL_KEEP_SIZE
+from pb_base.syscalls import FALLOC_FL_ZERO_RANGE
+
+__version__ = '0.1.7'
+
+log = logging.getLogger(__name__)
+
+_ = pb_gettext
+__ = pb_ngettext
+
+# -----------------------------------------------------------------------------
+# Module variables
+
+DEFAULT_BLOCKSIZE = 1024 * 1024
+
+#: all copy engines in the order, how they are tried by the engine 'auto'
+ENGINES = ('copy_file_range', 'sendfile', 'splice', 'readinto')
+
+#: error numbers, which are saying, that an engine can't be used
+#: for the given file descriptors, so the next engine has to be tried
+UNSUPPORTED_ERRNOS = set([
+    errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP,
+    errno.ENOTSUP, errno.EBADF, errno.ESPIPE])
+
+F_SETPIPE_SZ = 1031
+
+#: all modes of zero_fd(), 'discard' is never used by the mode 'auto',
+#: because not all devices are reading zeroes from discarded blocks
+WIPE_MODES = ('zeroout', 'discard', 'zero_range', 'punch', 'write')
+
+DEFAULT_WIPE_BUFSIZE = 4 * 1024 * 1024
+
+# ioctl requests for block devices from <linux/fs.h>
+BLKDISCARD = 0x1277
+BLKZEROOUT = 0x127f
+
+O_DIRECT = getattr(os, 'O_DIRECT', 0o40000)
+
+#: the alignment of offsets and sizes needed for O_DIRECT
+DIRECT_ALIGNMENT = 512
+
+#: the page cache policies of CacheControl
+CACHE_POLICIES = ('sequential', 'dontneed')
+
+#: the interval of dropping the cached pages with the policy 'dontneed',
+#: if no sync interval was given
+DEFAULT_DONTNEED_INTERVAL = 64 * 1024 * 1024
+
+#: the default number of bytes between two checkpoints of CopyCheckpoint
+DEFAULT_CHECKPOINT_INTERVAL = 256 * 1024 * 1024
+
+# os.SEEK_DATA and os.SEEK_HOLE are available since Python 3.3
+SEEK_DATA = getattr(os, 'SEEK_DATA', 3)
+SEEK_HOLE = getattr(os, 'SEEK_HOLE', 4)
+
+
+# =============================================================================
+class EngineUnsupportedError(Exception):
+    """
+    Raised by a copy engine, if it can't be used (anymore) for the given
+    file descriptors. The file offsets are correct after the bytes
+    already copied.
+    """
+
+    def __init__(self, engine, copied, err=None):
+
+        self.engine = engine
+        self.copied = copied
+        self.err = err
+
+    def __str__(self):
+
+        return _("Copy engine %(e)r not usable after %(c)d Bytes: %(err)s") % {
+            'e': self.engine, 'c': self.copied, 'err': self.err}
+
+
+# =============================================================================
+def available_engines():
+    """
+    Gives back the names of all copy engines, which are basically available
+    in the current Python interpreter.
+    """
+
+    engines = []
+    if hasattr(os, 'copy_file_range'):
+        engines.append('copy_file_range')
+    if hasattr(os, 'sendfile'):
+        engines.append('sendfile')
+    engines.append('splice')
+    engines.append('readinto')
+    return engines
+
+
+# -----------------------------------------------------------------------------
+def _want(length, copied, blocksize):
+    if length is None:
+        return blocksize
+    return min(blocksize, length - copied)
+
+
+# -----------------------------------------------------------------------------
+def _copy_copy_file_range(src_fd, dst_fd, length, blocksize, callback):
+
+    copied = 0
+    while True:
+        want = _want(length, copied, blocksize)
+        if want <= 0:
+            break
+        try:
+            n = os.copy_file_range(src_fd, dst_fd, want)
+        except OSError as e:
+            if e.errno in UNSUPPORTED_ERRNOS:
+                raise EngineUnsupportedError('copy_file_range', copied, e)
+            raise
+        if not n:
+            if not copied:
+                # some pseudo filesystems are pretending an empty file,
+                # the next engine has to decide about the end of file
+                raise EngineUnsupportedError(
+                    'copy_file_range', copied, _("no data on first call"))
+            break
+        copied += n
+        if callback:
+            callback(n)
+
+    return copied
+
+
+# -----------------------------------------------------------------------------
+def _copy_sendfile(src_fd, dst_fd, length, blocksize, callback):
+
+    # os.sendfile() with an explicit offset doesn't move the file offset
+    # of the source, so it has to be set at the end
+    try:
+        offset = os.lseek(src_fd, 0, os.SEEK_CUR)
+    except OSError as e:
+        if e.errno in UNSUPPORTED_ERRNOS:
+            raise EngineUnsupportedError('sendfile', 0, e)
+        raise
+    copied = 0
+    try:
+        while True:
+            want = _want(length, copied, blocksize)
+            if want <= 0:
+                break
+            try:
+                n = os.sendfile(dst_fd, src_fd, offset + copied, want)
+            except OSError as e:
+                if e.errno in UNSUPPORTED_ERRNOS:
+                    raise EngineUnsupportedError('sendfile', copied, e)
+                raise
+            if not n:
+                if not copied:
+                    raise EngineUnsupportedError(
+                        'sendfile', copied, _("no data on first call"))
+                break
+            copied += n
+            if callback:
+                callback(n)
+    finally:
+        os.lseek(src_fd, offset + copied, os.SEEK_SET)
+
+    return copied
+
+
+# -----------------------------------------------------------------------------
+def _clear_direct(fd):
+    """
+    Removes the flag O_DIRECT from the given file descriptor, if it was set,
+    because the last chunk of data is not aligned.
+    Gives back, whether the flag was set.
+    """
+
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    if not flags & O_DIRECT:
+        return False
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~O_DIRECT)
+    return True
+
+
+# -----------------------------------------------------------------------------
+def _write_all(fd, data):
+
+    view = memoryview(data)
+    while len(view):
+        try:
+            n = os.write(fd, view)
+        except OSError as e:
+            if e.errno == errno.EINVAL and _clear_direct(fd):
+                continue
+            raise
+        view = view[n:]
+
+
+# =============================================================================
+def aligned_buffer(size):
+    """
+    Creates a page aligned buffer filled with binary zeroes, as needed
+    for I/O with O_DIRECT, by an anonymous memory mapping.
+
+    @param size: the size of the buffer in bytes
+    @type size: int
+
+    @return: the buffer and a writable memoryview on it, the memoryview
+             has to be released before closing the buffer, see
+             release_buffer()
+    @rtype: tuple of mmap.mmap and memoryview
+
+    """
+
+    buf = mmap.mmap(-1, int(size))
+    try:
+        view = memoryview(buf)
+    except TypeError:
+        # Python 2 mmap objects don't support the new buffer protocol
+        buf.close()
+        buf = None
+        view = memoryview(bytearray(int(size)))
+    return (buf, view)
+
+
+# -----------------------------------------------------------------------------
+def release_buffer(buf, view):
+    """Releases a buffer created by aligned_buffer()."""
+
+    try:
+        if hasattr(view, 'release'):
+            view.release()
+        if buf is not None:
+            buf.close()
+    except BufferError:
+        # still referenced by the traceback of an exception,
+        # the mapping is removed by the garbage collector
+        pass
+
+
+# -----------------------------------------------------------------------------
+def _copy_splice(src_fd, dst_fd, length, blocksize, callback):
+
+    (pipe_r, pipe_w) = os.pipe()
+    try:
+        try:
+            fcntl.fcntl(pipe_w, F_SETPIPE_SZ, blocksize)
+        except (IOError, OSError):
+            pass
+
+        copied = 0
+        while True:
+            want = _want(length, copied, blocksize)
+            if want <= 0:
+                break
+            try:
+                n = splice(src_fd, pipe_w, want, SPLICE_F_MOVE | SPLICE_F_MORE)
+            except OSError as e:
+                if e.errno in UNSUPPORTED_ERRNOS:
+                    raise EngineUnsupportedError('splice', copied, e)
+                raise
+            if not n:
+                break
+
+            in_pipe = n
+            while in_pipe:
+                try:
+                    m = splice(pipe_r, dst_fd, in_pipe, SPLICE_F_MOVE)
+                except OSError as e:
+                    if e.errno not in UNSUPPORTED_ERRNOS:
+                        raise
+                    # drain the pipe the conventional way before giving up
+                    while in_pipe:
+                        data = os.read(pipe_r, in_pipe)
+                        _write_all(dst_fd, data)
+                        in_pipe -= len(data)
+                    copied += n
+                    if callback:
+                        callback(n)
+                    raise EngineUnsupportedError('splice', copied, e)
+                in_pipe -= m
+
+            copied += n
+            if callback:
+                callback(n)
+    finally:
+        os.close(pipe_r)
+        os.close(pipe_w)
+
+    return copied
+
+
+# -----------------------------------------------------------------------------
+def _copy_readinto(src_fd, dst_fd, length, blocksize, callback, buf=None, data_callback=None):
+
+    if buf is None or len(buf) < blocksize:
+        buf = bytearray(blocksize)
+    view = memoryview(buf)
+    src = io.FileIO(src_fd, 'rb', closefd=False)
+
+    copied = 0
+    while True:
+        want = _want(length, copied, blocksize)
+        if want <= 0:
+            break
+        try:
+            n = src.readinto(view[:want])
+        except (IOError, OSError) as e:
+            if e.errno == errno.EINVAL and _clear_direct(src_fd):
+                continue
+            raise
+        if not n:
+            break
+        if data_callback:
+            data_callback(view[:n])
+        _write_all(dst_fd, view[:n])
+        copied += n
+        if callback:
+            callback(n)
+
+    return copied
+
+
+# =============================================================================
+def copy_fd(
+        src_fd, dst_fd, length=None, blocksize=DEFAULT_BLOCKSIZE,
+        engine='auto', callback=None, buf=None, data_callback=None):
+    """
+    Copies data from the current file offset of src_fd to the current file
+    offset of dst_fd. Both offsets are moved by the number of copied bytes.
+
+    With the engine 'auto' the copy engines are tried in the order of
+    ENGINES, an engine not usable for the given file descriptors is left
+    for the next one, also in the middle of the copying.
+
+    @raise ValueError: on an invalid engine name
+    @raise OSError: on an error during copying
+
+    @param src_fd: the file descriptor to read from
+    @type src_fd: int
+    @param dst_fd: the file descriptor to write to
+    @type dst_fd: int
+    @param length: the number of bytes to copy, None means until the end
+                   of the source
+    @type length: int or None
+    @param blocksize: the maximum number of bytes copied by one system call
+    @type blocksize: int
+    @param engine: the copy engine to use first, one of ENGINES or 'auto'
+    @type engine: str
+    @param callback: a function called with the number of bytes after each
+                     copied chunk of data
+    @type callback: callable or None
+    @param buf: a buffer to reuse for the engine 'readinto'
+    @type buf: bytearray or None
+    @param data_callback: a function called with a memoryview of every
+                          copied chunk of data (e.g. the update() method
+                          of a checksum object), because the data are needed
+                          in user space, only the engine 'readinto' is used
+    @type data_callback: callable or None
+
+    @return: the number of copied bytes and the name of the last used engine
+    @rtype: tuple of int and str
+
+    """
+
+    if engine is None:
+        engine = 'auto'
+    if engine != 'auto' and engine not in ENGINES:
+        raise ValueError(_("Invalid copy engine %r.") % (engine))
+
+    blocksize = int(blocksize)
+    if blocksize <= 0:
+        raise ValueError(_("Invalid blocksize %r.") % (blocksize))
+
+    avail = available_engines()
+    if data_callback is not None:
+        engines = ['readinto']
+    elif engine == 'auto':
+        engines = avail
+    else:
+        engines = [x for x in avail if ENGINES.index(x) >= ENGINES.index(engine)]
+
+    funcs = {
+        'copy_file_range': _copy_copy_file_range,
+        'sendfile': _copy_sendfile,
+        'splice': _copy_splice,
+    }
+
+    copied = 0
+    for name in engines:
+        rest = None
+        if length is not None:
+            rest = length - copied
+        if name == 'readinto':
+            copied += _copy_readinto(
+                src_fd, dst_fd, rest, blocksize, callback, buf, data_callback)
+            return (copied, name)
+        try:
+            copied += funcs[name](src_fd, dst_fd, rest, blocksize, callback)
+            return (copied, name)
+        except EngineUnsupportedError as e:
+            copied += e.copied
+            log.debug(str(e))
+
+    return (copied, 'readinto')
+
+
+# =============================================================================
+def fd_size(fd):
+    """
+    Gives back the size of a regular file or a block device in bytes.
+
+    @raise OSError: if the size could not be evaluated
+
+    @param fd: the file descriptor
+    @type fd: int
+
+    @return: the size in bytes
+    @rtype: int
+
+    """
+
+    st = os.fstat(fd)
+    if stat.S_ISREG(st.st_mode):
+        return st.st_size
+    cur = os.lseek(fd, 0, os.SEEK_CUR)
+    try:
+        return os.lseek(fd, 0, os.SEEK_END)
+    finally:
+        os.lseek(fd, cur, os.SEEK_SET)
+
+
+# =============================================================================
+def data_extents(fd, start=0, end=None):
+    """
+    A generator for the ranges of the given file containing data, all other
+    ranges are holes. It uses lseek() with SEEK_DATA and SEEK_HOLE, if the
+    filesystem doesn't support it, the complete range is given back as
+    one data extent.
+
+    The file offset of fd is undefined after using this generator.
+
+    @param fd: the file descriptor of the file
+    @type fd: int
+    @param start: the offset to start the search at
+    @type start: int
+    @param end: the offset to stop the search at, defaults to the size
+                of the file
+    @type end: int or None
+
+    @return: tuples of the offset and the length of every data extent
+    @rtype: iterator of tuples of two int
+
+    """
+
+    if end is None:
+        end = fd_size(fd)
+
+    offset = start
+    while offset < end:
+        try:
+            data_start = os.lseek(fd, offset, SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # no more data behind offset
+                return
+            if e.errno in UNSUPPORTED_ERRNOS:
+                yield (offset, end - offset)
+                return
+            raise
+        if data_start >= end:
+            return
+        try:
+            hole_start = os.lseek(fd, data_start, SEEK_HOLE)
+        except OSError as e:
+            if e.errno in UNSUPPORTED_ERRNOS:
+                hole_start = end
+            else:
+                raise
+        hole_start = min(hole_start, end)
+        yield (data_start, hole_start - data_start)
+        offset = hole_start
+
+
+# =============================================================================
+def punch_hole(fd, offset, length, blocksize=DEFAULT_BLOCKSIZE):
+    """
+    Deallocates the given range of the file or block device, so reading it
+    gives back binary zeroes. If punching holes is not supported, binary
+    zeroes are written instead.
+
+    The file offset of fd is undefined afterwards.
+
+    @raise OSError: on an error writing the zeroes
+
+    @param fd: the file descriptor
+    @type fd: int
+    @param offset: the start of the range in bytes
+    @type offset: int
+    @param length: the length of the range in bytes
+    @type length: int
+    @param blocksize: the size of the buffer for writing zeroes
+    @type blocksize: int
+
+    @return: True, if a hole was punched, False, if zeroes were written
+    @rtype: bool
+
+    """
+
+    if length <= 0:
+        return True
+
+    try:
+        fallocate(fd, FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE, offset, length)
+        return True
+    except (OSError, AttributeError) as e:
+        log.debug(_("Could not punch a hole, writing zeroes: %s"), e)
+
+    zeroes = bytearray(min(blocksize, length))
+    os.lseek(fd, offset, os.SEEK_SET)
+    while length > 0:
+        chunk = min(len(zeroes), length)
+        _write_all(fd, memoryview(zeroes)[:chunk])
+        length -= chunk
+    return False
+
+
+# =============================================================================
+def blkdev_range_ioctl(fd, request, offset, length):
+    """
+    Executes an ioctl on a block device with a byte range as argument,
+    like BLKZEROOUT or BLKDISCARD. Offset and length must be aligned
+    to the logical sector size of the device.
+
+    @raise IOError: if the ioctl fails
+
+    @param fd: the file descriptor of the block device
+    @type fd: int
+    @param request: the ioctl request number
+    @type request: int
+    @param offset: the start of the range in bytes
+    @type offset: int
+    @param length: the length of the range in bytes
+    @type length: int
+
+    @return: None
+
+    """
+
+    fcntl.ioctl(fd, request, struct.pack('QQ', int(offset), int(length)))
+
+
+# -----------------------------------------------------------------------------
+def _zero_by_mode(fd, mode, offset, length, is_file):
+
+    if mode == 'zeroout':
+        if is_file:
+            raise EngineUnsupportedError(mode, 0, _("not a block device"))
+        blkdev_range_ioctl(fd, BLKZEROOUT, offset, length)
+    elif mode == 'discard':
+        if is_file:
+            raise EngineUnsupportedError(mode, 0, _("not a block device"))
+        blkdev_range_ioctl(fd, BLKDISCARD, offset, length)
+    elif mode == 'zero_range':
+        fallocate(fd, FALLOC_FL_ZERO_RANGE, offset, length)
+    elif mode == 'punch':
+        fallocate(fd, FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE, offset, length)
+        if is_file and os.fstat(fd).st_size < offset + length:
+            os.ftruncate(fd, offset + length)
+
+
+# -----------------------------------------------------------------------------
+def _zero_by_write(fd, offset, length, blocksize, callback):
+
+    bufsize = max(int(blocksize), DEFAULT_WIPE_BUFSIZE)
+    if length is not None:
+        bufsize = max(min(bufsize, length), 1)
+
+    (buf, view) = aligned_buffer(bufsize)
+
+    os.lseek(fd, offset, os.SEEK_SET)
+    written = 0
+    try:
+        while length is None or written < length:
+            chunk = bufsize
+            if length is not None:
+                chunk = min(bufsize, length - written)
+            try:
+                n = os.write(fd, view[:chunk])
+            except OSError as e:
+                if e.errno == errno.EINVAL and _clear_direct(fd):
+                    continue
+                raise
+            written += n
+            if callback:
+                callback(n)
+    finally:
+        release_buffer(buf, view)
+
+    return written
+
+
+# =============================================================================
+def zero_fd(
+        fd, offset=0, length=None, mode='auto', blocksize=DEFAULT_BLOCKSIZE,
+        callback=None, chunksize=None):
+    """
+    Fills the given range of a file or block device with binary zeroes.
+
+    The mode 'auto' tries on block devices the ioctl BLKZEROOUT and then
+    fallocate(FALLOC_FL_ZERO_RANGE), on regular files fallocate() with
+    FALLOC_FL_ZERO_RANGE and then FALLOC_FL_PUNCH_HOLE. If nothing
+    of them is applicable, or if no length is given, the zeroes are written
+    from one reused page aligned buffer.
+
+    @raise ValueError: on an invalid mode
+    @raise OSError: on an error writing the zeroes, e.g. ENOSPC, if length
+                    is None and the end of the device was reached
+
+    @param fd: the file descriptor opened for writing
+    @type fd: int
+    @param offset: the start of the range in bytes
+    @type offset: int
+    @param length: the length of the range in bytes, None means writing
+                   until the device or filesystem is full
+    @type length: int or None
+    @param mode: the wipe mode, one of WIPE_MODES or 'auto'
+    @type mode: str
+    @param blocksize: the minimum size of the buffer for writing zeroes
+    @type blocksize: int
+    @param callback: a function called with the number of bytes after each
+                     zeroed chunk
+    @type callback: callable or None
+    @param chunksize: the maximum size of a range zeroed by the kernel at
+                      once, to get regular callbacks (e.g. for throttling),
+                      None means the complete range at once
+    @type chunksize: int or None
+
+    @return: the number of zeroed bytes and the name of the used mode
+    @rtype: tuple of int and str
+
+    """
+
+    if mode is None:
+        mode = 'auto'
+    if mode != 'auto' and mode not in WIPE_MODES:
+        raise ValueError(_("Invalid wipe mode %r.") % (mode))
+
+    if length is not None and length <= 0:
+        return (0, mode)
+
+    fd_mode = os.fstat(fd).st_mode
+    is_file = stat.S_ISREG(fd_mode)
+    is_blockdev = stat.S_ISBLK(fd_mode)
+
+    modes = []
+    if length is not None and (is_file or is_blockdev):
+        if mode == 'auto':
+            if is_blockdev:
+                modes = ['zeroout', 'zero_range']
+            else:
+                modes = ['zero_range', 'punch']
+        elif mode != 'write':
+            modes = [mode]
+
+    for cur_mode in modes:
+        done = 0
+        try:
+            while done < length:
+                chunk = length - done
+                if chunksize:
+                    chunk = min(chunk, int(chunksize))
+                _zero_by_mode(fd, cur_mode, offset + done, chunk, is_file)
+                done += chunk
+                if callback:
+                    callback(chunk)
+        except EngineUnsupportedError as e:
+            log.debug(str(e))
+            continue
+        except (IOError, OSError, AttributeError) as e:
+            log.debug(_("Wipe mode %(m)r not usable: %(e)s") % {'m': cur_mode, 'e': e})
+            if not done:
+                continue
+            # write the rest conventionally
+            rest = _zero_by_write(fd, offset + done, length - done, blocksize, callback)
+            return (done + rest, 'write')
+        os.lseek(fd, offset + length, os.SEEK_SET)
+        return (length, cur_mode)
+
+    return (_zero_by_write(fd, offset, length, blocksize, callback), 'write')
+
+
+# =============================================================================
+def parallel_copy_possible(src_fd, dst_fd):
+    """
+    Gives back, whether the data between the given file descriptors could
+    be copied by parallel_copy(), that means, the Python interpreter
+    has os.pread() and os.pwrite() and both are regular files or
+    block devices.
+    """
+
+    if not hasattr(os, 'pread') or not hasattr(os, 'pwrite'):
+        return False
+    for fd in (src_fd, dst_fd):
+        mode = os.fstat(fd).st_mode
+        if not stat.S_ISREG(mode) and not stat.S_ISBLK(mode):
+            return False
+    return True
+
+
+# -----------------------------------------------------------------------------
+def _pread_into(fd, view, offset):
+
+    while True:
+        try:
+            if hasattr(os, 'preadv'):
+                return os.preadv(fd, [view], offset)
+            data = os.pread(fd, len(view), offset)
+            view[:len(data)] = data
+            return len(data)
+        except OSError as e:
+            if e.errno == errno.EINVAL and _clear_direct(fd):
+                continue
+            raise
+
+
+# -----------------------------------------------------------------------------
+def _pwrite_all(fd, view, offset):
+
+    while len(view):
+        try:
+            n = os.pwrite(fd, view, offset)
+        except OSError as e:
+            if e.errno == errno.EINVAL and _clear_direct(fd):
+                continue
+            raise
+        view = view[n:]
+        offset += n
+
+
+# -----------------------------------------------------------------------------
+def _copy_window(src_fd, dst_fd, src_offset, dst_offset, length, blocksize, stop, callback):
+
+    (buf, view) = aligned_buffer(blocksize)
+    copied = 0
+    try:
+        while copied < length and not stop.is_set():
+            want = min(blocksize, length - copied)
+            n = _pread_into(src_fd, view[:want], src_offset + copied)
+            if not n:
+                break
+            _pwrite_all(dst_fd, view[:n], dst_offset + copied)
+            copied += n
+            if callback:
+                callback(n)
+    finally:
+        release_buffer(buf, view)
+    return copied
+
+
+# =============================================================================
+def parallel_copy(
+        src_fd, dst_fd, src_offset, dst_offset, length, streams=4,
+        blocksize=DEFAULT_BLOCKSIZE, sparse=False, callback=None):
+    """
+    Copies the given range by splitting it into some windows of equal size,
+    which are copied at the same time by os.pread() and os.pwrite() in
+    separate threads, to make use of devices with deep queues.
+    The file offsets of the file descriptors are not used and not changed.
+
+    @raise OSError: the first error, which occurred in one of the threads,
+                    all other threads are stopped in this case
+
+    @param src_fd: the file descriptor to read from
+    @type src_fd: int
+    @param dst_fd: the file descriptor to write to
+    @type dst_fd: int
+    @param src_offset: the start of the range in the source
+    @type src_offset: int
+    @param dst_offset: the start of the range in the target
+    @type dst_offset: int
+    @param length: the length of the range in bytes
+    @type length: int
+    @param streams: the number of parallel threads
+    @type streams: int
+    @param blocksize: the size of one read and write per thread
+    @type blocksize: int
+    @param sparse: copy only the data extents of the source windows, the
+                   holes are punched in target block devices
+    @type sparse: bool
+    @param callback: a function called with the number of bytes after each
+                     copied block, the calls are serialized
+    @type callback: callable or None
+
+    @return: the number of copied bytes
+    @rtype: int
+
+    """
+
+    blocksize = int(blocksize)
+    streams = max(int(streams), 1)
+    if length <= 0:
+        return 0
+
+    window = -(-length // streams)
+    window = -(-window // blocksize) * blocksize
+
+    lock = threading.Lock()
+    stop = threading.Event()
+    errors = []
+    totals = []
+    dst_is_file = stat.S_ISREG(os.fstat(dst_fd).st_mode)
+
+    def locked_callback(nbytes):
+        with lock:
+            callback(nbytes)
+
+    cb = None
+    if callback:
+        cb = locked_callback
+
+    def worker(start, end):
+        copied = 0
+        try:
+            if sparse:
+                pos = start
+                for (offset, ext_len) in data_extents(src_fd, start, end):
+                    if offset > pos and not dst_is_file:
+                        punch_hole(dst_fd, dst_offset + pos - src_offset, offset - pos, blocksize)
+                    copied += _copy_window(
+                        src_fd, dst_fd, offset, dst_offset + offset - src_offset,
+                        ext_len, blocksize, stop, cb)
+                    pos = offset + ext_len
+                if end > pos and not dst_is_file:
+                    punch_hole(dst_fd, dst_offset + pos - src_offset, end - pos, blocksize)
+            else:
+                copied = _copy_window(
+                    src_fd, dst_fd, start, dst_offset + start - src_offset,
+                    end - start, blocksize, stop, cb)
+        except Exception as e:
+            with lock:
+                errors.append(e)
+            stop.set()
+        with lock:
+            totals.append(copied)
+
+    threads = []
+    start = src_offset
+    end_all = src_offset + length
+    while start < end_all:
+        end = min(start + window, end_all)
+        thread = threading.Thread(target=worker, args=(start, end))
+        thread.daemon = True
+        threads.append(thread)
+        start = end
+
+    log.debug(_("Copying %(len)d Bytes in %(nr)d parallel streams.") % {
+        'len': length, 'nr': len(threads)})
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+
+    return sum(totals)
+
+
+# =============================================================================
+def update_zeroes(hasher, length, bufsize=DEFAULT_BLOCKSIZE):
+    """
+    Adds the given number of binary zeroes to a checksum object, e.g. for
+    the holes skipped during a sparse copy.
+
+    @param hasher: the checksum object with an update() method
+    @type hasher: object
+    @param length: the number of zeroes
+    @type length: int
+    @param bufsize: the maximum number of zeroes given at once
+    @type bufsize: int
+
+    """
+
+    if length <= 0:
+        return
+    zeroes = memoryview(bytearray(min(int(bufsize), length)))
+    while length > 0:
+        chunk = min(len(zeroes), length)
+        hasher.update(zeroes[:chunk])
+        length -= chunk
+
+
+# =============================================================================
+def checksum_fd(fd, hasher, offset=0, length=None, blocksize=DEFAULT_BLOCKSIZE):
+    """
+    Reads the given range of a file descriptor into a checksum object.
+
+    @raise OSError: on a read error
+
+    @param fd: the file descriptor to read from
+    @type fd: int
+    @param hasher: the checksum object with an update() method
+    @type hasher: object
+    @param offset: the start of the range
+    @type offset: int
+    @param length: the length of the range, None means up to the end
+    @type length: int or None
+    @param blocksize: the size of a single read
+    @type blocksize: int
+
+    @return: the number of bytes read
+    @rtype: int
+
+    """
+
+    (buf, view) = aligned_buffer(blocksize)
+    src = io.FileIO(fd, 'rb', closefd=False)
+    os.lseek(fd, offset, os.SEEK_SET)
+    done = 0
+    try:
+        while True:
+            want = _want(length, done, blocksize)
+            if want <= 0:
+                break
+            n = src.readinto(view[:want])
+            if not n:
+                break
+            hasher.update(view[:n])
+            done += n
+    finally:
+        release_buffer(buf, view)
+    return done
+
+
+# =============================================================================
+class CacheControl(object):
+    """
+    Controls the page cache usage and the durability of a bulk copy. It is
+    used as a callback with the number of the copied bytes and executes
+    periodically fdatasync() on the target and, with the policy 'dontneed',
+    posix_fadvise(POSIX_FADV_DONTNEED) on source and target afterwards,
+    to keep the page cache free for other processes::
+
+        cache_ctrl = CacheControl(src_fd, dst_fd, 'dontneed', 256 * 1024 * 1024)
+        cache_ctrl.start()
+        copy_fd(src_fd, dst_fd, callback=cache_ctrl)
+        cache_ctrl.finish()
+
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self, src_fd, dst_fd, policy=None, sync_interval=None, callback=None):
+        """
+        @raise ValueError: on an invalid policy
+
+        @param src_fd: the file descriptor of the source, may be None
+        @type src_fd: int or None
+        @param dst_fd: the file descriptor of the target
+        @type dst_fd: int
+        @param policy: the page cache policy, one of CACHE_POLICIES or None
+        @type policy: str or None
+        @param sync_interval: the number of bytes after which fdatasync()
+                              is executed on the target, None means no
+                              periodic synchronisation
+        @type sync_interval: int or None
+        @param callback: a further function to call with the number of bytes
+        @type callback: callable or None
+
+        """
+
+        if policy is not None and policy not in CACHE_POLICIES:
+            raise ValueError(_("Invalid page cache policy %r.") % (policy))
+
+        self.src_fd = src_fd
+        self.dst_fd = dst_fd
+        self.policy = policy
+        self.callback = callback
+
+        self.interval = None
+        if sync_interval:
+            self.interval = int(sync_interval)
+        elif policy == 'dontneed':
+            self.interval = DEFAULT_DONTNEED_INTERVAL
+
+        self.pending = 0
+        self.syncs = 0
+
+    # -------------------------------------------------------------------------
+    def _fadvise(self, fd, advice_name):
+
+        advice = getattr(os, advice_name, None)
+        if fd is None or advice is None or not hasattr(os, 'posix_fadvise'):
+            return
+        try:
+            os.posix_fadvise(fd, 0, 0, advice)
+        except OSError as e:
+            log.debug(_("posix_fadvise(%(a)s) failed: %(e)s") % {'a': advice_name, 'e': e})
+
+    # -------------------------------------------------------------------------
+    def start(self):
+        """Announces the sequential access before starting the copy."""
+
+        if self.policy is not None:
+            self._fadvise(self.src_fd, 'POSIX_FADV_SEQUENTIAL')
+
+    # -------------------------------------------------------------------------
+    def __call__(self, nbytes):
+
+        if self.callback:
+            self.callback(nbytes)
+        if not self.interval:
+            return
+        self.pending += nbytes
+        if self.pending >= self.interval:
+            self.sync()
+
+    # -------------------------------------------------------------------------
+    def sync(self):
+        """Flushes the target and drops the cached pages, if requested."""
+
+        if hasattr(os, 'fdatasync'):
+            os.fdatasync(self.dst_fd)
+        else:
+            os.fsync(self.dst_fd)
+        self.syncs += 1
+        self.pending = 0
+        if self.policy == 'dontneed':
+            self._fadvise(self.src_fd, 'POSIX_FADV_DONTNEED')
+            self._fadvise(self.dst_fd, 'POSIX_FADV_DONTNEED')
+
+    # -------------------------------------------------------------------------
+    def finish(self):
+        """Executes the last synchronisation after the copy."""
+
+        if self.interval:
+            self.sync()
+
+
+# =============================================================================
+class ProgressMeter(object):
+    """
+    Measures the progress of a bulk copy. It is used as a callback with the
+    number of copied bytes and calls the given progress callback at most
+    once per interval (and at the end) with a dictionary containing:
+
+        - 'bytes': the number of bytes done
+        - 'total': the total number of bytes, if known, else None
+        - 'elapsed': the elapsed time in seconds
+        - 'rate': the current transfer rate in bytes per second
+        - 'eta': the estimated remaining time in seconds, if known, else None
+        - 'finished': whether the copy is finished
+
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self, total=None, callback=None, interval=1.0, start=0):
+        """
+        @param total: the total number of bytes to copy
+        @type total: int or None
+        @param callback: the function to call with the progress dictionary
+        @type callback: callable or None
+        @param interval: the minimum time between two calls in seconds
+        @type interval: float
+        @param start: the number of bytes already done, e.g. on resuming
+        @type start: int
+
+        """
+
+        self.total = total
+        self.callback = callback
+        self.interval = float(interval)
+        self.done = int(start)
+        self.rate = 0.0
+
+        self._start_time = time.time()
+        self._last_time = self._start_time
+        self._last_done = self.done
+
+    # -------------------------------------------------------------------------
+    def __call__(self, nbytes):
+
+        self.done += nbytes
+        now = time.time()
+        if now - self._last_time >= self.interval:
+            self._update_rate(now)
+            self.report()
+
+    # -------------------------------------------------------------------------
+    def _update_rate(self, now):
+
+        period = now - self._last_time
+        if period <= 0:
+            return
+        cur_rate = (self.done - self._last_done) / period
+        if self.rate:
+            # exponentially smoothed, to damp short stalls and bursts
+            self.rate = 0.7 * self.rate + 0.3 * cur_rate
+        else:
+            self.rate = cur_rate
+        self._last_time = now
+        self._last_done = self.done
+
+    # -------------------------------------------------------------------------
+    def as_dict(self, finished=False):
+        """Gives back the current progress as a dictionary."""
+
+        eta = None
+        if finished:
+            eta = 0.0
+        elif self.total is not None and self.rate > 0:
+            eta = max(self.total - self.done, 0) / self.rate
+
+        return {
+            'bytes': self.done,
+            'total': self.total,
+            'elapsed': time.time() - self._start_time,
+            'rate': self.rate,
+            'eta': eta,
+            'finished': finished,
+        }
+
+    # -------------------------------------------------------------------------
+    def report(self, finished=False):
+        """Calls the progress callback with the current progress."""
+
+        if self.callback:
+            self.callback(self.as_dict(finished))
+
+    # -------------------------------------------------------------------------
+    def finish(self):
+        """Reports the end of the copy."""
+
+        self._update_rate(time.time())
+        self.report(finished=True)
+
+
+# =============================================================================
+class CopyCheckpoint(object):
+    """
+    Writes periodically a checkpoint record of a sequential copy into a
+    JSON file, to make it possible to resume an interrupted copy. Before
+    writing a record the target is synchronized, so the recorded offset
+    is always durable.
+
+    The record contains the given describing information (source, target
+    a.s.o.), the offset relative to the start of the copied range, the
+    name of the checksum algorithm and the hexadecimal digest of the data
+    up to the offset.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self, filename, dst_fd, info, interval=None, hasher=None, checksum=None):
+        """
+        @param filename: the name of the checkpoint file
+        @type filename: str
+        @param dst_fd: the file descriptor of the target
+        @type dst_fd: int
+        @param info: the information identifying the copy
+        @type info: dict
+        @param interval: the number of bytes between two checkpoints
+        @type interval: int or None
+        @param hasher: the checksum object of the copied data, if any
+        @type hasher: object or None
+        @param checksum: the name of the checksum algorithm
+        @type checksum: str or None
+
+        """
+
+        self.filename = filename
+        self.dst_fd = dst_fd
+        self.info = dict(info)
+        self.interval = int(interval or DEFAULT_CHECKPOINT_INTERVAL)
+        self.hasher = hasher
+        self.checksum = checksum
+        self.offset = 0
+        self.pending = 0
+        self.saved = 0
+
+    # -------------------------------------------------------------------------
+    def __call__(self, nbytes):
+
+        self.pending += nbytes
+        if self.pending >= self.interval:
+            self.save()
+
+    # -------------------------------------------------------------------------
+    def save(self):
+        """Synchronizes the target and writes the checkpoint record."""
+
+        if hasattr(os, 'fdatasync'):
+            os.fdatasync(self.dst_fd)
+        else:
+            os.fsync(self.dst_fd)
+
+        record = dict(self.info)
+        record['offset'] = self.offset
+        record['checksum'] = self.checksum
+        record['partial_digest'] = None
+        if self.hasher is not None:
+            record['partial_digest'] = self.hasher.copy().hexdigest()
+        record['time'] = time.time()
+
+        tmp_name = self.filename + '.tmp'
+        fd = os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            _write_all(fd, json.dumps(record, sort_keys=True).encode('utf-8'))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.rename(tmp_name, self.filename)
+
+        self.pending = 0
+        self.saved += 1
+        log.debug(_("Checkpoint at offset %(off)d written to %(fn)r.") % {
+            'off': self.offset, 'fn': self.filename})
+
+    # -------------------------------------------------------------------------
+    def remove(self):
+        """Removes the checkpoint file after a successful copy."""
+
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def load(filename):
+        """
+        Reads a checkpoint record.
+
+        @param filename: the name of the checkpoint file
+        @type filename: str
+
+        @return: the checkpoint record or None, if there is no valid one
+        @rtype: dict or None
+
+        """
+
+        if not os.path.exists(filename):
+            return None
+        try:
+            with open(filename, 'rb') as fh:
+                record = json.loads(fh.read().decode('utf-8'))
+        except (IOError, OSError, ValueError) as e:
+            log.warning(_("Could not read checkpoint file %(fn)r: %(e)s") % {
+                'fn': filename, 'e': e})
+            return None
+        if not isinstance(record, dict) or 'offset' not in record:
+            return None
+        return record
+
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -9,8 +9,11 @@
 from functools import reduce
 
 # Standard modules
+import hashlib
 
-__version__ = '0.2.1'
+import six
+
+__version__ = '0.3.0'
 
 # -----------------------------------------------------------------------------
 # Module variables
@@ -22,6 +25,9 @@ CRCTableh = [0] * 256
 CRCTablel = [0] * 256
 crc64_initialised = False
 
+# the combined 64 bit table for Crc64, will initialised on first usage
+CRCTable64 = []
+
 
 # =============================================================================
 def crc64(aString):
@@ -38,29 +44,12 @@ def crc64(aString):
 
     """
 
-    global crc64_initialised
     crcl = 0
     crch = 0
 
     # init module variables, if necessary
     if not crc64_initialised:
-
-        for i in range(256):
-            partl = i
-            parth = 0
-
-            for j in range(8):
-                rflag = partl & 1
-                partl >>= 1
-                if (parth & 1):
-                    partl |= (1 << 31)
-                parth >>= 1
-                if rflag:
-                    parth ^= POLY64REVh
-            CRCTableh[i] = parth
-            CRCTablel[i] = partl
-
-        crc64_initialised = True
+        _init_crc64_tables()
 
     # compute the checksum
     for item in aString:
@@ -76,6 +65,125 @@ def crc64(aString):
     return (crch, crcl)
 
 
+# =============================================================================
+class Crc64(object):
+    """
+    An incremental CRC64 checksum with the same result as crc64() and an
+    interface like the hash objects of hashlib, so it can be used for data,
+    which are not in memory at once::
+
+        crc = Crc64()
+        for chunk in chunks:
+            crc.update(chunk)
+        digest = crc.hexdigest()
+
+    Binary data (bytes, bytearray, memoryview) are checksummed byte by byte,
+    text strings character by character like in crc64().
+
+    Because it's computed in pure Python, it's slow in comparison to the
+    algorithms of hashlib.
+    """
+
+    name = 'crc64'
+    digest_size = 8
+
+    # -------------------------------------------------------------------------
+    def __init__(self, data=None):
+
+        if not CRCTable64:
+            _init_crc64_tables()
+        self._crc = 0
+        if data is not None:
+            self.update(data)
+
+    # -------------------------------------------------------------------------
+    def update(self, data):
+        """Adds the given data to the checksum."""
+
+        crc = self._crc
+        table = CRCTable64
+        if isinstance(data, six.text_type) or (six.PY2 and isinstance(data, str)):
+            for item in data:
+                crc = table[(crc ^ ord(item)) & 0xFF] ^ (crc >> 8)
+        else:
+            for item in bytearray(data):
+                crc = table[(crc ^ item) & 0xFF] ^ (crc >> 8)
+        self._crc = crc
+
+    # -------------------------------------------------------------------------
+    @property
+    def value(self):
+        """The high and the low part of the 64bit checksum."""
+        return (self._crc >> 32, self._crc & 0xFFFFFFFF)
+
+    # -------------------------------------------------------------------------
+    def copy(self):
+        """Gives back a copy of the current checksum object."""
+
+        other = Crc64()
+        other._crc = self._crc
+        return other
+
+    # -------------------------------------------------------------------------
+    def digest(self):
+        """Gives back the checksum as 8 bytes in big endian order."""
+
+        return bytes(bytearray((self._crc >> (8 * i)) & 0xFF for i in range(7, -1, -1)))
+
+    # -------------------------------------------------------------------------
+    def hexdigest(self):
+        """Gives back the checksum like crc64_digest()."""
+
+        return "%08x%08x" % self.value
+
+
+# -----------------------------------------------------------------------------
+def _init_crc64_tables():
+
+    global crc64_initialised
+
+    for i in range(256):
+        partl = i
+        parth = 0
+
+        for j in range(8):
+            rflag = partl & 1
+            partl >>= 1
+            if (parth & 1):
+                partl |= (1 << 31)
+            parth >>= 1
+            if rflag:
+                parth ^= POLY64REVh
+        CRCTableh[i] = parth
+        CRCTablel[i] = partl
+
+    del CRCTable64[:]
+    CRCTable64.extend([(CRCTableh[i] << 32) | CRCTablel[i] for i in range(256)])
+    crc64_initialised = True
+
+
+# =============================================================================
+def new_hash(name):
+    """
+    Creates a new checksum object with the methods update() and hexdigest()
+    for the given algorithm name, 'crc64' gives a Crc64 object, all other
+    names are given to hashlib.new().
+
+    @raise ValueError: on an unknown algorithm
+
+    @param name: the name of the algorithm, e.g. 'crc64', 'md5', 'sha256'
+    @type name: str
+
+    @return: the checksum object
+    @rtype: Crc64 or a hashlib object
+
+    """
+
+    if name.lower() == 'crc64':
+        return Crc64()
+    return hashlib.new(name)
+
+
 # =============================================================================
 def crc64_digest(aString):
     """
@@ -27,9 +27,11 @@ from pb_logging.syslog_handler import PbSysLogHandler
 from pb_base.pidfile_app import PidfileAppError
 from pb_base.pidfile_app import PidfileApp
 
+from pb_base.throttle import IoThrottle
+
 from pb_base.translate import pb_gettext, pb_ngettext
 
-__version__ = '0.4.3'
+__version__ = '0.4.4'
 
 log = logging.getLogger(__name__)
 
@@ -189,6 +191,19 @@ class PbDaemon(PidfileApp):
         @type: bool
         '''
 
+        self._throttle = IoThrottle()
+        '''
+        @ivar: the I/O limits for bulk data operations of the daemon,
+               reloaded from the throttle file on signal USR1
+        @type: IoThrottle
+        '''
+
+        self._throttle_file = None
+        '''
+        @ivar: the file with the I/O limits (bytes_per_sec and iops)
+        @type: str
+        '''
+
         super(PbDaemon, self).__init__(
             appname=appname,
             pidfile=pidfile,
@@ -263,6 +278,48 @@ class PbDaemon(PidfileApp):
         """The logfile for stderr substitute in daemon mode."""
         return self._error_log
 
+    # -------------------------------------------------------------------------
+    @property
+    def throttle(self):
+        """
+        The I/O limits for bulk data operations of the daemon, to give
+        to PbBaseHandler.dump_data() or dump_zeroes().
+        """
+        return self._throttle
+
+    # -------------------------------------------------------------------------
+    @property
+    def throttle_file(self):
+        """The file with the I/O limits, reloaded on signal USR1."""
+        return self._throttle_file
+
+    # -------------------------------------------------------------------------
+    def reload_throttle(self):
+        """
+        Reloads the I/O limits from the throttle file, if there is one,
+        the new limits are taking effect immediately also for running
+        bulk data operations.
+
+        @return: success of reloading
+        @rtype: bool
+        """
+
+        if not self.throttle_file:
+            return False
+
+        try:
+            self.throttle.load_limits(self.throttle_file)
+        except (IOError, OSError, ValueError) as e:
+            msg = _("Could not reload I/O limits from %(file)r: %(err)s") % {
+                'file': self.throttle_file, 'err': e}
+            self.handle_error(msg, e.__class__.__name__)
+            return False
+
+        log.info(_("Reloaded I/O limits from %(file)r: %(bw)s Bytes/s, %(iops)s IOPS.") % {
+            'file': self.throttle_file, 'bw': self.throttle.bytes_per_sec,
+            'iops': self.throttle.iops})
+        return True
+
     # -------------------------------------------------------------------------
     def as_dict(self, short=False):
         """
@@ -282,6 +339,8 @@ class PbDaemon(PidfileApp):
         res['is_daemon'] = self.is_daemon
         res['forced_shutdown'] = self.forced_shutdown
         res['error_log'] = self.error_log
+        res['throttle'] = self.throttle.as_dict()
+        res['throttle_file'] = self.throttle_file
 
         return res
 
@@ -336,6 +395,15 @@ class PbDaemon(PidfileApp):
                 'The logfile for stderr substitute in daemon mode (' +
                 'absolute or relative to base_dir).')
 
+        if 'throttle_file' not in self.cfg_spec['general']:
+            self.cfg_spec['general']['throttle_file'] = "string(default = '')"
+            self.cfg_spec['general'].comments['throttle_file'].append('')
+            self.cfg_spec['general'].comments['throttle_file'].append(
+                'A file with I/O limits for bulk data operations (lines ' +
+                "'bytes_per_sec = 50M' and 'iops = 200'),")
+            self.cfg_spec['general'].comments['throttle_file'].append(
+                'reloaded on signal USR1.')
+
     # -------------------------------------------------------------------------
     def perform_config(self):
         """
@@ -369,6 +437,14 @@ class PbDaemon(PidfileApp):
             if error_log:
                 self._error_log = error_log
 
+        if 'general' in self.cfg and self.cfg['general'].get('throttle_file'):
+            throttle_file = to_str_or_bust(self.cfg['general']['throttle_file'])
+            if not os.path.isabs(throttle_file):
+                throttle_file = os.path.join(self.base_dir, throttle_file)
+            self._throttle_file = throttle_file
+            if os.path.exists(throttle_file):
+                self.reload_throttle()
+
     # -------------------------------------------------------------------------
     def init_arg_parser(self):
         """
@@ -508,8 +584,13 @@ class PbDaemon(PidfileApp):
             'pid': os.getpid(), 'signal': signame}
         self.handle_info(msg, self.appname)
 
-        if (signum == signal.SIGUSR1) or (signum == signal.SIGUSR2):
-            log.info(_("Nothing to do on signal USR1 or USR2."))
+        if signum == signal.SIGUSR1:
+            if not self.reload_throttle():
+                log.info(_("Nothing to do on signal USR1."))
+            return
+
+        if signum == signal.SIGUSR2:
+            log.info(_("Nothing to do on signal USR2."))
             return
 
         # set forced shutdown, except SIGHUP
@@ -16,9 +16,14 @@ import subprocess
 import pwd
 import signal
 import errno
+import stat
 import locale
 import time
 import pipes
+import select
+import threading
+import mmap
+import tempfile
 from fcntl import fcntl, F_GETFL, F_SETFL
 
 # Third party modules
@@ -26,17 +31,38 @@ import six
 from six import reraise
 
 # Own modules
-from pb_base.common import caller_search_path, bytes2human
-from pb_base.common import to_utf8_or_bust
+from pb_base.common import caller_search_path, bytes2human, to_bytes
 
 from pb_base.errors import PbReadTimeoutError, PbWriteTimeoutError
 
+from pb_base.syscalls import ioprio_class, set_ioprio, renice_thread
+from pb_base.syscalls import syncfs
+from pb_base.syscalls import inotify_init, inotify_add_watch, inotify_rm_watch
+from pb_base.syscalls import read_inotify_events
+from pb_base.syscalls import IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE
+from pb_base.syscalls import IN_CREATE, IN_MOVED_TO, IN_MOVE_SELF, IN_DELETE_SELF
+from pb_base.syscalls import IN_Q_OVERFLOW
+
+from pb_base.copy_engine import copy_fd, fd_size, data_extents, punch_hole
+from pb_base.copy_engine import zero_fd, WIPE_MODES
+from pb_base.copy_engine import parallel_copy, parallel_copy_possible
+from pb_base.copy_engine import CacheControl, CACHE_POLICIES
+from pb_base.copy_engine import aligned_buffer, release_buffer
+from pb_base.copy_engine import O_DIRECT, DIRECT_ALIGNMENT
+from pb_base.copy_engine import update_zeroes, checksum_fd
+from pb_base.copy_engine import ProgressMeter, CopyCheckpoint
+
+from pb_base.crc import new_hash
+
+from pb_base.throttle import IoThrottle
+from pb_base.copy_engine import ENGINES as COPY_ENGINES
+
 from pb_base.object import PbBaseObjectError
 from pb_base.object import PbBaseObject
 
 from pb_base.translate import pb_gettext, pb_ngettext
 
-__version__ = '0.5.2'
+__version__ = '0.6.2'
 
 log = logging.getLogger(__name__)
 
@@ -48,6 +74,36 @@ CHOWN_CMD = os.sep + os.path.join('bin', 'chown')
 ECHO_CMD = os.sep + os.path.join('bin', 'echo')
 SUDO_CMD = os.sep + os.path.join('usr', 'bin', 'sudo')
 
+# Regular files from this size on are read through a memory mapping
+# by read_file() in binary mode
+MMAP_MIN_SIZE = 4 * 1024 * 1024
+
+# Sync policies of write_file() and write_files()
+WRITE_SYNC_POLICIES = ('none', 'data', 'full')
+
+# Permissions of files created by write_file() in atomic mode
+DEFAULT_FILE_MODE = 0o644
+
+# Seconds between the checks of a followed file without inotify
+FOLLOW_POLL_INTERVAL = 1.0
+
+# Size of a single read of a followed file
+FOLLOW_BLOCK_SIZE = 64 * 1024
+
+# Events of a followed file and of its directory
+FOLLOW_FILE_EVENTS = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVE_SELF | IN_DELETE_SELF
+FOLLOW_DIR_EVENTS = IN_CREATE | IN_MOVED_TO
+
+
+# =============================================================================
+def is_main_thread():
+    """Returns, whether the current thread is the main thread of the process."""
+
+    if hasattr(threading, 'main_thread'):
+        return threading.current_thread() is threading.main_thread()
+    # Python 2
+    return isinstance(threading.current_thread(), threading._MainThread)
+
 
 # =============================================================================
 class PbBaseHandlerError(PbBaseObjectError):
@@ -98,6 +154,151 @@ class CommandNotFoundError(PbBaseHandlerError):
         return msg
 
 
+# =============================================================================
+class CallResult(PbBaseObject):
+    """
+    Result of the execution of a OS command by PbBaseHandler.call() with
+    timing and resource usage informations of the child process.
+
+    It may be unpacked like the tuple returned by call()::
+
+        (ret, stdoutdata, stderrdata) = result
+
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(
+        self, cmd=None, retcode=None, stdout=None, stderr=None, wall_time=0.0,
+            rusage=None, appname=None, verbose=0, base_dir=None):
+        """
+        Initialisation of the CallResult object.
+
+        @param cmd: the executed command
+        @type cmd: list of str
+        @param retcode: the return value of the executed command
+        @type retcode: int
+        @param stdout: the output on STDOUT
+        @type stdout: str
+        @param stderr: the output on STDERR
+        @type stderr: str
+        @param wall_time: the elapsed real time in seconds
+        @type wall_time: float
+        @param rusage: the resource usage of the child process from os.wait4()
+        @type rusage: resource.struct_rusage or None
+
+        """
+
+        super(CallResult, self).__init__(
+            appname=appname,
+            verbose=verbose,
+            base_dir=base_dir,
+            initialized=False
+        )
+
+        self._cmd = cmd
+        self._retcode = retcode
+        self._stdout = stdout
+        self._stderr = stderr
+        self._wall_time = float(wall_time)
+
+        self._utime = None
+        self._stime = None
+        self._max_rss = None
+        if rusage is not None:
+            self._utime = rusage.ru_utime
+            self._stime = rusage.ru_stime
+            self._max_rss = rusage.ru_maxrss
+
+        self.initialized = True
+
+    # -----------------------------------------------------------
+    @property
+    def cmd(self):
+        """The executed command."""
+        return self._cmd
+
+    # -----------------------------------------------------------
+    @property
+    def retcode(self):
+        """The return value of the executed command."""
+        return self._retcode
+
+    # -----------------------------------------------------------
+    @property
+    def stdout(self):
+        """The output of the command on STDOUT."""
+        return self._stdout
+
+    # -----------------------------------------------------------
+    @property
+    def stderr(self):
+        """The output of the command on STDERR."""
+        return self._stderr
+
+    # -----------------------------------------------------------
+    @property
+    def wall_time(self):
+        """The elapsed real time of the execution in seconds."""
+        return self._wall_time
+
+    # -----------------------------------------------------------
+    @property
+    def utime(self):
+        """The CPU time in user mode of the child in seconds."""
+        return self._utime
+
+    # -----------------------------------------------------------
+    @property
+    def stime(self):
+        """The CPU time in system mode of the child in seconds."""
+        return self._stime
+
+    # -----------------------------------------------------------
+    @property
+    def cpu_time(self):
+        """The total CPU time of the child in seconds."""
+        if self._utime is None:
+            return None
+        return self._utime + self._stime
+
+    # -----------------------------------------------------------
+    @property
+    def max_rss(self):
+        """The maximum resident set size of the child in KiBytes."""
+        return self._max_rss
+
+    # -------------------------------------------------------------------------
+    def __iter__(self):
+        """Unpacking like the tuple (retcode, stdout, stderr)."""
+
+        return iter((self.retcode, self.stdout, self.stderr))
+
+    # -------------------------------------------------------------------------
+    def as_dict(self, short=False):
+        """
+        Transforms the elements of the object into a dict
+
+        @param short: don't include local properties in resulting dict.
+        @type short: bool
+
+        @return: structure as dict
+        @rtype:  dict
+        """
+
+        res = super(CallResult, self).as_dict(short=short)
+        res['cmd'] = self.cmd
+        res['retcode'] = self.retcode
+        res['stdout'] = self.stdout
+        res['stderr'] = self.stderr
+        res['wall_time'] = self.wall_time
+        res['utime'] = self.utime
+        res['stime'] = self.stime
+        res['cpu_time'] = self.cpu_time
+        res['max_rss'] = self.max_rss
+
+        return res
+
+
 # =============================================================================
 class PbBaseHandler(PbBaseObject):
     """
@@ -171,6 +372,21 @@ class PbBaseHandler(PbBaseObject):
         @type: bool
         """
 
+        self._cmd_stats = {}
+        """
+        @ivar: accumulated statistics of all executed commands, the key is
+               the basename of the command
+        @type: dict
+        """
+        self._cmd_stats_lock = threading.Lock()
+
+        self._alarm_warned = False
+        """
+        @ivar: a warning about a timeout ignored outside the main thread
+               was already logged
+        @type: bool
+        """
+
         self._chown_cmd = CHOWN_CMD
         """
         @ivar: the chown command for changing ownership of file objects
@@ -242,6 +458,17 @@ class PbBaseHandler(PbBaseObject):
     def sudo(self, value):
         self._sudo = bool(value)
 
+    # -----------------------------------------------------------
+    @property
+    def cmd_stats(self):
+        """
+        Accumulated statistics of all executed commands as a dict with the
+        basenames of the commands as keys and dicts with the keys 'count',
+        'failed', 'wall_time', 'utime', 'stime' and 'max_rss' as values.
+        """
+        with self._cmd_stats_lock:
+            return dict((k, dict(v)) for (k, v) in self._cmd_stats.items())
+
     # -----------------------------------------------------------
     @property
     def chown_cmd(self):
@@ -302,6 +529,214 @@ class PbBaseHandler(PbBaseObject):
         out += ", ".join(fields) + ")>"
         return out
 
+    # -------------------------------------------------------------------------
+    def reset_cmd_stats(self):
+        """Resets the accumulated statistics of all executed commands."""
+
+        with self._cmd_stats_lock:
+            self._cmd_stats = {}
+
+    # -------------------------------------------------------------------------
+    def _record_cmd_stats(self, name, retcode, wall_time, rusage):
+        """
+        Adds the timing and resource usage of an executed command
+        to self.cmd_stats.
+        """
+
+        with self._cmd_stats_lock:
+            if name not in self._cmd_stats:
+                self._cmd_stats[name] = {
+                    'count': 0, 'failed': 0, 'wall_time': 0.0,
+                    'utime': 0.0, 'stime': 0.0, 'max_rss': 0}
+            stats = self._cmd_stats[name]
+            stats['count'] += 1
+            if retcode:
+                stats['failed'] += 1
+            stats['wall_time'] += wall_time
+            if rusage is not None:
+                stats['utime'] += rusage.ru_utime
+                stats['stime'] += rusage.ru_stime
+                if rusage.ru_maxrss > stats['max_rss']:
+                    stats['max_rss'] = rusage.ru_maxrss
+
+    # -------------------------------------------------------------------------
+    def _wait4(self, cmd_obj, options=0):
+        """
+        Reaps the child process of the given Popen object with os.wait4()
+        to get its resource usage and sets the returncode of the Popen object.
+
+        @param cmd_obj: the Popen object of the child process
+        @type cmd_obj: subprocess.Popen
+        @param options: options for os.wait4(), e.g. os.WNOHANG
+        @type options: int
+
+        @return: the resource usage of the child, or None, if the child is
+                 still running or was even reaped
+        @rtype: resource.struct_rusage or None
+
+        """
+
+        if cmd_obj.returncode is not None:
+            return None
+
+        while True:
+            try:
+                (pid, status, rusage) = os.wait4(cmd_obj.pid, options)
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno == errno.ECHILD:
+                    # somebody else has reaped the child
+                    cmd_obj.poll()
+                    return None
+                raise
+            break
+
+        if not pid:
+            return None
+
+        if os.WIFSIGNALED(status):
+            cmd_obj.returncode = -os.WTERMSIG(status)
+        else:
+            cmd_obj.returncode = os.WEXITSTATUS(status)
+
+        return rusage
+
+    # -------------------------------------------------------------------------
+    def _io_priority_preexec(self, nice, ionice_class, ionice_level, preexec_fn=None):
+        """
+        Creates a function to execute in the child process before exec to set
+        its niceness and I/O scheduling priority.
+        """
+
+        if ionice_class is not None:
+            ionice_class = ioprio_class(ionice_class)
+
+        if self.verbose > 2:
+            log.debug(_(
+                "Executing with nice increment %(nice)r, I/O class %(cls)r "
+                "and I/O level %(lvl)r.") % {
+                'nice': nice, 'cls': ionice_class, 'lvl': ionice_level})
+
+        def set_priority():
+            if preexec_fn:
+                preexec_fn()
+            if nice:
+                os.nice(int(nice))
+            if ionice_class is not None:
+                set_ioprio(ionice_class, ionice_level)
+
+        return set_priority
+
+    # -------------------------------------------------------------------------
+    def _run_io_prioritized(self, func, nice=None, ionice_class=None, ionice_level=None):
+        """
+        Executes the given function. If a niceness or a I/O scheduling
+        priority is given, the function is executed in a separate thread with
+        this priorities, so the priorities of the calling thread are not
+        changed. Exceptions of the function are raised again in the
+        calling thread.
+
+        @param func: the function to execute without any arguments
+        @type func: callable
+        @param nice: increment of the niceness of the thread
+        @type nice: int or None
+        @param ionice_class: the I/O scheduling class of the thread
+        @type ionice_class: int or str or None
+        @param ionice_level: the level inside the I/O scheduling class (0 - 7)
+        @type ionice_level: int or None
+
+        @return: the return value of the function
+
+        """
+
+        if nice is None and ionice_class is None:
+            return func()
+
+        if ionice_class is not None:
+            ionice_class = ioprio_class(ionice_class)
+
+        result = {}
+
+        def prioritized():
+            try:
+                if nice:
+                    renice_thread(nice)
+                if ionice_class is not None:
+                    set_ioprio(ionice_class, ionice_level)
+                result['value'] = func()
+            except BaseException:
+                result['error'] = sys.exc_info()
+
+        if self.verbose > 2:
+            log.debug(_(
+                "Executing in a thread with nice increment %(nice)r, I/O class %(cls)r "
+                "and I/O level %(lvl)r.") % {
+                'nice': nice, 'cls': ionice_class, 'lvl': ionice_level})
+
+        thread = threading.Thread(target=prioritized, name='io-prioritized')
+        thread.start()
+        thread.join()
+
+        if 'error' in result:
+            error_tuple = result['error']
+            reraise(error_tuple[0], error_tuple[1], error_tuple[2])
+
+        return result.get('value')
+
+    # -------------------------------------------------------------------------
+    def _communicate(self, cmd_obj):
+        """
+        Reads all output of the child process on STDOUT and STDERR
+        like Popen.communicate() does, but reaps the child with os.wait4().
+
+        @return: tuple of output on STDOUT, output on STDERR and the
+                 resource usage of the child
+        @rtype: tuple
+
+        """
+
+        if cmd_obj.stdin:
+            cmd_obj.stdin.close()
+
+        read_fds = {}
+        stdoutdata = None
+        stderrdata = None
+        if cmd_obj.stdout:
+            stdoutdata = bytearray()
+            read_fds[cmd_obj.stdout.fileno()] = stdoutdata
+        if cmd_obj.stderr:
+            stderrdata = bytearray()
+            read_fds[cmd_obj.stderr.fileno()] = stderrdata
+
+        while read_fds:
+            try:
+                (rlist, wlist, xlist) = select.select(list(read_fds.keys()), [], [])
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd in rlist:
+                data = os.read(fd, 65536)
+                if data:
+                    read_fds[fd] += data
+                else:
+                    del read_fds[fd]
+
+        if cmd_obj.stdout:
+            cmd_obj.stdout.close()
+        if cmd_obj.stderr:
+            cmd_obj.stderr.close()
+
+        rusage = self._wait4(cmd_obj)
+
+        if stdoutdata is not None:
+            stdoutdata = bytes(stdoutdata)
+        if stderrdata is not None:
+            stderrdata = bytes(stderrdata)
+
+        return (stdoutdata, stderrdata, rusage)
+
     # -------------------------------------------------------------------------
     def get_command(self, cmd, quiet=False):
         """
@@ -363,10 +798,14 @@ class PbBaseHandler(PbBaseObject):
         self, cmd, sudo=None, simulate=None, quiet=None, shell=False,
             stdout=None, stderr=None, bufsize=0, drop_stderr=False,
             close_fds=False, hb_handler=None, hb_interval=2.0,
-            poll_interval=0.2, **kwargs):
+            poll_interval=0.2, as_result=False, nice=None, ionice_class=None,
+            ionice_level=None, **kwargs):
         """
         Executing a OS command.
 
+        The child process is reaped with os.wait4(), the elapsed time and the
+        resource usage of every call are accumulated in self.cmd_stats.
+
         @param cmd: the cmd you wanne call
         @type cmd: list of strings or str
         @param sudo: execute the command with sudo
@@ -392,6 +831,16 @@ class PbBaseHandler(PbBaseObject):
         @param close_fds: closing all open file descriptors
                           (except 0, 1 and 2) on calling subprocess.Popen()
         @type close_fds: bool
+        @param as_result: return a CallResult object with timing and resource
+                          usage informations instead of a tuple
+        @type as_result: bool
+        @param nice: increment of the niceness of the child process (like nice)
+        @type nice: int or None
+        @param ionice_class: the I/O scheduling class of the child process
+                             (like ionice), see pb_base.syscalls.ioprio_class()
+        @type ionice_class: int or str or None
+        @param ionice_level: the level inside the I/O scheduling class (0 - 7)
+        @type ionice_level: int or None
         @param kwargs: any optional named parameter (must be one
             of the supported suprocess.Popen arguments)
         @type kwargs: dict
@@ -400,6 +849,7 @@ class PbBaseHandler(PbBaseObject):
             - return value of calling process,
             - output on STDOUT,
             - output on STDERR
+            or a CallResult object, if as_result is True
 
         """
 
@@ -407,6 +857,13 @@ class PbBaseHandler(PbBaseObject):
         if isinstance(cmd, str):
             cmd_list = [cmd]
 
+        stats_name = None
+        if cmd_list:
+            stats_name = str(cmd_list[0]).strip()
+            if shell and stats_name:
+                stats_name = stats_name.split()[0]
+            stats_name = os.path.basename(stats_name)
+
         pwd_info = pwd.getpwuid(os.geteuid())
 
         if sudo is None:
@@ -445,12 +902,14 @@ class PbBaseHandler(PbBaseObject):
         elif stderr is not None:
             used_stderr = stderr
 
-        cur_locale = locale.getlocale()
-        cur_encoding = cur_locale[1]
-        if (cur_locale[1] is None or cur_locale[1] == '' or
-                cur_locale[1].upper() == 'C' or
-                cur_locale[1].upper() == 'POSIX'):
-            cur_encoding = 'UTF-8'
+        cur_encoding = self._get_cur_encoding()
+
+        if nice is not None or ionice_class is not None:
+            kwargs['preexec_fn'] = self._io_priority_preexec(
+                nice, ionice_class, ionice_level, kwargs.get('preexec_fn'))
+
+        start_time_call = time.time()
+        rusage = None
 
         cmd_obj = subprocess.Popen(
             cmd_list,
@@ -490,8 +949,8 @@ class PbBaseHandler(PbBaseObject):
 
                 if self.verbose > 3:
                     log.debug(_("Checking for the end of the communication ..."))
-                if cmd_obj.poll() is not None:
-                    cmd_obj.wait()
+                rusage = self._wait4(cmd_obj, os.WNOHANG)
+                if cmd_obj.returncode is not None:
                     break
 
                 # Heartbeat handling ...
@@ -525,7 +984,7 @@ class PbBaseHandler(PbBaseObject):
         else:
             if not quiet or self.verbose > 1:
                 log.debug(_("Starting synchronous communication with '%s'.") % (cmd_str))
-            (stdoutdata, stderrdata) = cmd_obj.communicate()
+            (stdoutdata, stderrdata, rusage) = self._communicate(cmd_obj)
 
         if not quiet or self.verbose > 1:
             log.debug("Finished communication with '%s'" % (cmd_str))
@@ -571,102 +1030,331 @@ class PbBaseHandler(PbBaseObject):
                     'where': "StdOut", 'what': stdoutdata.strip()}
                 log.debug(msg)
 
+        if cmd_obj.returncode is None:
+            rusage = self._wait4(cmd_obj)
         ret = cmd_obj.wait()
+        wall_time = time.time() - start_time_call
         if not quiet or self.verbose > 1:
             log.debug(_("Returncode: %s") % (ret))
+        if self.verbose > 2 and rusage is not None:
+            log.debug(_(
+                "Execution of %(cmd)r took %(wall).3f seconds (user %(utime).3f s, "
+                "system %(stime).3f s, max RSS %(rss)d KiB).") % {
+                'cmd': stats_name, 'wall': wall_time, 'utime': rusage.ru_utime,
+                'stime': rusage.ru_stime, 'rss': rusage.ru_maxrss})
+
+        if not simulate and stats_name:
+            self._record_cmd_stats(stats_name, ret, wall_time, rusage)
+
+        if as_result:
+            return CallResult(
+                cmd=cmd_list, retcode=ret, stdout=stdoutdata, stderr=stderrdata,
+                wall_time=wall_time, rusage=rusage, appname=self.appname,
+                verbose=self.verbose, base_dir=self.base_dir)
 
         return (ret, stdoutdata, stderrdata)
 
     # -------------------------------------------------------------------------
-    def read_file(self, filename, timeout=2, quiet=False):
+    def call_pipeline(
+        self, cmds, sudo=None, simulate=None, quiet=None, stdin=None,
+            stdout=None, stderr=None, drop_stderr=False, close_fds=True):
         """
-        Reads the content of the given filename.
+        Executing a chain of OS commands, where the output of every command
+        is connected with the input of the next command like a shell pipe
+        (cmd1 | cmd2 | ...).
 
-        @raise IOError: if file doesn't exists or isn't readable
-        @raise PbReadTimeoutError: on timeout reading the file
+        The commands are connected directly by OS pipes, so the data between
+        the stages never passes through this Python process.
 
-        @param filename: name of the file to read
-        @type filename: str
-        @param timeout: the amount in seconds when this method should timeout
-        @type timeout: int
-        @param quiet: increases the necessary verbosity level to
-                      put some debug messages
+        @raise PbBaseHandlerError: if an empty list of commands was given.
+
+        @param cmds: the commands of the pipeline in the order of execution
+        @type cmds: list of (list of strings or str)
+        @param sudo: execute all commands of the pipeline with sudo
+        @type sudo: bool (or none, if self.sudo will be be asked)
+        @param simulate: simulate execution or not,
+                         if None, self.simulate will asked
+        @type simulate: bool or None
+        @param quiet: quiet execution independend of self.quiet
         @type quiet: bool
+        @param stdin: file descriptor or file object for stdin of the first
+                      command, if not given, the first command is reading
+                      from /dev/null
+        @type stdin: int or file
+        @param stdout: file descriptor or file object for stdout of the last
+                       command, if not given, the output is captured
+        @type stdout: int or file
+        @param stderr: file descriptor or file object for stderr of all
+                       commands, if not given, the output on stderr of all
+                       commands is captured
+        @type stderr: int or file
+        @param drop_stderr: don't capture the output on stderr, independend
+                            of any value of stderr
+        @type drop_stderr: bool
+        @param close_fds: closing all open file descriptors
+                          (except 0, 1 and 2) on calling subprocess.Popen()
+        @type close_fds: bool
 
-        @return: file content
-        @rtype:  str
+        @return: tuple of::
+            - list of the return values of all commands in the pipeline,
+            - output on STDOUT of the last command,
+            - output on STDERR of all commands
 
         """
 
-        needed_verbose_level = 1
-        if quiet:
-            needed_verbose_level = 3
+        if not cmds:
+            raise PbBaseHandlerError(_("Empty command list for a pipeline given."))
 
-        def read_alarm_caller(signum, sigframe):
-            '''
-            This nested function will be called in event of a timeout
+        if sudo is None:
+            sudo = self.sudo
 
-            @param signum:   the signal number (POSIX) which happend
-            @type signum:    int
-            @param sigframe: the frame of the signal
-            @type sigframe:  object
-            '''
+        if simulate is None:
+            simulate = self.simulate
 
-            raise PbReadTimeoutError(timeout, filename)
+        if quiet is None:
+            quiet = self.quiet
 
-        timeout = abs(int(timeout))
+        cmd_lists = []
+        for cmd in cmds:
+            if isinstance(cmd, six.string_types):
+                cmd_list = [cmd]
+            else:
+                cmd_list = list(cmd)
+            if sudo:
+                cmd_list.insert(0, self.sudo_cmd)
+            cmd_lists.append([str(element) for element in cmd_list])
 
-        if not os.path.isfile(filename):
-            raise IOError(
-                errno.ENOENT, _("File doesn't exists."), filename)
-        if not os.access(filename, os.R_OK):
-            raise IOError(
-                errno.EACCES, _('Read permission denied.'), filename)
+        pipeline_str = ' | '.join(
+            [' '.join(map(lambda x: pipes.quote(x), cmd_list)) for cmd_list in cmd_lists])
 
-        if self.verbose > needed_verbose_level:
-            log.debug(_(
-                "Reading file content of %r ..."), filename)
+        if simulate:
+            (ret, stdoutdata, stderrdata) = self.call(
+                [pipeline_str], sudo=False, simulate=True, quiet=quiet)
+            return ([ret] * len(cmd_lists), stdoutdata, stderrdata)
 
-        signal.signal(signal.SIGALRM, read_alarm_caller)
-        signal.alarm(timeout)
+        if not quiet or self.verbose > 1:
+            log.debug(_("Executing pipeline %r"), pipeline_str)
 
-        content = ''
-        fh = open(filename, 'r')
-        for line in fh.readlines():
-            content += line
-        fh.close()
+        pwd_info = pwd.getpwuid(os.geteuid())
+        cur_encoding = self._get_cur_encoding()
 
-        signal.alarm(0)
+        used_stdin = stdin
+        if used_stdin is None:
+            used_stdin = open(os.devnull, 'rb')
 
-        return content
+        err_read = None
+        err_write = None
+        used_stderr = stderr
+        if drop_stderr:
+            used_stderr = None
+        elif stderr is None:
+            (err_read, err_write) = os.pipe()
+            used_stderr = err_write
 
-    # -------------------------------------------------------------------------
-    def write_file(
-            self, filename, content, timeout=2, must_exists=True, quiet=False):
-        """
-        Writes the given content into the given filename.
-        It should only be used for small things, because it writes unbuffered.
+        used_stdout = subprocess.PIPE
+        if stdout is not None:
+            used_stdout = stdout
 
-        @raise IOError: if file doesn't exists or isn't writeable
-        @raise PbWriteTimeoutError: on timeout writing into the file
+        start_time = time.time()
+        procs = []
+        prev_stdout = used_stdin
+        started = False
+        try:
+            last_index = len(cmd_lists) - 1
+            for index, cmd_list in enumerate(cmd_lists):
+                cur_stdout = subprocess.PIPE
+                if index == last_index:
+                    cur_stdout = used_stdout
+                if self.verbose > 2:
+                    log.debug(_("Starting pipeline stage %(nr)d: %(cmd)r") % {
+                        'nr': index, 'cmd': cmd_list})
+                proc = subprocess.Popen(
+                    cmd_list,
+                    cwd=self.base_dir,
+                    close_fds=close_fds,
+                    stdin=prev_stdout,
+                    stdout=cur_stdout,
+                    stderr=used_stderr,
+                    env={'USER': pwd_info.pw_name},
+                )
+                # Closing our copy of the read end, so only the next stage
+                # holds it and the previous one gets a SIGPIPE, if it exits
+                if procs and procs[-1].stdout is not None:
+                    procs[-1].stdout.close()
+                procs.append(proc)
+                prev_stdout = proc.stdout
+            started = True
+        finally:
+            if stdin is None:
+                used_stdin.close()
+            if err_write is not None:
+                os.close(err_write)
+            if not started:
+                # a stage could not be started, so the already started
+                # stages are killed and reaped
+                if procs and prev_stdout is not None:
+                    prev_stdout.close()
+                for proc in procs:
+                    try:
+                        proc.kill()
+                    except OSError:
+                        pass
+                    proc.wait()
+                if err_read is not None:
+                    os.close(err_read)
+
+        stdoutdata = bytearray()
+        stderrdata = bytearray()
+        read_fds = {}
+        if procs[-1].stdout is not None and used_stdout == subprocess.PIPE:
+            read_fds[procs[-1].stdout.fileno()] = stdoutdata
+        if err_read is not None:
+            read_fds[err_read] = stderrdata
 
-        @param filename: name of the file to write
-        @type filename: str
-        @param content: the content to write into the file
-        @type content: str
-        @param timeout: the amount in seconds when this method should timeout
-        @type timeout: int
-        @param must_exists: the file must exists before writing
-        @type must_exists: bool
-        @param quiet: increases the necessary verbosity level to
-                      put some debug messages
-        @type quiet: bool
+        try:
+            while read_fds:
+                (rlist, wlist, xlist) = select.select(list(read_fds.keys()), [], [])
+                for fd in rlist:
+                    data = os.read(fd, 65536)
+                    if data:
+                        read_fds[fd] += data
+                    else:
+                        del read_fds[fd]
+        finally:
+            if err_read is not None:
+                os.close(err_read)
+            if procs[-1].stdout is not None:
+                procs[-1].stdout.close()
+
+        ret_codes = []
+        for (proc, cmd_list) in zip(procs, cmd_lists):
+            rusage = self._wait4(proc)
+            # the stages are waited for in order, so this is the time
+            # until the end of this stage (or of a previous one)
+            wall_time = time.time() - start_time
+            ret_codes.append(proc.wait())
+            stats_name = cmd_list[0]
+            if sudo and len(cmd_list) > 1:
+                stats_name = cmd_list[1]
+            self._record_cmd_stats(
+                os.path.basename(stats_name), proc.returncode, wall_time, rusage)
 
-        @return: None
+        if not quiet or self.verbose > 1:
+            log.debug(_("Returncodes of pipeline: %r") % (ret_codes))
+
+        stdoutdata = stdoutdata.decode(cur_encoding)
+        stderrdata = stderrdata.decode(cur_encoding)
+        if six.PY2:
+            stdoutdata = stdoutdata.encode(cur_encoding)
+            stderrdata = stderrdata.encode(cur_encoding)
+
+        if stderrdata and not (quiet and not self.verbose):
+            msg = _("Output on %(where)s: %(what)r.") % {
+                'where': "StdErr", 'what': stderrdata.strip()}
+            if quiet:
+                log.debug(msg)
+            else:
+                self.handle_error(msg, self.appname)
 
+        return (ret_codes, stdoutdata, stderrdata)
+
+    # -------------------------------------------------------------------------
+    def _get_cur_encoding(self):
+        """
+        Gives back the encoding of the current locale to decode the output
+        of called commands, falls back to UTF-8.
         """
 
-        def write_alarm_caller(signum, sigframe):
+        cur_locale = locale.getlocale()
+        cur_encoding = cur_locale[1]
+        if (cur_locale[1] is None or cur_locale[1] == '' or
+                cur_locale[1].upper() == 'C' or
+                cur_locale[1].upper() == 'POSIX'):
+            cur_encoding = 'UTF-8'
+        return cur_encoding
+
+    # -------------------------------------------------------------------------
+    def _start_alarm(self, alarm_caller, timeout):
+        """
+        Installs the given alarm handler for SIGALRM and starts the alarm
+        timer. Signal handlers can only be installed in the main thread,
+        so in all other threads nothing is done, the first ignored timeout
+        of the handler is logged as a warning.
+
+        @return: a tuple of the previous handler, or None, if no alarm
+                 was started
+        @rtype: tuple or None
+
+        """
+
+        if not timeout:
+            return None
+        if not is_main_thread():
+            if not self._alarm_warned:
+                self._alarm_warned = True
+                log.warning(_(
+                    "A timeout of %(to)s seconds can only be enforced in the main "
+                    "thread, it's ignored in thread %(thread)r.") % {
+                    'to': timeout, 'thread': threading.current_thread().name})
+            return None
+
+        old_handler = signal.signal(signal.SIGALRM, alarm_caller)
+        signal.alarm(timeout)
+        return (old_handler, )
+
+    # -------------------------------------------------------------------------
+    def _stop_alarm(self, alarm_state):
+        """Stops an alarm started by _start_alarm()."""
+
+        if alarm_state is None:
+            return
+        signal.alarm(0)
+        old_handler = alarm_state[0]
+        if old_handler is None:
+            old_handler = signal.SIG_DFL
+        signal.signal(signal.SIGALRM, old_handler)
+
+    # -------------------------------------------------------------------------
+    def read_file(
+            self, filename, timeout=2, quiet=False, binary=False, max_bytes=None,
+            use_mmap=None):
+        """
+        Reads the content of the given filename.
+
+        The content is read at once with a single read() call, big regular
+        files (from MMAP_MIN_SIZE Bytes on) in binary mode through a memory
+        mapping. The timeout is only possible in the main thread, because
+        it's implemented by SIGALRM.
+
+        @raise IOError: if file doesn't exists or isn't readable
+        @raise PbReadTimeoutError: on timeout reading the file
+
+        @param filename: name of the file to read
+        @type filename: str
+        @param timeout: the amount in seconds when this method should timeout
+        @type timeout: int
+        @param quiet: increases the necessary verbosity level to
+                      put some debug messages
+        @type quiet: bool
+        @param binary: read the file in binary mode and give back bytes
+        @type binary: bool
+        @param max_bytes: read at most this number of bytes (characters
+                          in text mode)
+        @type max_bytes: int or None
+        @param use_mmap: use a memory mapping in binary mode, None means
+                         only for regular files from MMAP_MIN_SIZE Bytes on
+        @type use_mmap: bool or None
+
+        @return: file content
+        @rtype:  str or bytes
+
+        """
+
+        needed_verbose_level = 1
+        if quiet:
+            needed_verbose_level = 3
+
+        def read_alarm_caller(signum, sigframe):
             '''
             This nested function will be called in event of a timeout
 
@@ -676,17 +1364,304 @@ class PbBaseHandler(PbBaseObject):
             @type sigframe:  object
             '''
 
-            raise PbWriteTimeoutError(timeout, filename)
+            raise PbReadTimeoutError(timeout, filename)
 
-        verb_level1 = 0
-        verb_level2 = 1
-        verb_level3 = 3
-        if quiet:
-            verb_level1 = 2
-            verb_level2 = 3
-            verb_level3 = 4
+        timeout = abs(int(timeout))
+        if max_bytes is not None:
+            max_bytes = int(max_bytes)
+            if max_bytes < 0:
+                max_bytes = None
 
-        timeout = int(timeout)
+        if not os.path.isfile(filename):
+            raise IOError(
+                errno.ENOENT, _("File doesn't exists."), filename)
+        if not os.access(filename, os.R_OK):
+            raise IOError(
+                errno.EACCES, _('Read permission denied.'), filename)
+
+        if self.verbose > needed_verbose_level:
+            log.debug(_(
+                "Reading file content of %r ..."), filename)
+
+        alarm_state = self._start_alarm(read_alarm_caller, timeout)
+        try:
+            if not binary:
+                with open(filename, 'r') as fh:
+                    if max_bytes is None:
+                        return fh.read()
+                    return fh.read(max_bytes)
+
+            with open(filename, 'rb') as fh:
+                size = os.fstat(fh.fileno()).st_size
+                if use_mmap is None:
+                    use_mmap = size >= MMAP_MIN_SIZE
+                if use_mmap and size:
+                    length = size
+                    if max_bytes is not None:
+                        length = min(size, max_bytes)
+                    mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                    try:
+                        return mm[:length]
+                    finally:
+                        mm.close()
+                if max_bytes is None:
+                    return fh.read()
+                return fh.read(max_bytes)
+        finally:
+            self._stop_alarm(alarm_state)
+
+    # -------------------------------------------------------------------------
+    def follow_file(
+            self, filename, from_end=True, binary=False, timeout=None,
+            poll_interval=FOLLOW_POLL_INTERVAL, use_inotify=None):
+        """
+        A generator following the given file like 'tail -F', it yields all
+        lines appended to the file (including the line ending)::
+
+            hdlr = PbBaseHandler()
+            for line in hdlr.follow_file('/var/log/syslog'):
+                ...
+
+        It waits for changes of the file by inotify, if possible, else it
+        checks the file every poll_interval seconds.
+
+        A truncated file is read again from the beginning. If the file was
+        rotated (replaced by a new file), the rest of the old file is read
+        and the new file is followed from its beginning. A not existing file
+        is followed as soon as it's created.
+
+        @raise OSError: if the file could not be read, or inotify could not
+                        be used and use_inotify is True
+
+        @param filename: the file to follow
+        @type filename: str
+        @param from_end: yield only lines appended after the start, else
+                         also all existing lines
+        @type from_end: bool
+        @param binary: yield the lines as bytes, else decoded with the
+                       encoding of the current locale
+        @type binary: bool
+        @param timeout: stop after this number of seconds without a new
+                        line, None means never
+        @type timeout: float or None
+        @param poll_interval: the seconds between the checks without inotify
+        @type poll_interval: float
+        @param use_inotify: wait by inotify, None means if possible
+        @type use_inotify: bool or None
+
+        @return: the appended lines
+        @rtype: generator of str or bytes
+
+        """
+
+        filename = os.path.abspath(filename)
+        watch = self._follow_watch(filename, use_inotify)
+        encoding = None
+        if not binary and six.PY3:
+            encoding = self._get_cur_encoding()
+
+        (fd, file_wd) = self._follow_open(filename, watch)
+        if fd is not None and from_end:
+            os.lseek(fd, 0, os.SEEK_END)
+        buf = b''
+        last_line = time.time()
+
+        try:
+            while True:
+
+                if fd is None:
+                    (fd, file_wd) = self._follow_open(filename, watch)
+
+                lines = []
+                rotated = False
+                if fd is not None:
+                    if os.fstat(fd).st_size < os.lseek(fd, 0, os.SEEK_CUR):
+                        log.info(_("File %r was truncated, reading from start."), filename)
+                        os.lseek(fd, 0, os.SEEK_SET)
+                        buf = b''
+                    (new_lines, buf) = self._follow_read(fd, buf)
+                    lines.extend(new_lines)
+                    rotated = self._follow_rotated(filename, fd)
+                    if rotated:
+                        log.info(_("File %r was rotated, reading new file."), filename)
+                        # the rest of the old file
+                        (new_lines, buf) = self._follow_read(fd, buf)
+                        lines.extend(new_lines)
+                        if buf:
+                            lines.append(buf)
+                            buf = b''
+                        os.close(fd)
+                        if file_wd is not None:
+                            inotify_rm_watch(watch[0], file_wd)
+                        (fd, file_wd) = (None, None)
+
+                for line in lines:
+                    if encoding:
+                        line = line.decode(encoding, 'replace')
+                    yield line
+                now = time.time()
+                if lines:
+                    last_line = now
+                if rotated:
+                    continue
+
+                wait = None
+                if timeout is not None:
+                    wait = last_line + timeout - now
+                    if wait <= 0:
+                        return
+                self._follow_wait(watch, file_wd, wait, poll_interval)
+
+        finally:
+            if fd is not None:
+                os.close(fd)
+            if watch is not None:
+                os.close(watch[0])
+
+    # -------------------------------------------------------------------------
+    def _follow_watch(self, filename, use_inotify=None):
+        """
+        Creates an inotify instance watching the directory of the given
+        file for the creation of it, see follow_file().
+
+        @return: the file descriptor of the inotify instance, the watch
+                 descriptor of the directory and the basename of the file
+                 as bytes, or None, if polling has to be used
+        @rtype: tuple or None
+
+        """
+
+        if use_inotify is not None and not use_inotify:
+            return None
+
+        inotify_fd = None
+        try:
+            inotify_fd = inotify_init()
+            dir_wd = inotify_add_watch(
+                inotify_fd, os.path.dirname(filename), FOLLOW_DIR_EVENTS)
+        except OSError as e:
+            if inotify_fd is not None:
+                os.close(inotify_fd)
+            if use_inotify:
+                raise
+            log.debug(_("Could not use inotify, polling %(file)r: %(err)s") % {
+                'file': filename, 'err': e})
+            return None
+
+        basename = os.path.basename(filename)
+        if not isinstance(basename, bytes):
+            basename = basename.encode(sys.getfilesystemencoding())
+        return (inotify_fd, dir_wd, basename)
+
+    # -------------------------------------------------------------------------
+    def _follow_open(self, filename, watch=None):
+        """
+        Opens a followed file and adds an inotify watch for it.
+
+        @return: the file descriptor and the watch descriptor, or None
+                 for both, if the file doesn't exists
+        @rtype: tuple
+
+        """
+
+        try:
+            fd = os.open(filename, os.O_RDONLY)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return (None, None)
+            raise
+
+        file_wd = None
+        if watch is not None:
+            # the watch follows the inode, also after a rename
+            file_wd = inotify_add_watch(
+                watch[0], '/proc/self/fd/%d' % (fd), FOLLOW_FILE_EVENTS)
+        return (fd, file_wd)
+
+    # -------------------------------------------------------------------------
+    def _follow_read(self, fd, buf):
+        """
+        Reads all new data of a followed file.
+
+        @return: the complete lines and the rest without a line ending
+        @rtype: tuple of list of bytes and bytes
+
+        """
+
+        chunks = [buf]
+        while True:
+            data = os.read(fd, FOLLOW_BLOCK_SIZE)
+            if not data:
+                break
+            chunks.append(data)
+        data = b''.join(chunks)
+
+        lines = data.splitlines(True)
+        if lines and not lines[-1].endswith(b'\n'):
+            return (lines[:-1], lines[-1])
+        return (lines, b'')
+
+    # -------------------------------------------------------------------------
+    def _follow_rotated(self, filename, fd):
+        """
+        Checks, whether the path of a followed file points to another file
+        than the opened one. A not existing path is not a rotation, because
+        the old file may still be written until the new one is created.
+        """
+
+        try:
+            st = os.stat(filename)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                return False
+            raise
+        cur = os.fstat(fd)
+        return (st.st_dev, st.st_ino) != (cur.st_dev, cur.st_ino)
+
+    # -------------------------------------------------------------------------
+    def _follow_wait(self, watch, file_wd, wait, poll_interval):
+        """
+        Waits for a change of a followed file by inotify, or without inotify
+        for poll_interval seconds, but at most for wait seconds (if not None).
+        Events of other files in the same directory don't end the waiting.
+        """
+
+        if watch is None:
+            if wait is None or wait > poll_interval:
+                wait = poll_interval
+            time.sleep(wait)
+            return
+
+        (inotify_fd, dir_wd, basename) = watch
+        deadline = None
+        if wait is not None:
+            deadline = time.time() + wait
+
+        while True:
+            if deadline is not None:
+                wait = max(deadline - time.time(), 0)
+            try:
+                (readable, writable, exceptional) = select.select(
+                    [inotify_fd], [], [], wait)
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not readable:
+                return
+            for (wd, mask, cookie, name) in read_inotify_events(inotify_fd):
+                if wd == file_wd or name == basename or mask & IN_Q_OVERFLOW:
+                    return
+
+    # -------------------------------------------------------------------------
+    def _check_write_access(self, filename, must_exists):
+        """
+        Checks the write permissions for writing into the given file.
+
+        @raise IOError: if file doesn't exists or isn't writeable
+                        (in simulation mode only an error is logged)
+
+        """
 
         if must_exists:
             if not os.path.isfile(filename):
@@ -706,6 +1681,8 @@ class PbBaseHandler(PbBaseObject):
                         filename)
         else:
             parent_dir = os.path.dirname(filename)
+            if not parent_dir:
+                parent_dir = os.curdir
             if not os.access(parent_dir, os.W_OK):
                 if self.simulate:
                     log.error(_(
@@ -716,6 +1693,189 @@ class PbBaseHandler(PbBaseObject):
                         _('Write permission denied.'),
                         parent_dir)
 
+    # -------------------------------------------------------------------------
+    def _check_write_sync(self, sync, atomic):
+        """
+        Checks the sync policy of write_file() and write_files().
+
+        @raise PbBaseHandlerError: on an invalid sync policy
+
+        @return: the sync policy to use
+        @rtype: str
+
+        """
+
+        if sync is None:
+            if atomic:
+                return 'full'
+            return 'none'
+        if sync not in WRITE_SYNC_POLICIES:
+            msg = _("Invalid sync policy %(s)r, valid policies are: %(l)s.") % {
+                's': sync, 'l': ', '.join(WRITE_SYNC_POLICIES)}
+            raise PbBaseHandlerError(msg)
+        return sync
+
+    # -------------------------------------------------------------------------
+    def _content_to_bytes(self, content):
+        """
+        Gives back the content to write as a bytes-like object. Text is
+        encoded with the encoding of the current locale, bytes, bytearray
+        and memoryview objects are used as they are.
+        """
+
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return content
+        if not isinstance(content, six.string_types):
+            content = str(content)
+        return to_bytes(content, self._get_cur_encoding())
+
+    # -------------------------------------------------------------------------
+    def _write_content(self, filename, data, atomic=False, mode=None, sync='none'):
+        """
+        Writes the given data with unbuffered system calls into the given
+        file or, in atomic mode, into a new temporary file in the same
+        directory, which has to be renamed by the caller afterwards.
+
+        @param filename: name of the file to write
+        @type filename: str
+        @param data: the data to write
+        @type data: bytes-like object
+        @param atomic: write into a temporary file
+        @type atomic: bool
+        @param mode: the permissions of a new or temporary file, in atomic
+                     mode defaults to the permissions of the existing file
+        @type mode: int or None
+        @param sync: the sync policy of the file data ('data' or 'full'
+                     sync the file before closing)
+        @type sync: str
+
+        @return: the name of the temporary file in atomic mode, else None
+        @rtype: str or None
+
+        """
+
+        tmp_name = None
+        if atomic:
+            if mode is None:
+                try:
+                    mode = stat.S_IMODE(os.stat(filename).st_mode)
+                except OSError:
+                    mode = DEFAULT_FILE_MODE
+            (fd, tmp_name) = tempfile.mkstemp(
+                prefix='.' + os.path.basename(filename) + '.', suffix='.tmp',
+                dir=(os.path.dirname(filename) or os.curdir))
+        else:
+            if mode is None:
+                mode = 0o666
+            fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+
+        try:
+            if atomic:
+                os.fchmod(fd, mode)
+            view = memoryview(data)
+            while len(view):
+                written = os.write(fd, view)
+                view = view[written:]
+            if sync == 'data' and hasattr(os, 'fdatasync'):
+                os.fdatasync(fd)
+            elif sync != 'none':
+                os.fsync(fd)
+        except Exception:
+            os.close(fd)
+            if tmp_name:
+                os.remove(tmp_name)
+            raise
+        os.close(fd)
+
+        return tmp_name
+
+    # -------------------------------------------------------------------------
+    def _sync_dirs(self, dirs):
+        """Syncs the given directories, to make changed entries durable."""
+
+        for dirname in dirs:
+            if self.verbose > 3:
+                log.debug(_("Syncing directory %r ..."), dirname)
+            fd = os.open(dirname, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    # -------------------------------------------------------------------------
+    def write_file(
+            self, filename, content, timeout=2, must_exists=True, quiet=False,
+            atomic=False, sync=None, mode=None):
+        """
+        Writes the given content into the given filename.
+        It should only be used for small things, because it writes unbuffered.
+
+        In atomic mode the content is written into a temporary file in the
+        same directory, which replaces the file by a rename afterwards, so
+        readers see either the old or the new content. This is not possible
+        for special files, e.g. in /sys.
+
+        The sync policies are:
+            - 'none': no syncing, the kernel writes back the data sometime
+            - 'data': the file data are synced before closing
+            - 'full': the file is synced and also its directory, if the
+                      file was replaced or created
+        The default is 'full' in atomic mode and 'none' else.
+
+        @raise IOError: if file doesn't exists or isn't writeable
+        @raise PbWriteTimeoutError: on timeout writing into the file
+        @raise PbBaseHandlerError: on an invalid sync policy
+
+        @param filename: name of the file to write
+        @type filename: str
+        @param content: the content to write into the file, text is encoded
+                        with the encoding of the current locale
+        @type content: str or bytes or bytearray or memoryview
+        @param timeout: the amount in seconds when this method should timeout
+        @type timeout: int
+        @param must_exists: the file must exists before writing
+        @type must_exists: bool
+        @param quiet: increases the necessary verbosity level to
+                      put some debug messages
+        @type quiet: bool
+        @param atomic: replace the file atomically by a temporary file
+        @type atomic: bool
+        @param sync: the sync policy, see above
+        @type sync: str or None
+        @param mode: the permissions of a created file, in atomic mode
+                     defaults to the permissions of the replaced file
+        @type mode: int or None
+
+        @return: None
+
+        """
+
+        def write_alarm_caller(signum, sigframe):
+            '''
+            This nested function will be called in event of a timeout
+
+            @param signum:   the signal number (POSIX) which happend
+            @type signum:    int
+            @param sigframe: the frame of the signal
+            @type sigframe:  object
+            '''
+
+            raise PbWriteTimeoutError(timeout, filename)
+
+        verb_level1 = 0
+        verb_level2 = 1
+        verb_level3 = 3
+        if quiet:
+            verb_level1 = 2
+            verb_level2 = 3
+            verb_level3 = 4
+
+        timeout = int(timeout)
+        sync = self._check_write_sync(sync, atomic)
+
+        self._check_write_access(filename, must_exists)
+        existed = os.path.exists(filename)
+
         if self.verbose > verb_level1:
             if self.verbose > verb_level2:
                 log.debug(_("Write %(what)r into %(to)r.") % {
@@ -729,33 +1889,228 @@ class PbBaseHandler(PbBaseObject):
                     "Simulating write into %r."), filename)
             return
 
-        signal.signal(signal.SIGALRM, write_alarm_caller)
-        signal.alarm(timeout)
+        data = self._content_to_bytes(content)
 
-        # Open filename for writing unbuffered
-        if self.verbose > verb_level3:
-            log.debug(_(
-                "Opening '%s' for write unbuffered ..."), filename)
-        fh = open(filename, 'w', 0)
+        alarm_state = self._start_alarm(write_alarm_caller, timeout)
+        try:
+            if self.verbose > verb_level3:
+                log.debug(_(
+                    "Opening '%s' for write unbuffered ..."), filename)
+            tmp_name = self._write_content(
+                filename, data, atomic=atomic, mode=mode, sync=sync)
+            if tmp_name:
+                if self.verbose > verb_level3:
+                    log.debug(_("Renaming %(tmp)r into %(fn)r ...") % {
+                        'tmp': tmp_name, 'fn': filename})
+                try:
+                    os.rename(tmp_name, filename)
+                except Exception:
+                    os.remove(tmp_name)
+                    raise
+            if sync == 'full' and (atomic or not existed):
+                self._sync_dirs([os.path.dirname(filename) or os.curdir])
+        finally:
+            self._stop_alarm(alarm_state)
+
+        return
 
+    # -------------------------------------------------------------------------
+    def write_files(
+            self, files, timeout=2, must_exists=True, quiet=False,
+            atomic=False, sync=None, mode=None):
+        """
+        Writes many (small) files with a single durability barrier instead
+        of syncing every file on its own. All files are written first, then
+        every affected filesystem is synced once by syncfs(2). In atomic mode
+        the temporary files are renamed after this barrier and the affected
+        directories are synced afterwards (with the sync policy 'full').
+
+        The access checks are done for all files before writing anything.
+        The timeout is for writing all files.
+
+        @raise IOError: if a file doesn't exists or isn't writeable
+        @raise PbWriteTimeoutError: on timeout writing the files
+        @raise PbBaseHandlerError: on an invalid sync policy
+
+        @param files: the file names and their content, either as a dict
+                      or as a list of (filename, content) pairs
+        @type files: dict or list
+        @param timeout: the amount in seconds when this method should timeout
+        @type timeout: int
+        @param must_exists: the files must exists before writing
+        @type must_exists: bool
+        @param quiet: increases the necessary verbosity level to
+                      put some debug messages
+        @type quiet: bool
+        @param atomic: replace the files atomically by temporary files
+        @type atomic: bool
+        @param sync: the sync policy, see write_file(), 'data' and 'full'
+                     are both syncing the filesystems
+        @type sync: str or None
+        @param mode: the permissions of created files, see write_file()
+        @type mode: int or None
+
+        @return: None
+
+        """
+
+        if isinstance(files, dict):
+            files = list(files.items())
+        else:
+            files = list(files)
+
+        def write_alarm_caller(signum, sigframe):
+            '''
+            This nested function will be called in event of a timeout
+
+            @param signum:   the signal number (POSIX) which happend
+            @type signum:    int
+            @param sigframe: the frame of the signal
+            @type sigframe:  object
+            '''
+
+            raise PbWriteTimeoutError(timeout, files[0][0])
+
+        verb_level1 = 0
+        verb_level2 = 1
+        if quiet:
+            verb_level1 = 2
+            verb_level2 = 3
+
+        timeout = int(timeout)
+        sync = self._check_write_sync(sync, atomic)
+        if not files:
+            return
+
+        for (filename, content) in files:
+            self._check_write_access(filename, must_exists)
+
+        if self.verbose > verb_level1:
+            log.debug(__(
+                "Writing %d file ...", "Writing %d files ...",
+                len(files)), len(files))
+
+        if self.simulate:
+            if self.verbose > verb_level2:
+                for (filename, content) in files:
+                    log.debug(_(
+                        "Simulating write into %r."), filename)
+            return
+
+        dirs = []
+        renames = []
+        alarm_state = self._start_alarm(write_alarm_caller, timeout)
         try:
-            fh.write(content)
+            try:
+                for (filename, content) in files:
+                    if self.verbose > verb_level2:
+                        log.debug(_("Write %(what)r into %(to)r.") % {
+                            'what': content, 'to': filename})
+                    dirname = os.path.dirname(filename) or os.curdir
+                    if dirname not in dirs:
+                        dirs.append(dirname)
+                    tmp_name = self._write_content(
+                        filename, self._content_to_bytes(content),
+                        atomic=atomic, mode=mode)
+                    if tmp_name:
+                        renames.append((tmp_name, filename))
+
+                if sync != 'none':
+                    self._sync_filesystems(dirs)
+            except Exception:
+                for (tmp_name, filename) in renames:
+                    os.remove(tmp_name)
+                raise
+
+            while renames:
+                (tmp_name, filename) = renames.pop(0)
+                try:
+                    os.rename(tmp_name, filename)
+                except Exception:
+                    os.remove(tmp_name)
+                    for (tmp_name, filename) in renames:
+                        os.remove(tmp_name)
+                    raise
+
+            if atomic and sync == 'full':
+                self._sync_dirs(dirs)
         finally:
-            if self.verbose > verb_level3:
-                log.debug(_("Closing '%s' ..."), filename)
-            fh.close()
+            self._stop_alarm(alarm_state)
 
-        signal.alarm(0)
+    # -------------------------------------------------------------------------
+    def _sync_filesystems(self, dirs):
+        """
+        Syncs every filesystem containing one of the given directories
+        once by syncfs(2).
+        """
 
-        return
+        devices = set()
+        for dirname in dirs:
+            fd = os.open(dirname, os.O_RDONLY)
+            try:
+                dev = os.fstat(fd).st_dev
+                if dev in devices:
+                    continue
+                devices.add(dev)
+                if self.verbose > 3:
+                    log.debug(_("Syncing filesystem of %r ..."), dirname)
+                syncfs(fd)
+            finally:
+                os.close(fd)
+
+    # -------------------------------------------------------------------------
+    def _get_throttle(self, throttle):
+        """
+        Gives back an IoThrottle object for the throttle argument
+        of dump_data() and dump_zeroes(), or None for no limit.
+
+        @raise PbBaseHandlerError: on an invalid rate
+
+        """
+
+        if throttle is None or isinstance(throttle, IoThrottle):
+            return throttle
+        try:
+            return IoThrottle(bytes_per_sec=throttle)
+        except ValueError as e:
+            raise PbBaseHandlerError(str(e))
+
+    # -------------------------------------------------------------------------
+    def _check_cache_args(self, blocksize, direct, cache_policy):
+        """
+        Checks the arguments for O_DIRECT and the page cache policy
+        of dump_data() and dump_zeroes().
+
+        @raise PbBaseHandlerError: on invalid arguments
+
+        """
+
+        if direct and int(blocksize) % DIRECT_ALIGNMENT:
+            msg = _(
+                "The blocksize %(bs)d must be a multiple of %(al)d "
+                "for direct I/O.") % {'bs': blocksize, 'al': DIRECT_ALIGNMENT}
+            raise PbBaseHandlerError(msg)
+
+        if cache_policy is not None and cache_policy not in CACHE_POLICIES:
+            msg = _("Invalid page cache policy %r.") % (cache_policy)
+            raise PbBaseHandlerError(msg)
 
     # -------------------------------------------------------------------------
     def dump_data(
         self, source, target, blocksize=(1024*1024),
-            iseek=0, oseek=0, raise_on_full=True):
+            iseek=0, oseek=0, raise_on_full=True, nice=None,
+            ionice_class=None, ionice_level=None, engine='auto', sparse=False,
+            streams=1, direct=False, cache_policy=None, sync_interval=None,
+            checksum=None, verify=False, progress=None, progress_interval=1.0,
+            checkpoint_file=None, checkpoint_interval=None, resume=False,
+            throttle=None):
         """
         Dumping the content of source into the target.
 
+        The data are copied by the kernel (copy_file_range(), sendfile()
+        or splice()), if possible, else through a reused buffer,
+        see pb_base.copy_engine.copy_fd().
+
         @raise PbBaseHandlerError: on some error.
 
         @param source: the file or device name of the source
@@ -771,15 +2126,103 @@ class PbBaseHandler(PbBaseObject):
         @param raise_on_full: raise an IOError, if the output device is full,
                               else through only a debug message.
         @type raise_on_full: bool
-
-        @return: success of copying
-        @rtype: bool
+        @param nice: increment of the niceness of the copying thread
+        @type nice: int or None
+        @param ionice_class: the I/O scheduling class of the copying thread,
+                             see pb_base.syscalls.ioprio_class()
+        @type ionice_class: int or str or None
+        @param ionice_level: the level inside the I/O scheduling class (0 - 7)
+        @type ionice_level: int or None
+        @param engine: the copy engine to start with, one of
+                       'copy_file_range', 'sendfile', 'splice', 'readinto'
+                       or 'auto'
+        @type engine: str
+        @param sparse: copy only the data extents of the source (found by
+                       SEEK_DATA and SEEK_HOLE), the holes are kept in the
+                       target by seeking (regular files) or by punching
+                       holes (block devices)
+        @type sparse: bool
+        @param streams: the number of parallel streams, if greater than 1,
+                        the range is split into windows, which are copied
+                        at the same time by pread() and pwrite(), if both
+                        source and target are regular files or block devices
+        @type streams: int
+        @param direct: open source and target with O_DIRECT and copy through
+                       page aligned buffers, bypassing the page cache,
+                       the blocksize must be a multiple of 512
+        @type direct: bool
+        @param cache_policy: the page cache policy, 'sequential' (announce
+                             sequential reading) or 'dontneed' (additionally
+                             drop the cached pages of source and target after
+                             every synchronisation), see
+                             pb_base.copy_engine.CacheControl
+        @type cache_policy: str or None
+        @param sync_interval: execute fdatasync() on the target after every
+                              sync_interval copied bytes and at the end
+        @type sync_interval: int or None
+        @param checksum: compute a checksum of the copied data in the same
+                         pass, 'crc64' or the name of a hashlib algorithm,
+                         see pb_base.crc.new_hash(), the kernel copy engines
+                         and parallel streams are not used in this case
+        @type checksum: str or None
+        @param verify: re-read the target after copying and compare its
+                       checksum with the checksum of the copied data,
+                       a checksum of 'md5' is used, if none was given
+        @type verify: bool
+        @param progress: a function called at most every progress_interval
+                         seconds with a dictionary with the keys 'bytes',
+                         'total', 'elapsed', 'rate', 'eta' and 'finished',
+                         see pb_base.copy_engine.ProgressMeter
+        @type progress: callable or None
+        @param progress_interval: the minimum time between two progress calls
+        @type progress_interval: float
+        @param checkpoint_file: the name of a file to write checkpoint records
+                                (offset and partial checksum) into, it's
+                                removed after a successful copy, parallel
+                                streams are not used in this case
+        @type checkpoint_file: str or None
+        @param checkpoint_interval: the number of bytes between two
+                                    checkpoints, default 256 MiB
+        @type checkpoint_interval: int or None
+        @param resume: resume the copy from the record in checkpoint_file,
+                       if it exists and belongs to the same copy, if a
+                       checksum was requested, the already copied data in the
+                       target are checked against the partial checksum
+        @type resume: bool
+        @param throttle: limits the bandwidth and the I/O operations of the
+                         copy, a pb_base.throttle.IoThrottle object (which
+                         may be changed during the copy) or a maximum
+                         bandwidth like 52428800 or '50M'
+        @type throttle: IoThrottle or int or str or None
+
+        @return: success of copying, or the hexadecimal digest of the copied
+                 data, if a checksum was requested
+        @rtype: bool or str
         """
 
         msg = _("Dumping data from %(src)r to %(tgt)r ...") % {
             'src': source, 'tgt': target}
         log.debug(msg)
 
+        if engine is None:
+            engine = 'auto'
+        if engine != 'auto' and engine not in COPY_ENGINES:
+            msg = _("Invalid copy engine %r.") % (engine)
+            raise PbBaseHandlerError(msg)
+        self._check_cache_args(blocksize, direct, cache_policy)
+        io_throttle = self._get_throttle(throttle)
+
+        if verify and not checksum:
+            checksum = 'md5'
+        hasher = None
+        if checksum:
+            try:
+                hasher = new_hash(checksum)
+            except ValueError as e:
+                msg = _("Invalid checksum algorithm %(alg)r: %(msg)s") % {
+                    'alg': checksum, 'msg': e}
+                raise PbBaseHandlerError(msg)
+
         if self.simulate:
             return True
 
@@ -790,12 +2233,25 @@ class PbBaseHandler(PbBaseObject):
         if oseek:
             output_seek = int(oseek) * int(blocksize)
 
-        src_fh = None
-        target_fh = None
+        cp_info = {
+            'source': source, 'target': target,
+            'input_seek': input_seek, 'output_seek': output_seek}
+        resume_offset = 0
+        record = None
+        if checkpoint_file and resume:
+            record = CopyCheckpoint.load(checkpoint_file)
+            resume_offset = self._checkpoint_offset(record, cp_info, checksum)
+
+        src_fd = None
+        target_fd = None
         if self.verbose > 1:
             log.debug(_("Opening %r for read."), source)
+        open_flags = 0
+        if direct:
+            open_flags = O_DIRECT
+            engine = 'readinto'
         try:
-            src_fh = open(source, 'rb', -1)
+            src_fd = os.open(source, os.O_RDONLY | open_flags)
         except Exception as e:
             msg = _("Error opening source %(src)r: %(msg)s") % {
                 'src': source, 'msg': e}
@@ -805,10 +2261,12 @@ class PbBaseHandler(PbBaseObject):
         if self.verbose > 1:
             log.debug(_("Opening %r for write"), target)
         try:
-            target_fh = open(target, 'wb', -1)
+            if not resume_offset:
+                open_flags |= os.O_TRUNC
+            target_fd = os.open(target, os.O_WRONLY | os.O_CREAT | open_flags, 0o666)
         except Exception as e:
             error_tuple = sys.exc_info()
-            src_fh.close()
+            os.close(src_fd)
             msg = _("Error opening target %(tgt)r: %(msg)s") % {
                 'tgt': target, 'msg': e}
             reraise(PbBaseHandlerError, msg, error_tuple[2])
@@ -817,25 +2275,145 @@ class PbBaseHandler(PbBaseObject):
             log.debug(_(
                 "Copying (buffer size %d Bytes)..."), blocksize)
 
-        blocks_written = 0
+        if resume_offset and hasher:
+            if not self._resume_checksum(
+                    target, output_seek, resume_offset, hasher,
+                    record.get('partial_digest'), blocksize):
+                resume_offset = 0
+                hasher = new_hash(checksum)
+                if stat.S_ISREG(os.fstat(target_fd).st_mode):
+                    os.ftruncate(target_fd, 0)
+        if resume_offset:
+            log.info(_(
+                "Resuming copy of %(src)r to %(tgt)r at offset %(off)d (%(human)s).") % {
+                'src': source, 'tgt': target, 'off': resume_offset,
+                'human': bytes2human(resume_offset)})
+            input_seek += resume_offset
+            output_seek += resume_offset
+
+        counter = {
+            'bytes': 0, 'engine': None, 'holes': 0, 'hashed': resume_offset,
+            'pos': resume_offset}
+
+        meter = None
+        if progress:
+            total = None
+            src_mode = os.fstat(src_fd).st_mode
+            if stat.S_ISREG(src_mode) or stat.S_ISBLK(src_mode):
+                total = max(fd_size(src_fd) - cp_info['input_seek'], 0)
+            meter = ProgressMeter(total, progress, progress_interval, start=resume_offset)
+
+        checkpoint = None
+        if checkpoint_file:
+            checkpoint = CopyCheckpoint(
+                checkpoint_file, target_fd, cp_info, checkpoint_interval,
+                hasher=hasher, checksum=checksum)
+
+        def count_bytes(nbytes):
+            counter['bytes'] += nbytes
+            counter['pos'] += nbytes
+            if io_throttle:
+                io_throttle(nbytes)
+            if meter:
+                meter(nbytes)
+            if checkpoint:
+                checkpoint.offset = counter['pos']
+                checkpoint(nbytes)
+
+        if hasher:
+            def hash_data(view):
+                hasher.update(view)
+                counter['hashed'] += len(view)
+        else:
+            hash_data = None
+
+        cache_ctrl = CacheControl(
+            src_fd, target_fd, cache_policy, sync_interval, callback=count_bytes)
+        (buf, buf_view) = (None, None)
+        if direct:
+            (buf, buf_view) = aligned_buffer(blocksize)
+
+        def copy_blocks():
+            (copied, used_engine) = copy_fd(
+                src_fd, target_fd, blocksize=blocksize,
+                engine=engine, callback=cache_ctrl, buf=buf_view,
+                data_callback=hash_data)
+            counter['engine'] = used_engine
+
+        def copy_extents():
+            src_size = fd_size(src_fd)
+            target_is_file = stat.S_ISREG(os.fstat(target_fd).st_mode)
+            pos = input_seek
+            for (offset, length) in data_extents(src_fd, input_seek, src_size):
+                if offset > pos:
+                    counter['holes'] += offset - pos
+                    if hasher:
+                        update_zeroes(hasher, offset - pos, blocksize)
+                        counter['hashed'] += offset - pos
+                    if not target_is_file:
+                        punch_hole(
+                            target_fd, output_seek + pos - input_seek,
+                            offset - pos, blocksize)
+                os.lseek(src_fd, offset, os.SEEK_SET)
+                os.lseek(target_fd, output_seek + offset - input_seek, os.SEEK_SET)
+                counter['pos'] = offset - cp_info['input_seek']
+                (copied, used_engine) = copy_fd(
+                    src_fd, target_fd, length, blocksize=blocksize,
+                    engine=engine, callback=cache_ctrl, buf=buf_view,
+                    data_callback=hash_data)
+                counter['engine'] = used_engine
+                pos = offset + length
+            if src_size > pos:
+                counter['holes'] += src_size - pos
+                if hasher:
+                    update_zeroes(hasher, src_size - pos, blocksize)
+                    counter['hashed'] += src_size - pos
+                if not target_is_file:
+                    punch_hole(
+                        target_fd, output_seek + pos - input_seek,
+                        src_size - pos, blocksize)
+            if target_is_file:
+                os.ftruncate(target_fd, output_seek + max(src_size - input_seek, 0))
+            counter['pos'] = max(src_size - cp_info['input_seek'], 0)
+
+        def copy_parallel():
+            length = max(fd_size(src_fd) - input_seek, 0)
+            parallel_copy(
+                src_fd, target_fd, input_seek, output_seek, length,
+                streams=streams, blocksize=blocksize, sparse=sparse,
+                callback=cache_ctrl)
+            counter['engine'] = 'pread/pwrite'
+            if sparse and stat.S_ISREG(os.fstat(target_fd).st_mode):
+                os.ftruncate(target_fd, output_seek + length)
+
+        def copy_data():
+            cache_ctrl.start()
+            if (streams and streams > 1 and not hasher and not checkpoint and
+                    parallel_copy_possible(src_fd, target_fd)):
+                copy_parallel()
+            elif sparse:
+                copy_extents()
+            else:
+                copy_blocks()
+            cache_ctrl.finish()
+            if meter:
+                meter.finish()
+            if checkpoint:
+                checkpoint.remove()
 
         try:
             if input_seek:
                 log.debug(_(
                     "Seeking %(bytes)d Bytes (%(human)s) in input to %(src)r.") % {
                     'bytes': input_seek, 'human': bytes2human(input_seek), 'src': source})
-                src_fh.seek(input_seek)
+                os.lseek(src_fd, input_seek, os.SEEK_SET)
             if output_seek:
                 log.debug(_(
                     "Seeking %(bytes)d Bytes (%(human)s) in output to %(tgt)r.") % {
                     'bytes': output_seek, 'human': bytes2human(output_seek), 'tgt': target})
-                target_fh.seek(output_seek)
-            cache = src_fh.read(blocksize)
-            while cache != '':
-                target_fh.write(cache)
-                blocks_written += 1
-                cache = src_fh.read(blocksize)
-        except IOError as e:
+                os.lseek(target_fd, output_seek, os.SEEK_SET)
+            self._run_io_prioritized(copy_data, nice, ionice_class, ionice_level)
+        except (IOError, OSError) as e:
             if e.errno == errno.ENOSPC:
                 if raise_on_full:
                     raise
@@ -849,23 +2427,175 @@ class PbBaseHandler(PbBaseObject):
                 'src': source, 'tgt': target, 'msg': e}
             reraise(PbBaseHandlerError, msg, error_tuple[2])
         finally:
-            src_fh.close()
-            target_fh.close()
-            bytes_written = int(blocks_written) * int(blocksize)
+            os.close(src_fd)
+            os.close(target_fd)
+            if direct:
+                release_buffer(buf, buf_view)
+            bytes_written = counter['bytes']
             written_human = bytes2human(bytes_written)
             log.debug(_(
                 "%(bytes)d Bytes (%(human)s) written to output device %(tgt)r.") % {
                 'bytes': bytes_written, 'human': written_human, 'tgt': target})
+            if counter['holes']:
+                log.debug(_(
+                    "%(bytes)d Bytes (%(human)s) of holes skipped in %(tgt)r.") % {
+                    'bytes': counter['holes'], 'human': bytes2human(counter['holes']),
+                    'tgt': target})
+            if counter['engine'] and self.verbose > 1:
+                log.debug(_("Used copy engine: %r."), counter['engine'])
+            if cache_ctrl.syncs and self.verbose > 1:
+                log.debug(_("Target %(tgt)r synchronized %(nr)d times.") % {
+                    'tgt': target, 'nr': cache_ctrl.syncs})
+
+        if not hasher:
+            return True
+
+        digest = hasher.hexdigest()
+        log.debug(_("%(alg)s checksum of the copied data: %(digest)s") % {
+            'alg': checksum, 'digest': digest})
+        if verify:
+            self._verify_checksum(
+                target, cp_info['output_seek'], counter['hashed'], checksum, digest,
+                blocksize)
+
+        return digest
+
+    # -------------------------------------------------------------------------
+    def _verify_checksum(self, target, offset, length, checksum, digest, blocksize):
+        """
+        Re-reads the given range of the target after a copy and compares
+        its checksum with the given digest, the target is synced and its
+        cached pages are dropped before, to read the data really from
+        the device (dirty pages would stay in the page cache otherwise).
+
+        @raise PbBaseHandlerError: on a different checksum or a read error
+
+        """
+
+        if self.verbose > 1:
+            log.debug(_("Verifying %(len)d Bytes of %(tgt)r ...") % {
+                'len': length, 'tgt': target})
+
+        hasher = new_hash(checksum)
+        try:
+            fd = os.open(target, os.O_RDONLY)
+            try:
+                if hasattr(os, 'posix_fadvise'):
+                    self._sync_for_verify(fd)
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                checksum_fd(fd, hasher, offset, length, blocksize)
+            finally:
+                os.close(fd)
+        except (IOError, OSError) as e:
+            msg = _("Error verifying target %(tgt)r: %(msg)s") % {
+                'tgt': target, 'msg': e}
+            raise PbBaseHandlerError(msg)
+
+        if hasher.hexdigest() != digest:
+            msg = _(
+                "Verification of %(tgt)r failed: %(alg)s checksum %(got)s "
+                "differs from the checksum %(exp)s of the copied data.") % {
+                'tgt': target, 'alg': checksum, 'got': hasher.hexdigest(),
+                'exp': digest}
+            raise PbBaseHandlerError(msg)
+
+        log.debug(_("Target %r successfully verified."), target)
+
+    # -------------------------------------------------------------------------
+    def _sync_for_verify(self, fd):
+        """
+        Writes back the dirty pages of the given file descriptor, because
+        POSIX_FADV_DONTNEED drops only clean pages from the page cache.
+        Files not supporting a sync (pipes, some character devices)
+        are ignored.
+
+        @param fd: the opened file descriptor of the target
+        @type fd: int
+
+        """
+
+        try:
+            if hasattr(os, 'fdatasync'):
+                os.fdatasync(fd)
+            else:
+                os.fsync(fd)
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.EROFS):
+                raise
+
+    # -------------------------------------------------------------------------
+    def _checkpoint_offset(self, record, cp_info, checksum):
+        """
+        Gives back the offset to resume a copy from the given checkpoint
+        record, or 0, if the record doesn't exist or belongs to another copy.
+        """
+
+        if not record:
+            return 0
+
+        for key in cp_info:
+            if record.get(key) != cp_info[key]:
+                log.warning(_(
+                    "Checkpoint record doesn't match the copy (%(key)s: %(rec)r "
+                    "instead of %(exp)r), starting from the beginning.") % {
+                    'key': key, 'rec': record.get(key), 'exp': cp_info[key]})
+                return 0
+
+        if checksum and record.get('checksum') != checksum:
+            log.warning(_(
+                "Checkpoint record has a checksum %(rec)r instead of %(exp)r, "
+                "starting from the beginning.") % {
+                'rec': record.get('checksum'), 'exp': checksum})
+            return 0
+
+        return int(record['offset'])
+
+    # -------------------------------------------------------------------------
+    def _resume_checksum(self, target, offset, length, hasher, digest, blocksize):
+        """
+        Feeds the given checksum object with the already copied data of an
+        interrupted copy from the target and compares the result with the
+        partial digest of the checkpoint record.
+
+        @return: whether the data in the target are matching the record
+        @rtype: bool
+
+        """
+
+        try:
+            fd = os.open(target, os.O_RDONLY)
+            try:
+                done = checksum_fd(fd, hasher, offset, length, blocksize)
+            finally:
+                os.close(fd)
+        except (IOError, OSError) as e:
+            log.warning(_("Could not read %(tgt)r for resuming: %(msg)s") % {
+                'tgt': target, 'msg': e})
+            return False
+
+        if done != length or hasher.copy().hexdigest() != digest:
+            log.warning(_(
+                "The already copied data in %r don't match the checkpoint, "
+                "starting from the beginning."), target)
+            return False
 
         return True
 
     # -------------------------------------------------------------------------
     def dump_zeroes(
         self, target, blocksize=(1024 * 1024),
-            seek=0, count=None, force=False):
+            seek=0, count=None, force=False, nice=None,
+            ionice_class=None, ionice_level=None, wipe_mode='auto',
+            direct=False, cache_policy=None, sync_interval=None,
+            progress=None, progress_interval=1.0, throttle=None):
         """
         Dumping blocks of binary zeroes into the target.
 
+        If the size of the range to wipe is known (count is given or the
+        target is a block device), it is zeroed by the kernel (BLKZEROOUT
+        or fallocate()), if possible, else the zeroes are written from one
+        reused page aligned buffer, see pb_base.copy_engine.zero_fd().
+
         @raise PbBaseHandlerError: on some error.
 
         @param target: the file or device name of the target
@@ -880,6 +2610,37 @@ class PbBaseHandler(PbBaseObject):
         @param force: don't raise an exception on a full device, even if
                       count is set
         @type force: bool
+        @param nice: increment of the niceness of the writing thread
+        @type nice: int or None
+        @param ionice_class: the I/O scheduling class of the writing thread,
+                             see pb_base.syscalls.ioprio_class()
+        @type ionice_class: int or str or None
+        @param ionice_level: the level inside the I/O scheduling class (0 - 7)
+        @type ionice_level: int or None
+        @param wipe_mode: the way to zero the target, one of 'zeroout',
+                          'discard' (block devices only, the device must
+                          give back zeroes for discarded blocks), 'zero_range',
+                          'punch', 'write' or 'auto'
+        @type wipe_mode: str
+        @param direct: open the target with O_DIRECT, the blocksize must be
+                       a multiple of 512
+        @type direct: bool
+        @param cache_policy: the page cache policy, 'sequential' or 'dontneed'
+                             (drop the cached pages of the target after every
+                             synchronisation), see dump_data()
+        @type cache_policy: str or None
+        @param sync_interval: execute fdatasync() on the target after every
+                              sync_interval written bytes and at the end
+        @type sync_interval: int or None
+        @param progress: a function called at most every progress_interval
+                         seconds with a progress dictionary, see dump_data()
+        @type progress: callable or None
+        @param progress_interval: the minimum time between two progress calls
+        @type progress_interval: float
+        @param throttle: limits the bandwidth and the I/O operations,
+                         see dump_data(), the kernel wipe modes are executed
+                         in chunks of blocksize in this case
+        @type throttle: IoThrottle or int or str or None
 
         @return: success of dumping
         @rtype: bool
@@ -888,6 +2649,14 @@ class PbBaseHandler(PbBaseObject):
         log.debug(_(
             "Dumping binary zeroes to %r ..."), target)
 
+        if wipe_mode is None:
+            wipe_mode = 'auto'
+        if wipe_mode != 'auto' and wipe_mode not in WIPE_MODES:
+            msg = _("Invalid wipe mode %r.") % (wipe_mode)
+            raise PbBaseHandlerError(msg)
+        self._check_cache_args(blocksize, direct, cache_policy)
+        io_throttle = self._get_throttle(throttle)
+
         if self.simulate:
             return True
 
@@ -895,14 +2664,15 @@ class PbBaseHandler(PbBaseObject):
         if seek:
             output_seek = int(seek) * int(blocksize)
 
-        block = to_utf8_or_bust(chr(0) * blocksize)
-
-        target_fh = None
+        target_fd = None
 
         if self.verbose > 1:
             log.debug(_("Opening %r for write"), target)
         try:
-            target_fh = open(target, 'wb', -1)
+            open_flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+            if direct:
+                open_flags |= O_DIRECT
+            target_fd = os.open(target, open_flags, 0o666)
         except Exception as e:
             error_tuple = sys.exc_info()
             msg = _(
@@ -913,7 +2683,45 @@ class PbBaseHandler(PbBaseObject):
         if self.verbose > 1:
             log.debug(_("Copying (buffer size %d Bytes)..."), blocksize)
 
-        blocks_written = 0
+        counter = {'bytes': 0, 'mode': None}
+
+        meter = {'obj': None}
+
+        def count_bytes(nbytes):
+            counter['bytes'] += nbytes
+            if io_throttle:
+                io_throttle(nbytes)
+            if meter['obj']:
+                meter['obj'](nbytes)
+
+        cache_ctrl = CacheControl(
+            None, target_fd, cache_policy, sync_interval, callback=count_bytes)
+
+        def write_blocks():
+            length = None
+            if count:
+                length = int(count) * int(blocksize)
+            device_full = False
+            if stat.S_ISBLK(os.fstat(target_fd).st_mode):
+                rest = max(fd_size(target_fd) - output_seek, 0)
+                if length is None or length > rest:
+                    length = rest
+                    device_full = True
+            if progress:
+                meter['obj'] = ProgressMeter(length, progress, progress_interval)
+            cache_ctrl.start()
+            chunksize = None
+            if io_throttle or progress:
+                chunksize = blocksize
+            (zeroed, used_mode) = zero_fd(
+                target_fd, output_seek, length, mode=wipe_mode,
+                blocksize=blocksize, callback=cache_ctrl, chunksize=chunksize)
+            counter['mode'] = used_mode
+            cache_ctrl.finish()
+            if meter['obj']:
+                meter['obj'].finish()
+            if device_full:
+                raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
 
         try:
             if output_seek:
@@ -922,14 +2730,9 @@ class PbBaseHandler(PbBaseObject):
                     'bytes': output_seek, 'human': bytes2human(output_seek),
                     'tgt': target}
                 log.debug(msg)
-                target_fh.seek(output_seek)
-            while True:
-                target_fh.write(block)
-                blocks_written += 1
-                if count and blocks_written >= count:
-                    break
-        except IOError as e:
-            if e.errno == 28:
+            self._run_io_prioritized(write_blocks, nice, ionice_class, ionice_level)
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOSPC:
                 if count and not force:
                     raise
                 else:
@@ -945,13 +2748,15 @@ class PbBaseHandler(PbBaseObject):
             self.handle_error(msg, e.__class__.__name__, True)
             reraise(PbBaseHandlerError, msg, error_tuple[2])
         finally:
-            target_fh.close()
-            bytes_written = int(blocks_written) * int(blocksize)
+            os.close(target_fd)
+            bytes_written = counter['bytes']
             written_human = bytes2human(bytes_written)
             msg = _(
                 "%(bytes)d Bytes (%(human)s) written to output device %(tgt)r.") % {
                 'bytes': bytes_written, 'human': written_human, 'tgt': target}
             log.debug(msg)
+            if counter['mode'] and self.verbose > 1:
+                log.debug(_("Used wipe mode: %r."), counter['mode'])
 
         return True
 
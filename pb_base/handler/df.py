@@ -9,8 +9,21 @@
 
 # Standard modules
 import os
+import errno
 import logging
 import re
+import stat
+import time
+import threading
+from array import array
+
+# Third party modules
+from six.moves import queue
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # Own modules
 from pb_base.object import PbBaseObject
@@ -19,9 +32,16 @@ from pb_base.handler import PbBaseHandlerError
 from pb_base.handler import CommandNotFoundError
 from pb_base.handler import PbBaseHandler
 
+from pb_base.handler.singleflight import SingleFlight
+
+from pb_base.mountinfo import MOUNTINFO_FILE, read_mountinfo, find_mount
+from pb_base.mountinfo import MountTableCache
+
+from pb_base.syscalls import libc
+
 from pb_base.translate import pb_gettext, pb_ngettext
 
-__version__ = '0.3.3'
+__version__ = '0.5.3'
 
 log = logging.getLogger(__name__)
 
@@ -31,6 +51,22 @@ __ = pb_ngettext
 # Some module varriables
 DF_CMD = os.sep + os.path.join('bin', 'df')
 
+# The backends of DfHandler: 'command' executes the df command,
+# 'native' reads the mount table and calls statvfs() for each mount
+DF_BACKENDS = ('command', 'native')
+
+# The number of worker threads for statvfs() calls with timeouts
+STATVFS_WORKERS = 8
+
+# The maximum number of worker threads including the threads hanging
+# in a statvfs() call of a dead mount
+STATVFS_MAX_THREADS = 64
+
+# The NumPy types of the typecodes of the numerical columns of DfTable
+NUMPY_TYPES = {}
+if numpy is not None:
+    NUMPY_TYPES = {'q': numpy.int64, 'd': numpy.float64, 'b': numpy.int8}
+
 
 # =============================================================================
 class DfError(PbBaseHandlerError):
@@ -47,7 +83,7 @@ class DfResult(PbBaseObject):
     # -------------------------------------------------------------------------
     def __init__(
         self, dev=None, fs_type=None, total=0, used=0, free=0, fs=None,
-            appname=None, verbose=0, base_dir=None):
+            appname=None, verbose=0, base_dir=None, timed_out=False):
         """
         Initialisation of the DfResult object.
 
@@ -63,6 +99,8 @@ class DfResult(PbBaseObject):
         @type free: long
         @param fs: the name of the filesystem
         @type fs: str
+        @param timed_out: the filesystem didn't answer in time, all sizes are 0
+        @type timed_out: bool
 
         """
 
@@ -109,6 +147,12 @@ class DfResult(PbBaseObject):
         @type: str
         """
 
+        self._timed_out = bool(timed_out)
+        """
+        @ivar: the filesystem didn't answer in time
+        @type: bool
+        """
+
         self.initialized = True
 
     # -----------------------------------------------------------
@@ -183,6 +227,12 @@ class DfResult(PbBaseObject):
         """The name of the filesystem."""
         return self._fs
 
+    # -----------------------------------------------------------
+    @property
+    def timed_out(self):
+        """The filesystem didn't answer in time, all sizes are 0."""
+        return self._timed_out
+
     # -----------------------------------------------------------
     @property
     def used_percent(self):
@@ -226,10 +276,561 @@ class DfResult(PbBaseObject):
         res['free_kb'] = self.free_kb
         res['free_mb'] = self.free_mb
         res['free_percent'] = self.free_percent
+        res['timed_out'] = self.timed_out
+
+        return res
+
+
+# =============================================================================
+class DfTable(object):
+    """
+    A columnar result of DfHandler, it's more compact and faster than a list
+    of DfResult objects on hosts with many mounts. The sizes are stored in
+    arrays of the module array, the derived columns are computed once for
+    the whole table on first access. The columns are available by
+    table[name] or table.column(name), numerical columns as NumPy arrays
+    by table.as_numpy(name), if NumPy is installed.
+
+    With NumPy the derived columns are NumPy arrays, and they are computed,
+    filtered and sorted vectorized, else arrays of the module array and
+    loops are used.
+
+    The percentage columns contain NaN for filesystems without a size.
+    """
+
+    # the base columns in the order of a row
+    columns = ('dev', 'fs_type', 'total', 'used', 'free', 'fs', 'timed_out')
+
+    size_columns = ('total', 'used', 'free')
+
+    derived_columns = (
+        'total_kb', 'total_mb', 'used_kb', 'used_mb', 'free_kb', 'free_mb',
+        'used_percent', 'free_percent')
+
+    # -------------------------------------------------------------------------
+    def __init__(self):
+
+        self._data = {
+            'dev': [],
+            'fs_type': [],
+            'total': array('q'),
+            'used': array('q'),
+            'free': array('q'),
+            'fs': [],
+            'timed_out': array('b'),
+        }
+        self._derived = {}
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Creates a DfTable from rows of (dev, fs_type, total, used, free,
+        fs, timed_out).
+        """
+
+        table = cls()
+        for row in rows:
+            table.append(*row)
+        return table
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_results(cls, df_list):
+        """Creates a DfTable from a list of DfResult objects."""
+
+        table = cls()
+        for r in df_list:
+            table.append(r.dev, r.fs_type, r.total, r.used, r.free, r.fs, r.timed_out)
+        return table
+
+    # -------------------------------------------------------------------------
+    def append(self, dev, fs_type, total, used, free, fs, timed_out=False):
+        """Appends the values of a filesystem."""
+
+        data = self._data
+        data['dev'].append(dev)
+        data['fs_type'].append(fs_type)
+        data['total'].append(total)
+        data['used'].append(used)
+        data['free'].append(free)
+        data['fs'].append(fs)
+        data['timed_out'].append(1 if timed_out else 0)
+        self._derived = {}
+
+    # -------------------------------------------------------------------------
+    def __len__(self):
+        return len(self._data['fs'])
+
+    # -------------------------------------------------------------------------
+    def __getitem__(self, name):
+        return self.column(name)
+
+    # -------------------------------------------------------------------------
+    def column(self, name):
+        """
+        Gives back a column, the list or array must not be changed.
+
+        @raise KeyError: on an unknown column
+
+        """
+
+        if name in self._data:
+            return self._data[name]
+        if name not in self.derived_columns:
+            raise KeyError(_("Unknown column %r.") % (name))
+
+        col = self._derived.get(name)
+        if col is None:
+            col = self._compute(name)
+            self._derived[name] = col
+        return col
+
+    # -------------------------------------------------------------------------
+    def _numpy_column(self, name):
+        """Gives back a copy of a base column as a NumPy array."""
+
+        col = self._data[name]
+        if isinstance(col, array):
+            return numpy.array(col, dtype=NUMPY_TYPES[col.typecode])
+        return numpy.array(col, dtype=object)
+
+    # -------------------------------------------------------------------------
+    def _compute(self, name):
+
+        (base, unit) = name.rsplit('_', 1)
+        values = self._data[base]
+
+        if numpy is not None:
+            values = self._numpy_column(base)
+            if unit == 'kb':
+                return values / 1024.0
+            if unit == 'mb':
+                return values // 1048576
+            total = self._numpy_column('total')
+            return numpy.divide(
+                values * 100.0, total, out=numpy.full(len(values), numpy.nan),
+                where=total > 0)
+
+        if unit == 'kb':
+            return array('d', [v / 1024.0 for v in values])
+        if unit == 'mb':
+            return array('q', [v // 1048576 for v in values])
+
+        nan = float('nan')
+        return array('d', [
+            (v * 100.0 / t if t else nan) for (v, t) in zip(values, self._data['total'])])
+
+    # -------------------------------------------------------------------------
+    def as_numpy(self, name):
+        """
+        Gives back a numerical column as a NumPy array. Base columns are
+        copied (a view would prevent appending to the table), derived
+        columns are given back directly and must not be changed.
+
+        @raise DfError: if NumPy is not installed or on a not numerical column
+
+        """
+
+        if numpy is None:
+            raise DfError(_("NumPy is not installed."))
+        col = self.column(name)
+        if isinstance(col, numpy.ndarray):
+            return col
+        if not isinstance(col, array):
+            raise DfError(_("Column %r is not numerical.") % (name))
+        return self._numpy_column(name)
+
+    # -------------------------------------------------------------------------
+    def row(self, idx):
+        """Gives back a row as a tuple in the order of the columns."""
+
+        data = self._data
+        return (
+            data['dev'][idx], data['fs_type'][idx], data['total'][idx],
+            data['used'][idx], data['free'][idx], data['fs'][idx],
+            bool(data['timed_out'][idx]))
+
+    # -------------------------------------------------------------------------
+    def rows(self):
+        """Iterates over all rows, see row()."""
+
+        for idx in range(len(self)):
+            yield self.row(idx)
+
+    # -------------------------------------------------------------------------
+    def take(self, indices):
+        """Gives back a new DfTable with the rows of the given indices."""
+
+        table = self.__class__()
+        if numpy is not None:
+            indices = numpy.asarray(indices, dtype=numpy.intp)
+        for name in self.columns:
+            src = self._data[name]
+            if isinstance(src, array):
+                if numpy is not None:
+                    col = array(src.typecode)
+                    col.frombytes(self._numpy_column(name)[indices].tobytes())
+                    table._data[name] = col
+                else:
+                    table._data[name] = array(src.typecode, [src[i] for i in indices])
+            else:
+                table._data[name] = [src[i] for i in indices]
+        return table
+
+    # -------------------------------------------------------------------------
+    def filter(self, mask=None, **conditions):
+        """
+        Gives back a new DfTable with the selected rows::
+
+            full = table.filter([p > 90 for p in table['used_percent']])
+            local = table.filter(fs_type=('ext4', 'xfs'), timed_out=False)
+
+        @param mask: a boolean value per row
+        @type mask: iterable
+        @param conditions: columns with the required value, or a tuple,
+                           list or set of allowed values
+
+        @return: the filtered table
+        @rtype: DfTable
+
+        """
+
+        if numpy is not None:
+            return self.take(numpy.flatnonzero(self._numpy_mask(mask, conditions)))
+
+        selected = None
+        if mask is not None:
+            selected = [i for (i, ok) in enumerate(mask) if ok]
+
+        for (name, wanted) in conditions.items():
+            col = self.column(name)
+            if isinstance(wanted, (tuple, list, set, frozenset)):
+                wanted = set(wanted)
 
+                def ok(v):
+                    return v in wanted
+            else:
+                def ok(v):
+                    return v == wanted
+            if selected is None:
+                selected = [i for (i, v) in enumerate(col) if ok(v)]
+            else:
+                selected = [i for i in selected if ok(col[i])]
+
+        if selected is None:
+            selected = range(len(self))
+        return self.take(selected)
+
+    # -------------------------------------------------------------------------
+    def _numpy_mask(self, mask, conditions):
+        """Gives back the boolean mask of the rows selected by filter()."""
+
+        if mask is None:
+            selected = numpy.ones(len(self), dtype=bool)
+        else:
+            selected = numpy.array(list(mask), dtype=bool)
+        for (name, wanted) in conditions.items():
+            if name in self._data:
+                col = self._numpy_column(name)
+            else:
+                col = self.column(name)
+            if isinstance(wanted, (tuple, list, set, frozenset)):
+                values = numpy.empty(len(wanted), dtype=col.dtype)
+                values[:] = list(wanted)
+                selected &= numpy.isin(col, values)
+            else:
+                selected &= col == wanted
+        return selected
+
+    # -------------------------------------------------------------------------
+    def sort(self, column, reverse=False):
+        """
+        Gives back a new DfTable sorted by the given column, NaN values
+        of the percentage columns are sorted to the end.
+        """
+
+        if numpy is not None:
+            if column in self._data:
+                col = self._numpy_column(column)
+            else:
+                col = self.column(column)
+            if column.endswith('_percent'):
+                col = numpy.where(
+                    numpy.isnan(col), -numpy.inf if reverse else numpy.inf, col)
+            if not reverse:
+                return self.take(numpy.argsort(col, kind='stable'))
+            # descending, but equal values in their original order like sorted()
+            order = numpy.argsort(col[::-1], kind='stable')[::-1]
+            return self.take(len(col) - 1 - order)
+
+        col = self.column(column)
+        if column.endswith('_percent'):
+            nan_value = float('-inf') if reverse else float('inf')
+
+            def key(i):
+                v = col[i]
+                return nan_value if v != v else v
+        else:
+            key = col.__getitem__
+
+        return self.take(sorted(range(len(self)), key=key, reverse=reverse))
+
+    # -------------------------------------------------------------------------
+    def to_results(self, appname=None, verbose=0, base_dir=None):
+        """Converts the table into a list of DfResult objects."""
+
+        df_list = []
+        for row in self.rows():
+            df_list.append(DfResult(
+                dev=row[0], fs_type=row[1], total=row[2], used=row[3],
+                free=row[4], fs=row[5], timed_out=row[6],
+                appname=appname, verbose=verbose, base_dir=base_dir))
+        return df_list
+
+    # -------------------------------------------------------------------------
+    def as_dict(self):
+        """Transforms the table into a dict of lists of the base columns."""
+
+        res = {'__class__': self.__class__.__name__}
+        for name in self.columns:
+            res[name] = list(self._data[name])
+        res['timed_out'] = [bool(x) for x in res['timed_out']]
         return res
 
 
+# =============================================================================
+class MountProbe(object):
+    """
+    The result of stat() and statvfs() of a mount point, executed
+    by a StatvfsPool.
+    """
+
+    __slots__ = (
+        'mount_point', 'need_dev', 'dev', 'statvfs', 'error', 'submitted',
+        'started', 'finished', 'lost', 'timed_out', 'event')
+
+    # -------------------------------------------------------------------------
+    def __init__(self, mount_point, need_dev=False):
+
+        self.mount_point = mount_point
+        self.need_dev = need_dev
+        self.dev = None
+        self.statvfs = None
+        self.error = None
+        self.submitted = None
+        self.started = None
+        self.finished = False
+        self.lost = False
+        self.timed_out = False
+        self.event = threading.Event()
+
+    # -------------------------------------------------------------------------
+    def run(self):
+        """Executes stat() (if needed) and statvfs() of the mount point."""
+
+        if self.need_dev:
+            try:
+                self.dev = os.stat(self.mount_point).st_dev
+            except OSError:
+                pass
+        try:
+            self.statvfs = os.statvfs(self.mount_point)
+        except OSError as e:
+            self.error = e
+
+
+# =============================================================================
+class PathProbe(MountProbe):
+    """
+    The resolving of a filesystem object given to DfHandler, executed by
+    a StatvfsPool like a MountProbe, because it may hang on a dead mount.
+    For a block device also the given mount sources are resolved.
+    """
+
+    __slots__ = ('real_path', 'mode', 'sources')
+
+    # -------------------------------------------------------------------------
+    def __init__(self, path, sources=None):
+
+        super(PathProbe, self).__init__(path)
+        self.real_path = None
+        self.mode = None
+        self.sources = sources or []
+
+    # -------------------------------------------------------------------------
+    def run(self):
+        """Resolves the path and the mount sources of a block device."""
+
+        try:
+            self.real_path = os.path.realpath(self.mount_point)
+            self.mode = os.stat(self.real_path).st_mode
+        except OSError as e:
+            self.error = e
+            return
+        if not stat.S_ISBLK(self.mode):
+            return
+        resolved = {}
+        for source in self.sources:
+            if os.path.exists(source):
+                resolved[source] = os.path.realpath(source)
+        self.sources = resolved
+
+
+# =============================================================================
+class SyncProbe(MountProbe):
+    """The execution of sync() by a StatvfsPool, see DfHandler.__call__()."""
+
+    __slots__ = ()
+
+    # -------------------------------------------------------------------------
+    def __init__(self):
+
+        super(SyncProbe, self).__init__('sync')
+
+    # -------------------------------------------------------------------------
+    def run(self):
+        """Writes back all dirty pages of all filesystems."""
+
+        libc().sync()
+
+
+# =============================================================================
+class StatvfsPool(object):
+    """
+    A pool of daemon threads executing MountProbe objects, so callers
+    can wait for them with a deadline. A system call on a dead network
+    or FUSE mount can't be interrupted, so a thread hanging longer than
+    the deadline is given up and replaced by a new thread, until the
+    maximum number of threads is reached. Probes given up before they
+    were started are skipped by the workers.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self, workers=STATVFS_WORKERS, max_threads=STATVFS_MAX_THREADS):
+
+        self.workers = workers
+        self.max_threads = max_threads
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = 0
+        self._idle = 0
+        self._lost = 0
+        self._queued = 0
+
+    # -------------------------------------------------------------------------
+    @property
+    def lost(self):
+        """The number of threads hanging in a given up system call."""
+        return self._lost
+
+    # -------------------------------------------------------------------------
+    def _spawn(self):
+        """
+        Starts new workers, while there are more queued probes than idle
+        workers, up to the number of workers (not counting the hanging
+        threads). Must be called with the lock.
+        """
+
+        while self._queued > self._idle and self._threads - self._lost < self.workers:
+            if self._threads >= self.max_threads:
+                log.warning(_(
+                    "Not starting a new statvfs worker, %d threads are hanging."),
+                    self._lost)
+                return
+            thread = threading.Thread(target=self._work, name='statvfs-worker')
+            thread.daemon = True
+            self._threads += 1
+            self._idle += 1
+            thread.start()
+
+    # -------------------------------------------------------------------------
+    def _work(self):
+
+        while True:
+            probe = self._queue.get()
+            with self._lock:
+                self._queued -= 1
+                if probe.lost:
+                    # given up, before it was started
+                    probe.finished = True
+                    probe.event.set()
+                    continue
+                self._idle -= 1
+                probe.started = time.time()
+            try:
+                probe.run()
+            finally:
+                with self._lock:
+                    probe.finished = True
+                    self._idle += 1
+                    if probe.lost:
+                        self._lost -= 1
+                probe.event.set()
+
+    # -------------------------------------------------------------------------
+    def submit(self, probe):
+        """Queues the given MountProbe for execution."""
+
+        probe.submitted = time.time()
+        with self._lock:
+            self._queued += 1
+            self._spawn()
+        self._queue.put(probe)
+
+    # -------------------------------------------------------------------------
+    def give_up(self, probe):
+        """
+        Gives up a running or still queued MountProbe after its deadline.
+
+        @return: False, if the probe finished in between
+        @rtype: bool
+
+        """
+
+        with self._lock:
+            if probe.finished:
+                return False
+            probe.lost = True
+            if probe.started is not None:
+                self._lost += 1
+                self._spawn()
+            return True
+
+    # -------------------------------------------------------------------------
+    def wait(self, probes, timeout):
+        """
+        Waits for the given submitted probes. Every probe has its own
+        deadline of timeout seconds from the start of its execution,
+        probes exceeding it are given up and marked as timed out. Probes
+        not started within timeout seconds after their submission (because
+        all threads are hanging) are given up and marked as timed out too.
+        """
+
+        pending = list(probes)
+        while pending:
+            now = time.time()
+            still_pending = []
+            wake = now + 0.05
+            for probe in pending:
+                if probe.finished:
+                    continue
+                started = probe.started
+                if started is not None:
+                    deadline = started + timeout
+                else:
+                    deadline = probe.submitted + timeout
+                if now >= deadline:
+                    if self.give_up(probe):
+                        probe.timed_out = True
+                    continue
+                wake = min(wake, deadline)
+                still_pending.append(probe)
+            pending = still_pending
+            if pending:
+                pending[0].event.wait(max(wake - now, 0.001))
+
+
 # =============================================================================
 class DfHandler(PbBaseHandler):
     """
@@ -237,17 +838,38 @@ class DfHandler(PbBaseHandler):
 
     An instance of this class may be used as a function, see method __call__().
 
+    Identical concurrent requests of all instances in the current process
+    are sharing one execution of 'df', see SingleFlight.
+
     """
 
+    single_flight = SingleFlight()
+
+    statvfs_pool = StatvfsPool()
+
+    # the probes of mounts, which didn't answer in time, by their mount points
+    isolated_mounts = {}
+    isolation_lock = threading.Lock()
+
+    # the mount table, read again only after a change, and the cached
+    # probes of the mounts by mount ID and mount point, shared by all
+    # instances using a cache TTL
+    mount_table = MountTableCache()
+    probe_cache = {}
+    cache_lock = threading.Lock()
+
     # -------------------------------------------------------------------------
     def __init__(
         self, appname=None, verbose=0, version=__version__, base_dir=None,
-            use_stderr=False, initialized=False, sudo=False, quiet=False):
+            use_stderr=False, initialized=False, sudo=False, quiet=False,
+            single_flight=True, backend='command', statvfs_timeout=None,
+            cache_ttl=None, cache_ttl_by_type=None):
         """
         Initialisation of the df handler object.
         The execution of executing 'df' should never been simulated.
 
-        @raise CommandNotFoundError: if the 'df' command could not be found.
+        @raise CommandNotFoundError: if the 'df' command could not be found
+                                     with the backend 'command'.
         @raise DfError: on a uncoverable error.
 
         @param appname: name of the current running application
@@ -269,6 +891,25 @@ class DfHandler(PbBaseHandler):
         @type sudo: bool
         @param quiet: don't display ouput of action after calling
         @type quiet: bool
+        @param single_flight: share the execution of identical concurrent
+                              requests with other threads
+        @type single_flight: bool
+        @param backend: the way to get the informations, 'command' executes
+                        the df command, 'native' reads the mount table from
+                        /proc/self/mountinfo and calls statvfs() for each
+                        mount without forking a process (and without sudo)
+        @type backend: str
+        @param statvfs_timeout: with the backend 'native' execute the
+                                statvfs() calls in parallel threads and wait
+                                at most this number of seconds for each mount
+        @type statvfs_timeout: float or None
+        @param cache_ttl: with the backend 'native' reuse the statvfs()
+                          results of a mount for this number of seconds,
+                          the mount table is cached until it's changed
+        @type cache_ttl: float or None
+        @param cache_ttl_by_type: cache TTLs for dedicated filesystem types,
+                                  overriding cache_ttl, 0 means no caching
+        @type cache_ttl_by_type: dict or None
 
         @return: None
         """
@@ -288,6 +929,51 @@ class DfHandler(PbBaseHandler):
 
         failed_commands = []
 
+        if backend not in DF_BACKENDS:
+            msg = _("Invalid df backend %(b)r, valid backends are: %(l)s.") % {
+                'b': backend, 'l': ', '.join(DF_BACKENDS)}
+            raise DfError(msg)
+
+        self._backend = backend
+        """
+        @ivar: the way to get the informations ('command' or 'native')
+        @type: str
+        """
+
+        if statvfs_timeout is not None:
+            statvfs_timeout = float(statvfs_timeout)
+            if backend != 'native':
+                raise DfError(_(
+                    "A statvfs timeout is only possible with the backend 'native'."))
+            if statvfs_timeout <= 0:
+                raise DfError(_("Invalid statvfs timeout %r.") % (statvfs_timeout))
+
+        self._statvfs_timeout = statvfs_timeout
+        """
+        @ivar: the maximum time in seconds to wait for statvfs() of a mount
+        @type: float or None
+        """
+
+        if (cache_ttl or cache_ttl_by_type) and backend != 'native':
+            raise DfError(_("Caching is only possible with the backend 'native'."))
+
+        self._cache_ttl = None
+        """
+        @ivar: the time in seconds to reuse statvfs() results of a mount
+        @type: float or None
+        """
+        if cache_ttl:
+            self._cache_ttl = float(cache_ttl)
+
+        self._cache_ttl_by_type = {}
+        """
+        @ivar: cache TTLs for dedicated filesystem types
+        @type: dict
+        """
+        if cache_ttl_by_type:
+            for (fstype, ttl) in cache_ttl_by_type.items():
+                self._cache_ttl_by_type[fstype] = float(ttl or 0)
+
         self._df_cmd = DF_CMD
         """
         @ivar: the underlaying 'df' command
@@ -296,9 +982,15 @@ class DfHandler(PbBaseHandler):
         if not os.path.exists(self.df_cmd) or not os.access(
                 self.df_cmd, os.X_OK):
             self._df_cmd = self.get_command('df')
-        if not self.df_cmd:
+        if not self.df_cmd and backend == 'command':
             failed_commands.append('df')
 
+        self._use_single_flight = bool(single_flight)
+        """
+        @ivar: share the execution of identical concurrent requests
+        @type: bool
+        """
+
         self.re_df_line = re.compile(
             r'(\S+)\s+(\S+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(?:\d+\s*%|-)\s+(.*)')
 
@@ -316,6 +1008,46 @@ class DfHandler(PbBaseHandler):
         """The absolute path to the OS command 'df'."""
         return self._df_cmd
 
+    # -----------------------------------------------------------
+    @property
+    def backend(self):
+        """The way to get the informations ('command' or 'native')."""
+        return self._backend
+
+    # -----------------------------------------------------------
+    @property
+    def statvfs_timeout(self):
+        """The maximum time in seconds to wait for statvfs() of a mount."""
+        return self._statvfs_timeout
+
+    # -----------------------------------------------------------
+    @property
+    def cache_ttl(self):
+        """The time in seconds to reuse statvfs() results of a mount."""
+        return self._cache_ttl
+
+    # -----------------------------------------------------------
+    @property
+    def cache_ttl_by_type(self):
+        """Cache TTLs for dedicated filesystem types."""
+        return dict(self._cache_ttl_by_type)
+
+    # -----------------------------------------------------------
+    @property
+    def use_cache(self):
+        """Are statvfs() results and the mount table cached."""
+        return bool(self._cache_ttl or self._cache_ttl_by_type)
+
+    # -----------------------------------------------------------
+    @property
+    def use_single_flight(self):
+        """Share the execution of identical concurrent requests."""
+        return self._use_single_flight
+
+    @use_single_flight.setter
+    def use_single_flight(self, value):
+        self._use_single_flight = bool(value)
+
     # -------------------------------------------------------------------------
     def as_dict(self, short=False):
         """
@@ -330,6 +1062,11 @@ class DfHandler(PbBaseHandler):
 
         res = super(DfHandler, self).as_dict(short=short)
         res['df_cmd'] = self.df_cmd
+        res['backend'] = self.backend
+        res['statvfs_timeout'] = self.statvfs_timeout
+        res['cache_ttl'] = self.cache_ttl
+        res['cache_ttl_by_type'] = self.cache_ttl_by_type
+        res['use_single_flight'] = self.use_single_flight
         res['re_df_line_pattern'] = self.re_df_line.pattern
 
         return res
@@ -337,7 +1074,7 @@ class DfHandler(PbBaseHandler):
     # -------------------------------------------------------------------------
     def __call__(
         self, fs=None, all_fs=False, local=False, sync=False,
-            fs_type=None, exclude_type=None):
+            fs_type=None, exclude_type=None, as_table=False):
         """
         Executes the df command and returns a list of all found filesystems.
 
@@ -371,9 +1108,12 @@ class DfHandler(PbBaseHandler):
                              ignored, if dedicated filesystems are given with
                              parameter fs
         @type exclude_type: None or list of str
+        @param as_table: give back a columnar DfTable instead of a list
+                         of DfResult objects
+        @type as_table: bool
 
         @return: informations about all requested filesystems
-        @rtype: list of DfResult
+        @rtype: list of DfResult or DfTable
 
         """
 
@@ -383,6 +1123,62 @@ class DfHandler(PbBaseHandler):
         else:
             fs = []
 
+        if not self.use_single_flight:
+            rows = self._exec_df(fs, all_fs, local, sync, fs_type, exclude_type)
+            return self._make_result(rows, as_table)
+
+        key = ('df', self.backend, self.statvfs_timeout, self.cache_ttl,
+               tuple(sorted(self._cache_ttl_by_type.items())), self.df_cmd, self.sudo,
+               tuple(fs), bool(all_fs), bool(local), bool(sync),
+               self._key_tuple(fs_type), self._key_tuple(exclude_type))
+        rows = self.single_flight.do(
+            key, self._exec_df, fs, all_fs, local, sync, fs_type, exclude_type)
+
+        return self._make_result(rows, as_table)
+
+    # -------------------------------------------------------------------------
+    def _make_result(self, rows, as_table=False):
+        """
+        Converts the result rows of _exec_df() into a DfTable or
+        a list of DfResult objects.
+        """
+
+        if as_table:
+            return DfTable.from_rows(rows)
+
+        df_list = []
+        for row in rows:
+            df_list.append(DfResult(
+                dev=row[0], fs_type=row[1], total=row[2], used=row[3],
+                free=row[4], fs=row[5], timed_out=row[6],
+                appname=self.appname, verbose=self.verbose,
+                base_dir=self.base_dir))
+        return df_list
+
+    # -------------------------------------------------------------------------
+    def _key_tuple(self, value):
+        """Converts a str or list parameter into a hashable key element."""
+
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return (value, )
+        return tuple(value)
+
+    # -------------------------------------------------------------------------
+    def _exec_df(self, fs, all_fs, local, sync, fs_type, exclude_type):
+        """
+        The underlaying execution of the df command, see __call__().
+
+        @return: the result rows as tuples of (dev, fs_type, total, used,
+                 free, fs, timed_out)
+        @rtype: list of tuple
+
+        """
+
+        if self.backend == 'native':
+            return self._exec_native(fs, all_fs, local, sync, fs_type, exclude_type)
+
         for fs_object in fs:
             if self.verbose > 2:
                 log.debug(_("Checking existence of %r ..."), fs_object)
@@ -468,18 +1264,379 @@ class DfHandler(PbBaseHandler):
                     'line': line, 'cmd': cmdline}
                 raise DfError(msg)
 
-            df_result = DfResult(
-                dev=match.group(1),
-                fs_type=match.group(2),
-                total=int(match.group(3)) * 1024,
-                used=int(match.group(4)) * 1024,
-                free=int(match.group(5)) * 1024,
-                fs=match.group(6),
-                appname=self.appname,
-                verbose=self.verbose,
-                base_dir=self.base_dir,
-            )
-            df_list.append(df_result)
+            df_list.append((
+                match.group(1), match.group(2), int(match.group(3)) * 1024,
+                int(match.group(4)) * 1024, int(match.group(5)) * 1024,
+                match.group(6), False))
+
+        return df_list
+
+    # -------------------------------------------------------------------------
+    def _type_selected(self, fstype, fs_type, exclude_type):
+        """Emulates the options --type and --exclude-type of df."""
+
+        if fs_type:
+            if isinstance(fs_type, str):
+                fs_type = [fs_type]
+            if fstype not in fs_type:
+                return False
+        if exclude_type:
+            if isinstance(exclude_type, str):
+                exclude_type = [exclude_type]
+            if fstype in exclude_type:
+                return False
+        return True
+
+    # -------------------------------------------------------------------------
+    def _filter_mounts(self, mounts, probes):
+        """
+        Removes the duplicate mounts of the same device like df does without
+        the option --all. The device of a mount is taken from stat() of the
+        mount point, so overmounted mounts are recognized.
+        """
+
+        entries = []
+        seen = {}
+
+        for entry in mounts:
+            dev = probes[entry.mount_id].dev
+            if dev is not None:
+                idx = seen.get(dev)
+                if idx is not None:
+                    old = entries[idx]
+                    nearer_root = len(old.mount_point) > len(entry.mount_point)
+                    below_root = len(old.root) < len(entry.root)
+                    if (entry.remote and old.remote and
+                            old.source != entry.source):
+                        pass
+                    elif (('/' in entry.source and '/' not in old.source) or
+                            (nearer_root and not below_root) or
+                            (old.source != entry.source and
+                                old.mount_point == entry.mount_point)):
+                        entries[idx] = entry
+                        continue
+                    else:
+                        continue
+                seen[dev] = len(entries)
+            entries.append(entry)
+
+        return entries
+
+    # -------------------------------------------------------------------------
+    def _cache_ttl_for(self, fstype):
+        """Gives back the cache TTL for the given filesystem type."""
+
+        return self._cache_ttl_by_type.get(fstype, self._cache_ttl)
+
+    # -------------------------------------------------------------------------
+    def _cached_probes(self, mounts, need_dev, sync):
+        """
+        Executes the probes of the given mounts like _probe_mounts() and
+        reuses the cached probes, which are younger than the cache TTL of
+        the filesystem type. New successful probes are put into the cache.
+        """
+
+        probes = {}
+        missing = []
+        now = time.time()
+
+        with self.cache_lock:
+            for entry in mounts:
+                ttl = self._cache_ttl_for(entry.fs_type)
+                cached = self.probe_cache.get((entry.mount_id, entry.mount_point))
+                if (ttl and not sync and cached is not None and
+                        now - cached[0] < ttl and
+                        (cached[1].dev is not None or not need_dev)):
+                    probes[entry.mount_id] = cached[1]
+                else:
+                    missing.append(entry)
+
+        if self.verbose > 2:
+            log.debug(_("Using %(c)d cached and %(n)d new results of statvfs().") % {
+                'c': len(probes), 'n': len(missing)})
+        if not missing:
+            return probes
+
+        new_probes = self._probe_mounts(missing, need_dev)
+        now = time.time()
+        with self.cache_lock:
+            for entry in missing:
+                probe = new_probes[entry.mount_id]
+                if probe.timed_out or probe.error is not None:
+                    continue
+                if self._cache_ttl_for(entry.fs_type):
+                    self.probe_cache[(entry.mount_id, entry.mount_point)] = (now, probe)
+        probes.update(new_probes)
+
+        return probes
+
+    # -------------------------------------------------------------------------
+    def _read_mounts(self):
+        """
+        Reads the mount table, with caching from the cached mount table.
+        After a change of the mount table the cached probes of vanished
+        mounts are removed.
+
+        @raise DfError: if the mount table could not be read
+
+        """
+
+        try:
+            if not self.use_cache:
+                return read_mountinfo()
+            reads = self.mount_table.reads
+            mounts = self.mount_table.get()
+        except (IOError, ValueError) as e:
+            raise DfError(_("Could not read mount table %(f)r: %(e)s") % {
+                'f': MOUNTINFO_FILE, 'e': e})
+
+        if self.mount_table.reads != reads:
+            keys = set([(entry.mount_id, entry.mount_point) for entry in mounts])
+            with self.cache_lock:
+                for key in list(self.probe_cache.keys()):
+                    if key not in keys:
+                        del self.probe_cache[key]
+
+        return mounts
+
+    # -------------------------------------------------------------------------
+    def _probe_mounts(self, mounts, need_dev):
+        """
+        Executes stat() (if needed for removing duplicates) and statvfs()
+        for all given mounts, in parallel threads with a deadline, if a
+        statvfs timeout was given.
+
+        Mounts, which didn't answer in time, are isolated. They are not
+        touched again (and reported as timed out), until the hanging system
+        call has returned.
+
+        @return: the probes of the mounts by their mount ID
+        @rtype: dict
+
+        """
+
+        probes = {}
+        if not self.statvfs_timeout:
+            for entry in mounts:
+                probe = MountProbe(entry.mount_point, need_dev)
+                probe.run()
+                probes[entry.mount_id] = probe
+            return probes
+
+        submitted = []
+        with self.isolation_lock:
+            for entry in mounts:
+                isolated = self.isolated_mounts.get(entry.mount_point)
+                if isolated is not None:
+                    if not isolated.finished:
+                        if self.verbose > 2:
+                            log.debug(_("Skipping isolated mount %r."), entry.mount_point)
+                        probes[entry.mount_id] = isolated
+                        continue
+                    log.info(_("Mount %r has recovered."), entry.mount_point)
+                    del self.isolated_mounts[entry.mount_point]
+                probe = MountProbe(entry.mount_point, need_dev)
+                probes[entry.mount_id] = probe
+                submitted.append(probe)
+
+        for probe in submitted:
+            self.statvfs_pool.submit(probe)
+        self.statvfs_pool.wait(submitted, self.statvfs_timeout)
+
+        with self.isolation_lock:
+            for probe in submitted:
+                if probe.timed_out:
+                    log.warning(_(
+                        "Mount %(mp)r didn't answer in %(to)s seconds, isolating it.") % {
+                        'mp': probe.mount_point, 'to': self.statvfs_timeout})
+                    self.isolated_mounts[probe.mount_point] = probe
+
+        return probes
+
+    # -------------------------------------------------------------------------
+    def _statvfs_row(self, entry, st):
+        """
+        Gives back a result row with the values df would show (rounded up
+        to KiBytes) from the result of statvfs() of the given mount.
+        """
+
+        bs = st.f_frsize or st.f_bsize
+
+        def kbytes(blocks):
+            return -(-blocks * bs // 1024) * 1024
+
+        return (
+            entry.source, entry.fs_type, kbytes(st.f_blocks),
+            kbytes(st.f_blocks - st.f_bfree), kbytes(st.f_bavail),
+            entry.mount_point, False)
+
+    # -------------------------------------------------------------------------
+    def _run_probes(self, probes):
+        """
+        Executes the given probes by the statvfs pool with the statvfs
+        timeout, or directly without a timeout.
+        """
+
+        if not self.statvfs_timeout:
+            for probe in probes:
+                probe.run()
+            return
+
+        for probe in probes:
+            self.statvfs_pool.submit(probe)
+        self.statvfs_pool.wait(probes, self.statvfs_timeout)
+
+    # -------------------------------------------------------------------------
+    def _sync(self):
+        """
+        Executes sync() by the statvfs pool, a hanging sync() (e.g. because
+        of a dead NFS mount) is given up after the statvfs timeout.
+        """
+
+        probe = SyncProbe()
+        self._run_probes([probe])
+        if probe.timed_out:
+            log.warning(_("sync() didn't finish in %s seconds, giving up."),
+                        self.statvfs_timeout)
+
+    # -------------------------------------------------------------------------
+    def _listed_mounts(self, fs, mounts):
+        """
+        Gives back the mounts of the filesystem objects given to __call__().
+
+        Mount points are found in the mount table without touching the
+        filesystem. All other objects are resolved by PathProbe objects
+        with the statvfs timeout, except objects on isolated mounts.
+        The mount of an object, which couldn't be resolved in time, is
+        searched by its normalized path.
+
+        @raise DfError: if an object doesn't exists or no mount was found
+
+        """
+
+        entries = {}
+        probes = []
+        for (i, fs_object) in enumerate(fs):
+            if not os.path.isabs(fs_object):
+                raise DfError(
+                    _("%r is not given as an absolute path.") % (fs_object))
+            path = os.path.normpath(fs_object)
+            entry = find_mount(mounts, path)
+            if entry is not None and entry.mount_point == path:
+                entries[i] = entry
+                continue
+            if entry is not None:
+                with self.isolation_lock:
+                    isolated = self.isolated_mounts.get(entry.mount_point)
+                if isolated is not None and not isolated.finished:
+                    entries[i] = entry
+                    continue
+            if self.verbose > 2:
+                log.debug(_("Checking existence of %r ..."), fs_object)
+            probe = PathProbe(fs_object, [m.source for m in mounts if m.source.startswith(os.sep)])
+            probes.append((i, probe))
+
+        self._run_probes([probe for (i, probe) in probes])
+
+        for (i, probe) in probes:
+            fs_object = probe.mount_point
+            if probe.timed_out:
+                log.warning(_(
+                    "Resolving %(obj)r didn't finish in %(to)s seconds.") % {
+                    'obj': fs_object, 'to': self.statvfs_timeout})
+                entry = find_mount(mounts, os.path.normpath(fs_object))
+            elif probe.error is not None:
+                if probe.error.errno == errno.ENOENT:
+                    raise DfError(
+                        _("Filesystem object %r doesn't exists.") % (fs_object))
+                msg = _("Error on examining %(obj)r: %(err)s") % {
+                    'obj': fs_object, 'err': probe.error}
+                raise DfError(msg)
+            else:
+                entry = None
+                if stat.S_ISBLK(probe.mode):
+                    for mount in mounts:
+                        if probe.sources.get(mount.source) == probe.real_path:
+                            entry = mount
+                            break
+                if entry is None:
+                    entry = find_mount(mounts, probe.real_path)
+            if entry is None:
+                raise DfError(_("No mount found for %r.") % (fs_object))
+            entries[i] = entry
+
+        return [entries[i] for i in range(len(fs))]
+
+    # -------------------------------------------------------------------------
+    def _exec_native(self, fs, all_fs, local, sync, fs_type, exclude_type):
+        """
+        The native emulation of 'df -k -P --print-type' by reading the mount
+        table and calling statvfs(), see __call__() and _exec_df().
+        """
+
+        if self.verbose > 1:
+            if fs:
+                msg = (_("Getting usage of the following objects:") + "\n%r") % (fs)
+            elif all_fs:
+                msg = _("Getting usage of real all filesystems.")
+            elif local:
+                msg = _("Getting usage of local filesystems.")
+            else:
+                msg = _("Getting usage of all filesystems.")
+            log.debug(msg)
+
+        mounts = self._read_mounts()
+
+        if sync:
+            self._sync()
+
+        listed = bool(fs)
+        if listed:
+            mounts = self._listed_mounts(fs, mounts)
+
+        selected = []
+        for entry in mounts:
+            if entry.remote and local:
+                continue
+            if entry.dummy and not all_fs and not listed:
+                continue
+            if not self._type_selected(entry.fs_type, fs_type, exclude_type):
+                continue
+            selected.append(entry)
+
+        need_dev = not all_fs and not listed
+        if self.use_cache:
+            probes = self._cached_probes(selected, need_dev, sync)
+        else:
+            probes = self._probe_mounts(selected, need_dev)
+        if need_dev:
+            selected = self._filter_mounts(selected, probes)
+
+        df_list = []
+        for entry in selected:
+            probe = probes[entry.mount_id]
+
+            if probe.timed_out:
+                df_list.append((
+                    entry.source, entry.fs_type, 0, 0, 0, entry.mount_point, True))
+                continue
+
+            if probe.error is not None:
+                e = probe.error
+                if listed or e.errno not in (errno.EACCES, errno.ENOENT):
+                    msg = _(
+                        "Error on getting free space of %(obj)r: %(err)s") % {
+                        'obj': entry.mount_point, 'err': e}
+                    raise DfError(msg)
+                if not all_fs:
+                    continue
+                df_list.append((entry.source, '-', 0, 0, 0, entry.mount_point, False))
+                continue
+
+            row = self._statvfs_row(entry, probe.statvfs)
+            if not row[2] and not all_fs and not listed:
+                continue
+            df_list.append(row)
 
         return df_list
 
@@ -0,0 +1,523 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, ProfitBricks GmbH, Berlin
+@summary: A module for watching the free space of filesystems with
+          watermark callbacks, polling a filesystem the more often,
+          the nearer it comes to its next watermark.
+"""
+
+# Standard modules
+import os
+import time
+import select
+import logging
+import threading
+
+# Own modules
+from pb_base.object import PbBaseObject
+
+from pb_base.handler.df import DfError
+from pb_base.handler.df import DfHandler
+
+from pb_base.mountinfo import MOUNTINFO_FILE, MountTableCache
+
+from pb_base.translate import pb_gettext, pb_ngettext
+
+__version__ = '0.1.1'
+
+log = logging.getLogger(__name__)
+
+_ = pb_gettext
+__ = pb_ngettext
+
+# Some module varriables
+
+# The default distance in percent between the high and the low watermark
+DEFAULT_HYSTERESIS = 5.0
+
+# Below this distance in percent to the next watermark the polling interval
+# is decreased proportionally from the maximum interval
+ADAPTIVE_HEADROOM = 20.0
+
+# The filesystem should not reach the next watermark earlier than after
+# this number of polling intervals with the current fill rate
+POLLS_BEFORE_WATERMARK = 4.0
+
+# The weight of a new measurement in the average fill rate
+RATE_WEIGHT = 0.3
+
+
+# =============================================================================
+class DfWatermark(object):
+    """
+    A watermark of the used space of filesystems with a hysteresis. The
+    callback is called with the event 'high', if the used space reaches
+    the high watermark, and with the event 'low', if it falls again below
+    the low watermark.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self, high, callback, low=None, fs=None):
+        """
+        @raise ValueError: on invalid watermarks
+
+        @param high: the high watermark in percent of used space
+        @type high: float
+        @param callback: the function to call as callback(event, df_result,
+                         watermark) from the thread of the watcher
+        @type callback: callable
+        @param low: the low watermark, defaults to high - DEFAULT_HYSTERESIS
+        @type low: float or None
+        @param fs: the mount point of the filesystem to watch, None means
+                   all watched filesystems
+        @type fs: str or None
+
+        """
+
+        self.high = float(high)
+        if low is None:
+            low = self.high - DEFAULT_HYSTERESIS
+        self.low = float(low)
+        if self.high <= 0 or self.high > 100:
+            raise ValueError(_("Invalid high watermark %r.") % (high))
+        if self.low >= self.high:
+            raise ValueError(_(
+                "The low watermark %(l)r must be lower than the high watermark %(h)r.") % {
+                'l': low, 'h': high})
+        self.callback = callback
+        self.fs = fs
+
+    # -------------------------------------------------------------------------
+    def matches(self, fs):
+        """Is the given mount point watched by this watermark."""
+        return self.fs is None or self.fs == fs
+
+    # -------------------------------------------------------------------------
+    def __repr__(self):
+
+        return "%s(high=%r, low=%r, fs=%r)" % (
+            self.__class__.__name__, self.high, self.low, self.fs)
+
+
+# =============================================================================
+class _FsState(object):
+    """The polling state of a single watched filesystem."""
+
+    __slots__ = ('fs', 'last', 'last_pct', 'last_time', 'rate', 'next_poll', 'triggered')
+
+    def __init__(self, fs):
+
+        self.fs = fs
+        self.last = None
+        self.last_pct = None
+        self.last_time = None
+        self.rate = None
+        self.next_poll = 0
+        self.triggered = set()
+
+
+# =============================================================================
+class DfWatcher(PbBaseObject):
+    """
+    Watches the free space of filesystems in a background thread (or
+    synchronously by calling check()) and calls the callbacks of the
+    registered watermarks::
+
+        def on_full(event, df_result, watermark):
+            ...
+
+        watcher = DfWatcher(local=True)
+        watcher.add_watermark(90, on_full)
+        watcher.start()
+
+    Every filesystem is polled by statvfs() at its own rate between
+    min_interval and max_interval, the nearer it comes to its next
+    watermark and the faster it fills up, the more often. Changes of
+    the mount table are detected by polling /proc/self/mountinfo, so
+    new filesystems are watched immediately.
+
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(
+        self, appname=None, verbose=0, version=__version__, base_dir=None,
+            use_stderr=False, initialized=False, fs=None, local=False,
+            fs_type=None, exclude_type=None, min_interval=1.0, max_interval=60.0,
+            statvfs_timeout=None):
+        """
+        Initialisation of the df watcher object.
+
+        @param appname: name of the current running application
+        @type appname: str
+        @param verbose: verbose level
+        @type verbose: int
+        @param version: the version string of the current object or application
+        @type version: str
+        @param base_dir: the base directory of all operations
+        @type base_dir: str
+        @param use_stderr: a flag indicating, that on handle_error() the output
+                           should go to STDERR, even if logging has
+                           initialized logging handlers.
+        @type use_stderr: bool
+        @param initialized: initialisation is complete after __init__()
+                            of this object
+        @type initialized: bool
+        @param fs: the filesystems to watch, all filesystems, if omitted
+        @type fs: None, str or list of str
+        @param local: watch only local filesystems, see DfHandler
+        @type local: bool
+        @param fs_type: watch only filesystems of these types
+        @type fs_type: None or list of str
+        @param exclude_type: don't watch filesystems of these types
+        @type exclude_type: None or list of str
+        @param min_interval: the minimum polling interval in seconds
+        @type min_interval: float
+        @param max_interval: the maximum polling interval in seconds
+        @type max_interval: float
+        @param statvfs_timeout: the maximum time in seconds to wait for
+                                statvfs() of a mount, see DfHandler
+        @type statvfs_timeout: float or None
+
+        @return: None
+        """
+
+        super(DfWatcher, self).__init__(
+            appname=appname,
+            verbose=verbose,
+            version=version,
+            base_dir=base_dir,
+            use_stderr=use_stderr,
+            initialized=False,
+        )
+
+        if isinstance(fs, str):
+            fs = [fs]
+        self.fs = fs
+        self.local = local
+        self.fs_type = fs_type
+        self.exclude_type = exclude_type
+
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max_interval)
+        if self.min_interval <= 0 or self.max_interval < self.min_interval:
+            raise DfError(_("Invalid polling intervals %(min)r and %(max)r.") % {
+                'min': min_interval, 'max': max_interval})
+
+        self.df = DfHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+            base_dir=self.base_dir,
+            single_flight=False,
+            backend='native',
+            statvfs_timeout=statvfs_timeout,
+        )
+
+        self.mount_table = MountTableCache(watch_file=MOUNTINFO_FILE)
+
+        self._lock = threading.RLock()
+        self._watermarks = []
+        self._states = {}
+        self._refresh_needed = True
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._wake_pipe = None
+        # protects the wake-up pipe against closing while writing into it
+        self._pipe_lock = threading.Lock()
+
+        self.initialized = initialized
+
+    # -------------------------------------------------------------------------
+    @property
+    def running(self):
+        """Is the watcher thread running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    # -------------------------------------------------------------------------
+    @property
+    def watermarks(self):
+        """All registered watermarks."""
+        with self._lock:
+            return list(self._watermarks)
+
+    # -------------------------------------------------------------------------
+    def as_dict(self, short=False):
+        """
+        Transforms the elements of the object into a dict
+
+        @param short: don't include local properties in resulting dict.
+        @type short: bool
+
+        @return: structure as dict
+        @rtype:  dict
+        """
+
+        res = super(DfWatcher, self).as_dict(short=short)
+        res['running'] = self.running
+        res['watermarks'] = [repr(wm) for wm in self.watermarks]
+        res['watched'] = self.watched()
+
+        return res
+
+    # -------------------------------------------------------------------------
+    def add_watermark(self, high, callback, low=None, fs=None):
+        """
+        Registers a new watermark, see DfWatermark.
+
+        @return: the new watermark, needed for remove_watermark()
+        @rtype: DfWatermark
+
+        """
+
+        watermark = DfWatermark(high, callback, low=low, fs=fs)
+        with self._lock:
+            self._watermarks.append(watermark)
+            for state in self._states.values():
+                state.next_poll = 0
+        self._wake()
+        return watermark
+
+    # -------------------------------------------------------------------------
+    def remove_watermark(self, watermark):
+        """Removes the given watermark."""
+
+        with self._lock:
+            self._watermarks.remove(watermark)
+            for state in self._states.values():
+                state.triggered.discard(watermark)
+
+    # -------------------------------------------------------------------------
+    def watched(self):
+        """
+        Gives back the watched filesystems with their last values.
+
+        @return: the last DfResult by mount point
+        @rtype: dict
+
+        """
+
+        with self._lock:
+            return dict((fs, state.last) for (fs, state) in self._states.items())
+
+    # -------------------------------------------------------------------------
+    def check(self):
+        """
+        Polls all filesystems, which are due, and calls the callbacks
+        of reached watermarks. After a change of the mount table all
+        filesystems are polled.
+
+        @return: the time of the next due filesystem
+        @rtype: float
+
+        """
+
+        if self.mount_table.changed():
+            self._refresh_needed = True
+
+        now = time.time()
+        with self._lock:
+            refresh = self._refresh_needed
+            due = [st.fs for st in self._states.values() if st.next_poll <= now]
+
+        try:
+            if refresh:
+                if self.verbose > 1:
+                    log.debug(_("Getting the list of filesystems to watch ..."))
+                self._refresh_needed = False
+                results = self.df(
+                    self.fs, local=self.local, fs_type=self.fs_type,
+                    exclude_type=self.exclude_type)
+            elif due:
+                results = self.df(due)
+            else:
+                results = []
+        except DfError as e:
+            log.warning(_("Error on polling filesystems: %s"), e)
+            self._refresh_needed = True
+            return now + self.min_interval
+
+        now = time.time()
+        with self._lock:
+            if refresh:
+                found = set([r.fs for r in results])
+                for fs in list(self._states.keys()):
+                    if fs not in found:
+                        if self.verbose > 1:
+                            log.debug(_("Filesystem %r is not watched anymore."), fs)
+                        del self._states[fs]
+            for result in results:
+                self._update(result, now)
+            if not self._states:
+                return now + self.max_interval
+            return min([st.next_poll for st in self._states.values()])
+
+    # -------------------------------------------------------------------------
+    def _update(self, result, now):
+        """
+        Evaluates a new DfResult of a watched filesystem, updates its
+        fill rate, calls the callbacks and computes the next polling time.
+        """
+
+        state = self._states.get(result.fs)
+        if state is None:
+            state = _FsState(result.fs)
+            self._states[result.fs] = state
+        state.last = result
+
+        pct = result.used_percent
+        if result.timed_out or pct is None:
+            state.next_poll = now + self.max_interval
+            return
+
+        if state.last_pct is not None and now > state.last_time:
+            rate = (pct - state.last_pct) / (now - state.last_time)
+            if state.rate is None:
+                state.rate = rate
+            else:
+                state.rate += RATE_WEIGHT * (rate - state.rate)
+        state.last_pct = pct
+        state.last_time = now
+
+        for watermark in self._watermarks:
+            if not watermark.matches(result.fs):
+                continue
+            if watermark not in state.triggered:
+                if pct >= watermark.high:
+                    state.triggered.add(watermark)
+                    self._fire('high', result, watermark)
+            elif pct < watermark.low:
+                state.triggered.discard(watermark)
+                self._fire('low', result, watermark)
+
+        state.next_poll = now + self._interval(state, pct)
+
+    # -------------------------------------------------------------------------
+    def _interval(self, state, pct):
+        """
+        Computes the polling interval of a filesystem from the distance
+        to its next not reached watermark and its current fill rate.
+        """
+
+        target = 100.0
+        for watermark in self._watermarks:
+            if watermark.matches(state.fs) and watermark not in state.triggered:
+                target = min(target, watermark.high)
+
+        headroom = max(target - pct, 0.0)
+        interval = self.max_interval * min(1.0, headroom / ADAPTIVE_HEADROOM)
+        if state.rate and state.rate > 0:
+            interval = min(interval, headroom / state.rate / POLLS_BEFORE_WATERMARK)
+
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    # -------------------------------------------------------------------------
+    def _fire(self, event, result, watermark):
+
+        if event == 'high':
+            log.info(_(
+                "Filesystem %(fs)r has reached %(pc).1f%% used space "
+                "(watermark %(wm).1f%%).") % {
+                'fs': result.fs, 'pc': result.used_percent, 'wm': watermark.high})
+        elif self.verbose > 1:
+            log.debug(_(
+                "Filesystem %(fs)r has fallen below %(wm).1f%% used space.") % {
+                'fs': result.fs, 'wm': watermark.low})
+
+        try:
+            watermark.callback(event, result, watermark)
+        except Exception as e:
+            log.error(_("Error in watermark callback %(cb)r: %(e)s") % {
+                'cb': watermark.callback, 'e': e})
+
+    # -------------------------------------------------------------------------
+    def start(self):
+        """Starts the watcher thread."""
+
+        if self.running:
+            return
+        # every thread gets its own stop event and wake-up pipe, because
+        # a thread not stopped in time (e.g. hanging in check()) is still
+        # using them, it closes the pipe on its end
+        self._stop_event = threading.Event()
+        with self._pipe_lock:
+            self._wake_pipe = os.pipe()
+        self._thread = threading.Thread(
+            target=self._run, args=(self._stop_event, self._wake_pipe), name='df-watcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    # -------------------------------------------------------------------------
+    def stop(self, timeout=None):
+        """
+        Stops the watcher thread and waits for its end. A thread not ended
+        within the timeout ends after its current check.
+        """
+
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._wake()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            log.warning(_(
+                "The df watcher thread didn't stop within %s seconds."), timeout)
+        self._thread = None
+
+    # -------------------------------------------------------------------------
+    def _wake(self):
+
+        with self._pipe_lock:
+            pipe = self._wake_pipe
+            if pipe is not None:
+                try:
+                    os.write(pipe[1], b'x')
+                except OSError:
+                    pass
+
+    # -------------------------------------------------------------------------
+    def _run(self, stop_event, wake_pipe):
+
+        try:
+            poller = select.poll()
+            mounts_fd = self.mount_table.fileno()
+            if mounts_fd is not None:
+                poller.register(mounts_fd, select.POLLPRI | select.POLLERR)
+            wake_fd = wake_pipe[0]
+            poller.register(wake_fd, select.POLLIN)
+
+            while not stop_event.is_set():
+                try:
+                    next_poll = self.check()
+                except Exception as e:
+                    log.error(_("Error on watching filesystems: %s"), e)
+                    next_poll = time.time() + self.max_interval
+
+                if stop_event.is_set():
+                    break
+                timeout = max(next_poll - time.time(), 0.0)
+                for (fd, event) in poller.poll(timeout * 1000):
+                    if fd == mounts_fd:
+                        if self.verbose > 1:
+                            log.debug(_("The mount table has changed."))
+                        self.mount_table.invalidate()
+                        self._refresh_needed = True
+                    elif fd == wake_fd:
+                        os.read(wake_fd, 4096)
+        finally:
+            with self._pipe_lock:
+                if self._wake_pipe is wake_pipe:
+                    self._wake_pipe = None
+                for fd in wake_pipe:
+                    os.close(fd)
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,711 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, ProfitBricks GmbH, Berlin
+@summary: A special handler module for retrieving the disk usage of
+          directory trees like the du command, but with parallel threads.
+"""
+
+# Standard modules
+import os
+import logging
+import stat
+import threading
+
+# Third party modules
+from six.moves import queue
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# Own modules
+from pb_base.object import PbBaseObject
+
+from pb_base.handler import PbBaseHandlerError
+from pb_base.handler import PbBaseHandler
+
+from pb_base.handler.singleflight import SingleFlight
+
+from pb_base.translate import pb_gettext, pb_ngettext
+
+__version__ = '0.1.1'
+
+log = logging.getLogger(__name__)
+
+_ = pb_gettext
+__ = pb_ngettext
+
+# Some module varriables
+
+# The default number of threads reading directories in parallel
+DU_WORKERS = 8
+
+# The unit of st_blocks
+STAT_BLOCK_SIZE = 512
+
+
+# =============================================================================
+class DuError(PbBaseHandlerError):
+    """
+    Special exception class on retrieving the disk usage.
+    """
+
+    pass
+
+
+# =============================================================================
+class DuResult(PbBaseObject):
+
+    # -------------------------------------------------------------------------
+    def __init__(
+        self, path=None, apparent=0, allocated=0, files=0, dirs=0, depth=0,
+            errors=0, appname=None, verbose=0, base_dir=None):
+        """
+        Initialisation of the DuResult object.
+
+        @param path: the directory (or file)
+        @type path: str
+        @param apparent: the sum of the file sizes in Bytes
+        @type apparent: long
+        @param allocated: the allocated disk space in Bytes
+        @type allocated: long
+        @param files: the number of files (all non directories)
+        @type files: int
+        @param dirs: the number of subdirectories
+        @type dirs: int
+        @param depth: the depth below the given path, the path itself has 0
+        @type depth: int
+        @param errors: the number of entries, which could not be read
+        @type errors: int
+
+        """
+
+        super(DuResult, self).__init__(
+            appname=appname,
+            verbose=verbose,
+            base_dir=base_dir,
+            initialized=False
+        )
+
+        self._path = str(path)
+        """
+        @ivar: the directory (or file)
+        @type: str
+        """
+
+        self._apparent = int(apparent)
+        """
+        @ivar: the sum of the file sizes in Bytes
+        @type: long
+        """
+
+        self._allocated = int(allocated)
+        """
+        @ivar: the allocated disk space in Bytes
+        @type: long
+        """
+
+        self._files = int(files)
+        """
+        @ivar: the number of files (all non directories)
+        @type: int
+        """
+
+        self._dirs = int(dirs)
+        """
+        @ivar: the number of subdirectories
+        @type: int
+        """
+
+        self._depth = int(depth)
+        """
+        @ivar: the depth below the given path
+        @type: int
+        """
+
+        self._errors = int(errors)
+        """
+        @ivar: the number of entries, which could not be read
+        @type: int
+        """
+
+        self.initialized = True
+
+    # -----------------------------------------------------------
+    @property
+    def path(self):
+        """The directory (or file)."""
+        return self._path
+
+    # -----------------------------------------------------------
+    @property
+    def apparent(self):
+        """The sum of the file sizes in Bytes."""
+        return self._apparent
+
+    # -----------------------------------------------------------
+    @property
+    def apparent_kb(self):
+        """The sum of the file sizes in KiBytes."""
+        return self._apparent / 1024
+
+    # -----------------------------------------------------------
+    @property
+    def apparent_mb(self):
+        """The sum of the file sizes in MiBytes."""
+        return int(self._apparent / 1024 / 1024)
+
+    # -----------------------------------------------------------
+    @property
+    def allocated(self):
+        """The allocated disk space in Bytes."""
+        return self._allocated
+
+    # -----------------------------------------------------------
+    @property
+    def allocated_kb(self):
+        """The allocated disk space in KiBytes."""
+        return self._allocated / 1024
+
+    # -----------------------------------------------------------
+    @property
+    def allocated_mb(self):
+        """The allocated disk space in MiBytes."""
+        return int(self._allocated / 1024 / 1024)
+
+    # -----------------------------------------------------------
+    @property
+    def files(self):
+        """The number of files (all non directories)."""
+        return self._files
+
+    # -----------------------------------------------------------
+    @property
+    def dirs(self):
+        """The number of subdirectories."""
+        return self._dirs
+
+    # -----------------------------------------------------------
+    @property
+    def depth(self):
+        """The depth below the given path, the path itself has 0."""
+        return self._depth
+
+    # -----------------------------------------------------------
+    @property
+    def errors(self):
+        """The number of entries, which could not be read."""
+        return self._errors
+
+    # -------------------------------------------------------------------------
+    def as_dict(self, short=False):
+        """
+        Transforms the elements of the object into a dict
+
+        @param short: don't include local properties in resulting dict.
+        @type short: bool
+
+        @return: structure as dict
+        @rtype:  dict
+        """
+
+        res = super(DuResult, self).as_dict(short=short)
+        res['path'] = self.path
+        res['apparent'] = self.apparent
+        res['apparent_kb'] = self.apparent_kb
+        res['apparent_mb'] = self.apparent_mb
+        res['allocated'] = self.allocated
+        res['allocated_kb'] = self.allocated_kb
+        res['allocated_mb'] = self.allocated_mb
+        res['files'] = self.files
+        res['dirs'] = self.dirs
+        res['depth'] = self.depth
+        res['errors'] = self.errors
+
+        return res
+
+
+# =============================================================================
+class DuNode(object):
+    """
+    The collected usage of a single directory during a DuScan, first only
+    of its direct entries, at the end of the scan including all
+    subdirectories.
+    """
+
+    __slots__ = (
+        'path', 'depth', 'parent', 'dev', 'apparent', 'allocated',
+        'files', 'dirs', 'errors')
+
+    # -------------------------------------------------------------------------
+    def __init__(self, path, depth, parent, st):
+
+        self.path = path
+        self.depth = depth
+        self.parent = parent
+        self.dev = st.st_dev
+        self.apparent = st.st_size
+        self.allocated = st.st_blocks * STAT_BLOCK_SIZE
+        self.files = 0
+        self.dirs = 0
+        self.errors = 0
+
+
+# =============================================================================
+class DuScan(object):
+    """
+    A single traversal of directory trees by a number of threads, each
+    reading one directory at a time from a shared queue, so the reading
+    of many directories is done concurrently (os.scandir() and os.lstat()
+    are releasing the GIL).
+
+    Like with the du command several paths are scanned one after another
+    and every inode is counted only once, also if it's reached by several
+    hardlinks or bind mounts or by overlapping paths.
+
+    A file with several hardlinks inside of one scan is counted at the end
+    of the scan in the directory of its lowest path (compared by path
+    components), like du does it on sorted directory entries, so the usage
+    of the subdirectories doesn't depend on the scheduling of the threads.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self, workers=DU_WORKERS, one_filesystem=False):
+
+        self.workers = workers
+        self.one_filesystem = one_filesystem
+        self.nodes = []
+        self._nodes = []
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._seen = set()
+        self._links = {}
+        self._pending = 0
+
+    # -------------------------------------------------------------------------
+    def _first_seen(self, st):
+
+        key = (st.st_dev, st.st_ino)
+        with self._lock:
+            if key in self._seen:
+                return False
+            self._seen.add(key)
+            return True
+
+    # -------------------------------------------------------------------------
+    def scan(self, path):
+        """
+        Scans a directory tree (or a single file) and sums up the usage of
+        the subdirectories into their parents. The nodes of all directories
+        are appended to the nodes attribute.
+
+        @raise OSError: if the path could not be examined
+
+        @return: the node of the path, or None, if it was already counted
+                 by a previous scan
+        @rtype: DuNode or None
+
+        """
+
+        st = os.lstat(path)
+        if not self._first_seen(st):
+            return None
+        root = DuNode(path, 0, None, st)
+        self._nodes = [root]
+
+        if not stat.S_ISDIR(st.st_mode):
+            root.files = 1
+        else:
+            self._pending = 1
+            self._queue.put(root)
+            threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name='du-worker')
+                thread.daemon = True
+                thread.start()
+                threads.append(thread)
+            for thread in threads:
+                thread.join()
+
+        self._count_links()
+
+        for node in sorted(self._nodes, key=lambda n: n.depth, reverse=True):
+            parent = node.parent
+            if parent is None:
+                continue
+            parent.apparent += node.apparent
+            parent.allocated += node.allocated
+            parent.files += node.files
+            parent.dirs += node.dirs + 1
+            parent.errors += node.errors
+
+        self.nodes.extend(self._nodes)
+        self._nodes = []
+        return root
+
+    # -------------------------------------------------------------------------
+    def _add_links(self, node, links):
+        """
+        Remembers the files of a directory with several hardlinks, only
+        the one with the lowest path of every inode is kept.
+        """
+
+        base = tuple(node.path.split(os.sep))
+        with self._lock:
+            for (path, st) in links:
+                key = (st.st_dev, st.st_ino)
+                if key in self._seen:
+                    continue
+                path_key = base + (os.path.basename(path),)
+                owner = self._links.get(key)
+                if owner is None or path_key < owner[0]:
+                    self._links[key] = (path_key, node, st.st_size, st.st_blocks)
+
+    # -------------------------------------------------------------------------
+    def _count_links(self):
+        """
+        Adds the files with several hardlinks to the directories of their
+        lowest paths after all directories of the current scan were read.
+        """
+
+        for (key, owner) in self._links.items():
+            (path_key, node, size, blocks) = owner
+            node.apparent += size
+            node.allocated += blocks * STAT_BLOCK_SIZE
+            node.files += 1
+            self._seen.add(key)
+        self._links = {}
+
+    # -------------------------------------------------------------------------
+    def _work(self):
+
+        while True:
+            node = self._queue.get()
+            if node is None:
+                return
+            children = []
+            try:
+                children = self._scan(node)
+            finally:
+                with self._lock:
+                    self._nodes.extend(children)
+                    self._pending += len(children) - 1
+                    finished = not self._pending
+                for child in children:
+                    self._queue.put(child)
+                if finished:
+                    # wake up all workers to finish
+                    for i in range(self.workers):
+                        self._queue.put(None)
+
+    # -------------------------------------------------------------------------
+    def _entries(self, node):
+        """
+        Gives back the paths and the lstat() results of all entries of the
+        directory of the given node.
+
+        @raise OSError: if the directory could not be read
+
+        """
+
+        entries = []
+        if scandir is None:
+            for name in os.listdir(node.path):
+                path = os.path.join(node.path, name)
+                try:
+                    entries.append((path, os.lstat(path)))
+                except OSError:
+                    node.errors += 1
+            return entries
+
+        for entry in list(scandir(node.path)):
+            try:
+                entries.append((entry.path, entry.stat(follow_symlinks=False)))
+            except OSError:
+                node.errors += 1
+        return entries
+
+    # -------------------------------------------------------------------------
+    def _scan(self, node):
+        """
+        Reads a directory, sums up the usage of its files and gives back
+        the nodes of its subdirectories.
+        """
+
+        try:
+            entries = self._entries(node)
+        except OSError as e:
+            log.warning(_("Could not read directory %(dir)r: %(err)s") % {
+                'dir': node.path, 'err': e.strerror})
+            node.errors += 1
+            return []
+
+        children = []
+        links = []
+        apparent = 0
+        blocks = 0
+        files = 0
+        is_dir = stat.S_ISDIR
+        for (path, st) in entries:
+            if is_dir(st.st_mode):
+                if self.one_filesystem and st.st_dev != node.dev:
+                    continue
+                if not self._first_seen(st):
+                    continue
+                children.append(DuNode(path, node.depth + 1, node, st))
+                continue
+            if st.st_nlink > 1:
+                links.append((path, st))
+                continue
+            apparent += st.st_size
+            blocks += st.st_blocks
+            files += 1
+
+        node.apparent += apparent
+        node.allocated += blocks * STAT_BLOCK_SIZE
+        node.files += files
+        if links:
+            self._add_links(node, links)
+        return children
+
+
+# =============================================================================
+class DuHandler(PbBaseHandler):
+    """
+    A special handler class to retrieve the disk usage of directory trees
+    like the du command, but natively with several threads reading
+    directories in parallel.
+
+    An instance of this class may be used as a function, see method __call__().
+
+    Identical concurrent requests of all instances in the current process
+    are sharing one scan, see SingleFlight.
+
+    """
+
+    single_flight = SingleFlight()
+
+    # -------------------------------------------------------------------------
+    def __init__(
+        self, appname=None, verbose=0, version=__version__, base_dir=None,
+            use_stderr=False, initialized=False, quiet=False,
+            single_flight=True, workers=DU_WORKERS):
+        """
+        Initialisation of the du handler object.
+
+        @raise DuError: on a uncoverable error.
+
+        @param appname: name of the current running application
+        @type appname: str
+        @param verbose: verbose level
+        @type verbose: int
+        @param version: the version string of the current object or application
+        @type version: str
+        @param base_dir: the base directory of all operations
+        @type base_dir: str
+        @param use_stderr: a flag indicating, that on handle_error() the output
+                           should go to STDERR, even if logging has
+                           initialized logging handlers.
+        @type use_stderr: bool
+        @param initialized: initialisation is complete after __init__()
+                            of this object
+        @type initialized: bool
+        @param quiet: don't display ouput of action after calling
+        @type quiet: bool
+        @param single_flight: share the execution of identical concurrent
+                              requests with other threads
+        @type single_flight: bool
+        @param workers: the number of threads reading directories in parallel
+        @type workers: int
+
+        @return: None
+        """
+
+        super(DuHandler, self).__init__(
+            appname=appname,
+            verbose=verbose,
+            version=version,
+            base_dir=base_dir,
+            use_stderr=use_stderr,
+            initialized=False,
+            simulate=False,
+            sudo=False,
+            quiet=quiet,
+        )
+        self.initialized = False
+
+        try:
+            workers = int(workers)
+        except (TypeError, ValueError):
+            workers = 0
+        if workers < 1:
+            raise DuError(_("Invalid number of workers %r.") % (workers))
+
+        self._workers = workers
+        """
+        @ivar: the number of threads reading directories in parallel
+        @type: int
+        """
+
+        self._use_single_flight = bool(single_flight)
+        """
+        @ivar: share the execution of identical concurrent requests
+        @type: bool
+        """
+
+        self.initialized = True
+        if self.verbose > 3:
+            log.debug(_("Initialized."))
+
+    # -----------------------------------------------------------
+    @property
+    def workers(self):
+        """The number of threads reading directories in parallel."""
+        return self._workers
+
+    # -----------------------------------------------------------
+    @property
+    def use_single_flight(self):
+        """Share the execution of identical concurrent requests."""
+        return self._use_single_flight
+
+    @use_single_flight.setter
+    def use_single_flight(self, value):
+        self._use_single_flight = bool(value)
+
+    # -------------------------------------------------------------------------
+    def as_dict(self, short=False):
+        """
+        Transforms the elements of the object into a dict
+
+        @param short: don't include local properties in resulting dict.
+        @type short: bool
+
+        @return: structure as dict
+        @rtype:  dict
+        """
+
+        res = super(DuHandler, self).as_dict(short=short)
+        res['workers'] = self.workers
+        res['use_single_flight'] = self.use_single_flight
+
+        return res
+
+    # -------------------------------------------------------------------------
+    def __call__(self, paths, one_filesystem=False, max_depth=0):
+        """
+        Retrieves the disk usage of the given directories and of their
+        subdirectories up to the given depth::
+
+            du = DuHandler()
+
+            du_list = du('/var/lib')
+            du_list = du(['/srv', '/home'], one_filesystem=True, max_depth=1)
+
+        Like with the du command every file (or directory) is counted only
+        once, also if given paths are overlapping or if there are more
+        hardlinks to it. Symlinks are never followed.
+
+        @raise DuError: if one of the given paths doesn't exists
+
+        @param paths: the directories (or files) to examine
+        @type paths: str or list of str
+        @param one_filesystem: skip directories on other filesystems than
+                               the given paths (like 'du -x')
+        @type one_filesystem: bool
+        @param max_depth: give back results for subdirectories up to this
+                          depth below the given paths (like 'du -d'),
+                          None for all subdirectories, all of them are
+                          counted in any case
+        @type max_depth: int or None
+
+        @return: the usage of all given paths and of their subdirectories
+                 up to max_depth, sorted by path
+        @rtype: list of DuResult
+
+        """
+
+        if isinstance(paths, str):
+            paths = [paths]
+
+        if max_depth is not None:
+            max_depth = int(max_depth)
+            if max_depth < 0:
+                raise DuError(_("Invalid maximum depth %r.") % (max_depth))
+
+        if not self.use_single_flight:
+            rows = self._exec_du(paths, one_filesystem, max_depth)
+        else:
+            key = ('du', os.geteuid(), tuple(paths), bool(one_filesystem), max_depth)
+            rows = self.single_flight.do(
+                key, self._exec_du, paths, one_filesystem, max_depth)
+
+        du_list = []
+        for row in rows:
+            du_list.append(DuResult(
+                path=row[0], apparent=row[1], allocated=row[2], files=row[3],
+                dirs=row[4], depth=row[5], errors=row[6],
+                appname=self.appname, verbose=self.verbose,
+                base_dir=self.base_dir))
+        return du_list
+
+    # -------------------------------------------------------------------------
+    def _exec_du(self, paths, one_filesystem=False, max_depth=0):
+        """
+        The underlaying scan of the directories, see __call__().
+
+        @return: result rows as tuples of (path, apparent, allocated,
+                 files, dirs, depth, errors)
+        @rtype: list of tuple
+
+        """
+
+        for path in paths:
+            if not os.path.lexists(path):
+                raise DuError(_("Path %r doesn't exists.") % (path))
+
+        if self.verbose > 1:
+            log.debug(__(
+                "Scanning %(n)d path with %(w)d threads ...",
+                "Scanning %(n)d paths with %(w)d threads ...",
+                len(paths)) % {'n': len(paths), 'w': self.workers})
+
+        scan = DuScan(workers=self.workers, one_filesystem=one_filesystem)
+        for path in paths:
+            try:
+                scan.scan(path)
+            except OSError as e:
+                msg = _("Could not examine %(path)r: %(err)s") % {
+                    'path': path, 'err': e.strerror}
+                raise DuError(msg)
+
+        rows = []
+        for node in scan.nodes:
+            if max_depth is not None and node.depth > max_depth:
+                continue
+            rows.append((
+                node.path, node.apparent, node.allocated, node.files,
+                node.dirs, node.depth, node.errors))
+        rows.sort()
+
+        if self.verbose > 2:
+            log.debug(_("Scanned %d directories."), len(scan.nodes))
+
+        return rows
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
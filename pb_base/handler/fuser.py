@@ -16,15 +16,25 @@ from pb_base.handler import PbBaseHandlerError
 from pb_base.handler import CommandNotFoundError
 from pb_base.handler import PbBaseHandler
 
+from pb_base.handler.priv_helper import PrivHelperClient
+
+from pb_base.handler.singleflight import SingleFlight
+
+from pb_base.proc_index import get_proc_index
+
 from pb_base.translate import pb_gettext, pb_ngettext
 
-__version__ = '0.2.3'
+__version__ = '0.5.1'
 
 log = logging.getLogger(__name__)
 
 # Some module varriables
 FUSER_CMD = os.sep + os.path.join('bin', 'fuser')
 
+# The backends of FuserHandler: 'command' executes the fuser command,
+# 'native' scans /proc in the current process
+FUSER_BACKENDS = ('command', 'native')
+
 _ = pb_gettext
 __ = pb_ngettext
 
@@ -42,21 +52,30 @@ class FuserError(PbBaseHandlerError):
 class FuserHandler(PbBaseHandler):
     """
     A special handler class to retrieve informations about processes opening
-    a file or mountpoint
+    a file or mountpoint, or with mount=True about processes using anything
+    on the filesystem of a file or on a mounted block device (like 'fuser -m').
 
     An instance of this class may be used as a function, see method __call__().
 
+    Identical concurrent requests of all instances in the current process
+    are sharing one execution of 'fuser', see SingleFlight.
+
     """
 
+    single_flight = SingleFlight()
+
     # -------------------------------------------------------------------------
     def __init__(
         self, appname=None, verbose=0, version=__version__, base_dir=None,
-            use_stderr=False, initialized=False, sudo=False, quiet=False):
+            use_stderr=False, initialized=False, sudo=False, quiet=False,
+            priv_helper=None, single_flight=True, backend='command',
+            index_max_age=None):
         """
         Initialisation of the df handler object.
         The execution of executing 'fuser' should never been simulated.
 
-        @raise CommandNotFoundError: if the 'fuser' command could not be found.
+        @raise CommandNotFoundError: if the 'fuser' command could not be found
+                                     with the backend 'command'.
         @raise FuserError: on a uncoverable error.
 
         @param appname: name of the current running application
@@ -78,6 +97,28 @@ class FuserHandler(PbBaseHandler):
         @type sudo: bool
         @param quiet: don't display ouput of action after calling
         @type quiet: bool
+        @param priv_helper: the socket file of a running privileged helper
+                            (or a client object for it), which is used instead
+                            of sudo, if the current user is not root
+        @type priv_helper: str or PrivHelperClient
+        @param single_flight: share the execution of identical concurrent
+                              requests with other threads
+        @type single_flight: bool
+        @param backend: the way to get the informations, 'command' executes
+                        the fuser command, 'native' looks up an index of
+                        the running processes, which is shared in the
+                        current process and refreshed on every query from
+                        /proc (without sudo, so as non root only the own
+                        processes are found), a refresh still lists the
+                        file descriptors of all processes, only the stat()
+                        calls of unchanged ones are saved
+        @type backend: str
+        @param index_max_age: with the backend 'native' reuse the process
+                              index without a refresh, if it's younger than
+                              this number of seconds, this saves the listing
+                              of /proc for frequent queries, but files opened
+                              in the meantime are not found
+        @type index_max_age: float or None
 
         @return: None
         """
@@ -97,6 +138,17 @@ class FuserHandler(PbBaseHandler):
 
         failed_commands = []
 
+        if backend not in FUSER_BACKENDS:
+            msg = _("Invalid fuser backend %(b)r, valid backends are: %(l)s.") % {
+                'b': backend, 'l': ', '.join(FUSER_BACKENDS)}
+            raise FuserError(msg)
+
+        self._backend = backend
+        """
+        @ivar: the way to get the informations ('command' or 'native')
+        @type: str
+        """
+
         self._fuser_cmd = FUSER_CMD
         """
         @ivar: the underlaying 'fuser' command
@@ -105,9 +157,37 @@ class FuserHandler(PbBaseHandler):
         if not os.path.exists(self.fuser_cmd) or not os.access(
                 self.fuser_cmd, os.X_OK):
             self._fuser_cmd = self.get_command('fuser')
-        if not self.fuser_cmd:
+        if not self.fuser_cmd and backend == 'command':
             failed_commands.append('fuser')
 
+        self._priv_helper = None
+        """
+        @ivar: client object of a privileged helper used instead of sudo
+        @type: PrivHelperClient or None
+        """
+        if priv_helper is not None:
+            if isinstance(priv_helper, PrivHelperClient):
+                self._priv_helper = priv_helper
+            else:
+                self._priv_helper = PrivHelperClient(
+                    socket_file=priv_helper,
+                    appname=self.appname,
+                    verbose=self.verbose,
+                    base_dir=self.base_dir,
+                )
+
+        self._use_single_flight = bool(single_flight)
+        """
+        @ivar: share the execution of identical concurrent requests
+        @type: bool
+        """
+
+        self._index_max_age = index_max_age
+        """
+        @ivar: the maximum age in seconds of a reused process index
+        @type: float or None
+        """
+
         # Some commands are missing
         if failed_commands:
             raise CommandNotFoundError(failed_commands)
@@ -122,6 +202,34 @@ class FuserHandler(PbBaseHandler):
         """The absolute path to the OS command 'fuser'."""
         return self._fuser_cmd
 
+    # -----------------------------------------------------------
+    @property
+    def backend(self):
+        """The way to get the informations ('command' or 'native')."""
+        return self._backend
+
+    # -----------------------------------------------------------
+    @property
+    def use_single_flight(self):
+        """Share the execution of identical concurrent requests."""
+        return self._use_single_flight
+
+    @use_single_flight.setter
+    def use_single_flight(self, value):
+        self._use_single_flight = bool(value)
+
+    # -----------------------------------------------------------
+    @property
+    def index_max_age(self):
+        """The maximum age in seconds of a reused process index."""
+        return self._index_max_age
+
+    # -----------------------------------------------------------
+    @property
+    def priv_helper(self):
+        """The client object of a privileged helper used instead of sudo."""
+        return self._priv_helper
+
     # -------------------------------------------------------------------------
     def as_dict(self, short=False):
         """
@@ -136,11 +244,17 @@ class FuserHandler(PbBaseHandler):
 
         res = super(FuserHandler, self).as_dict(short=short)
         res['fuser_cmd'] = self.fuser_cmd
+        res['backend'] = self.backend
+        res['use_single_flight'] = self.use_single_flight
+        res['index_max_age'] = self.index_max_age
+        res['priv_helper'] = None
+        if self.priv_helper:
+            res['priv_helper'] = self.priv_helper.socket_file
 
         return res
 
     # -------------------------------------------------------------------------
-    def __call__(self, fs_object, force=False):
+    def __call__(self, fs_object, force=False, mount=False):
         """
         Executes the fuser command and returns a list of all process IDs using
         this filesystem object.
@@ -153,6 +267,10 @@ class FuserHandler(PbBaseHandler):
         @param force: execute fuser, even that the given filesystem object
                       doesn't seems to exists
         @type force: bool
+        @param mount: find all processes using anything on the filesystem
+                      containing the filesystem object, or mounted from it,
+                      if it's a block device (like 'fuser -m')
+        @type mount: bool
 
         @return: list of all process IDs using this filesystem object. An empty
                  list, if no process is using this object.
@@ -160,6 +278,88 @@ class FuserHandler(PbBaseHandler):
 
         """
 
+        if not self.use_single_flight:
+            return self._exec_fuser(fs_object, force, mount)
+
+        key = (
+            'fuser', self.backend, self.fuser_cmd, os.geteuid(), fs_object,
+            bool(force), bool(mount))
+        pid_list = self.single_flight.do(key, self._exec_fuser, fs_object, force, mount)
+
+        return list(pid_list)
+
+    # -------------------------------------------------------------------------
+    def query(self, fs_objects, force=False, mount=False):
+        """
+        Gives back the IDs of all processes using the given filesystem objects.
+        With the backend 'native' all objects are checked by a single refresh of
+        the process index, else the fuser command is executed for each object.
+
+        @raise FuserError: if one of the given filesystem objects doesn't
+                           exists or on other errors.
+
+        @param fs_objects: the filesystem objects to check
+        @type fs_objects: list of str
+        @param force: don't fail on not existing filesystem objects
+        @type force: bool
+        @param mount: check the whole filesystems of the given objects,
+                      see __call__()
+        @type mount: bool
+
+        @return: the process IDs by filesystem object
+        @rtype: dict
+
+        """
+
+        if isinstance(fs_objects, str):
+            fs_objects = [fs_objects]
+
+        if self.backend != 'native':
+            result = {}
+            for fs_object in fs_objects:
+                result[fs_object] = self(fs_object, force=force, mount=mount)
+            return result
+
+        for fs_object in fs_objects:
+            self._check_existence(fs_object, force)
+
+        if not self.use_single_flight:
+            return self._query_native(fs_objects, mount)
+
+        key = (
+            'fuser-query', os.geteuid(), tuple(fs_objects), bool(mount), self.index_max_age)
+        result = self.single_flight.do(key, self._query_native, fs_objects, mount)
+
+        return dict((fs_object, list(pids)) for (fs_object, pids) in result.items())
+
+    # -------------------------------------------------------------------------
+    def _query_native(self, fs_objects, mount=False):
+        """
+        Refreshes the process index shared in the current process (unless
+        it's younger than index_max_age), which lists the links of all
+        processes, but examines only changed ones by stat(), and looks up
+        all given filesystem objects (or their filesystems) in it.
+        """
+
+        if self.verbose > 1:
+            log.debug(__(
+                "Refreshing process index for %d filesystem object ...",
+                "Refreshing process index for %d filesystem objects ...",
+                len(fs_objects)), len(fs_objects))
+
+        index = get_proc_index()
+        index.refresh(max_age=self.index_max_age)
+        return index.query(fs_objects, mount=mount)
+
+    # -------------------------------------------------------------------------
+    def _check_existence(self, fs_object, force=False):
+        """
+        Checks the existence of the given filesystem object.
+
+        @raise FuserError: if it doesn't exists and force is not set
+
+        """
+
         if not os.path.exists(fs_object):
             if force:
                 log.warn(
@@ -170,11 +370,36 @@ class FuserHandler(PbBaseHandler):
                     fs_object)
                 raise FuserError(msg)
 
+    # -------------------------------------------------------------------------
+    def _exec_fuser(self, fs_object, force=False, mount=False):
+        """
+        The underlaying execution of the fuser command, see __call__().
+        """
+
+        self._check_existence(fs_object, force)
+
+        if self.backend == 'native':
+            pid_list = self._query_native([fs_object], mount)[fs_object]
+            if not pid_list and self.verbose > 1:
+                log.debug(
+                    _("%r will not be used by some other processes."), fs_object)
+            return pid_list
+
         do_sudo = False
         if os.geteuid():
             do_sudo = True
 
-        cmd = [self.fuser_cmd, fs_object]
+        if do_sudo and self.priv_helper and self.priv_helper.available():
+            if self.verbose > 2:
+                log.debug(_(
+                    "Asking privileged helper %r for fuser information."),
+                    self.priv_helper.socket_file)
+            return self.priv_helper.fuser(fs_object, force=force, mount=mount)
+
+        cmd = [self.fuser_cmd]
+        if mount:
+            cmd.append('-m')
+        cmd.append(fs_object)
         (ret_code, std_out, std_err) = self.call(cmd, sudo=do_sudo)
 
         if ret_code:
@@ -35,9 +35,11 @@ from pb_base.object import PbBaseObject
 from pb_base.handler import PbBaseHandlerError
 from pb_base.handler import PbBaseHandler
 
+from pb_base.proc_index import start_ticks
+
 from pb_base.translate import pb_gettext, pb_ngettext
 
-__version__ = '0.4.1'
+__version__ = '0.5.1'
 
 log = logging.getLogger(__name__)
 
@@ -873,7 +875,12 @@ class PbLockHandler(PbBaseHandler):
                 log.debug(msg)
             else:
                 log.info(msg)
+            # the start time of the process identifies it together with
+            # the PID, see dead()
             out = "%d\n" % (pid)
+            ticks = start_ticks(pid)
+            if ticks is not None:
+                out += "%d\n" % (ticks)
             if six.PY3:
                 out = to_utf8_or_bust(out)
             log.debug(_(
@@ -1042,7 +1049,8 @@ class PbLockHandler(PbBaseHandler):
             if pid is None:
                 log.warn(_("Unusable lockfile %r."), lockfile)
             else:
-                if self.dead(pid):
+                ticks = self.get_start_ticks_from_file(lockfile)
+                if self.dead(pid, ticks):
                     log.warn(_("Process with PID %d is unfortunately dead."), pid)
                     return False
                 else:
@@ -1136,6 +1144,33 @@ class PbLockHandler(PbBaseHandler):
 
         return pid
 
+    # -------------------------------------------------------------------------
+    def get_start_ticks_from_file(self, pidfile):
+        """
+        Tries to read the start time of the process in clock ticks after
+        boot from the second line of the given lock- or pidfile.
+
+        @param pidfile: The file, where the PID should be in.
+        @type pidfile: str
+
+        @return: the start time of the process or None, if not found
+        @rtype: int or None
+
+        """
+
+        try:
+            with open(pidfile, "rb") as fh:
+                fh.readline()
+                content = fh.readline().strip()
+        except (IOError, OSError) as e:
+            log.warn(_("Could not read pidfile %(file)r: %(err)s") % {
+                'file': pidfile, 'err': e})
+            return None
+
+        if not content.isdigit():
+            return None
+        return int(content)
+
     # -------------------------------------------------------------------------
     def kill(self, pid, signal=0):
         """
@@ -1169,20 +1204,37 @@ class PbLockHandler(PbBaseHandler):
                 raise
 
     # -------------------------------------------------------------------------
-    def dead(self, pid):
+    def dead(self, pid, ticks=None):
         """
-        Gives back, whether the process with the given pid is dead
+        Gives back, whether the process with the given pid is dead.
+
+        If the start time of the process is given, a running process with
+        another start time (from /proc/<pid>/stat) has reused the PID of
+        the died process. Else the process is checked by sending
+        the signal 0.
 
         @raise OSError: on some unpredictable errors
 
         @param pid: the PID of the process to check
         @type pid: int
+        @param ticks: the start time of the process in clock ticks after
+                      boot (e.g. from the lockfile), see start_ticks()
+                      of pb_base.proc_index
+        @type ticks: int or None
 
         @return: the process is dead or not
         @rtype: bool
 
         """
 
+        if ticks is not None:
+            current_ticks = start_ticks(pid)
+            if current_ticks is not None and current_ticks != ticks:
+                if self.verbose > 1:
+                    log.debug(_(
+                        "The PID %d was reused by another process."), pid)
+                return True
+
         if self.kill(pid):
             return True
 
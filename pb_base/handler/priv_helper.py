@@ -0,0 +1,715 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, ProfitBricks GmbH, Berlin
+@summary: A module for a long running privileged helper process and its client.
+          The helper executes privileged queries (statvfs, fuser and
+          whitelisted commands) on behalf of unprivileged processes, which are
+          sending batches of requests over a UNIX socket, so they don't need
+          to execute sudo for every single query.
+"""
+
+# Standard modules
+import os
+import logging
+import json
+import time
+import select
+import threading
+
+# Third party modules
+import six
+
+# Own modules
+from pb_base.common import to_str_or_bust as to_str
+from pb_base.common import to_bytes
+
+from pb_base.object import PbBaseObject
+
+from pb_base.socket_obj.unix import UnixSocket
+
+from pb_base.handler import PbBaseHandlerError
+from pb_base.handler import PbBaseHandler
+
+from pb_base.translate import pb_gettext, pb_ngettext
+
+__version__ = '0.2.0'
+
+log = logging.getLogger(__name__)
+
+_ = pb_gettext
+__ = pb_ngettext
+
+# Some module varriables
+DEFAULT_SOCKET_FILE = os.sep + os.path.join('run', 'pb-priv-helper.sock')
+
+STATVFS_FIELDS = (
+    'f_bsize', 'f_frsize', 'f_blocks', 'f_bfree', 'f_bavail',
+    'f_files', 'f_ffree', 'f_favail', 'f_flag', 'f_namemax')
+
+
+# =============================================================================
+class PrivHelperError(PbBaseHandlerError):
+    """
+    Special exception class for errors in communication with
+    the privileged helper.
+    """
+
+    pass
+
+
+# =============================================================================
+class PbPrivHelper(PbBaseHandler):
+    """
+    Server side of the privileged helper. It should be executed as root and
+    listens on a UNIX socket for batches of requests.
+
+    Every request batch is a single line with a JSON encoded list of
+    requests, every request is a dict with the key 'op' and some operation
+    specific keys::
+
+        {'op': 'statvfs', 'path': '/var'}
+        {'op': 'fuser', 'path': '/dev/sdb1'}
+        {'op': 'fuser', 'path': '/var', 'mount': True}
+        {'op': 'call', 'cmd': ['/sbin/blockdev', '--getsize64', '/dev/sdb']}
+
+    The response is a single line with a JSON encoded list of results in the
+    same order, every result is a dict with the keys 'ok' and 'result'
+    or 'error'.
+
+    Every accepted connection is served by its own thread, so a slow or
+    idle client doesn't block the other clients. A connection without
+    any received data for idle_timeout seconds is closed. All fuser
+    requests of a batch are answered by one query of the process index.
+
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(
+        self, socket_file=DEFAULT_SOCKET_FILE, allowed_commands=None,
+            mode=0o40660, owner=None, group=None, poll_interval=0.5,
+            idle_timeout=30, appname=None, verbose=0, version=__version__, base_dir=None,
+            use_stderr=False, initialized=False, quiet=True):
+        """
+        Initialisation of the privileged helper object.
+
+        @raise CommandNotFoundError: if some needed commands could not be found.
+        @raise PrivHelperError: on a uncoverable error.
+
+        @param socket_file: the filename of the UNIX socket to listen on
+        @type socket_file: str
+        @param allowed_commands: a list of absolute paths of all commands,
+                                 which may be executed with the operation 'call'
+        @type allowed_commands: list of str
+        @param mode: The creation mode of the socket file.
+        @type mode: int
+        @param owner: The owning user of the socket file
+        @type owner: str
+        @param group: The owning group of the socket file, all members
+                      of this group may send requests to the helper
+        @type group: str
+        @param poll_interval: interval in seconds for checking the stop flag
+        @type poll_interval: float
+        @param idle_timeout: time in seconds without any data from a client,
+                             after it its connection is closed
+        @type idle_timeout: float
+        @param appname: name of the current running application
+        @type appname: str
+        @param verbose: verbose level
+        @type verbose: int
+        @param version: the version string of the current object or application
+        @type version: str
+        @param base_dir: the base directory of all operations
+        @type base_dir: str
+        @param use_stderr: a flag indicating, that on handle_error() the output
+                           should go to STDERR, even if logging has
+                           initialized logging handlers.
+        @type use_stderr: bool
+        @param initialized: initialisation is complete after __init__()
+                            of this object
+        @type initialized: bool
+        @param quiet: don't display ouput of action after calling
+        @type quiet: bool
+
+        @return: None
+        """
+
+        super(PbPrivHelper, self).__init__(
+            appname=appname,
+            verbose=verbose,
+            version=version,
+            base_dir=base_dir,
+            use_stderr=use_stderr,
+            initialized=False,
+            simulate=False,
+            sudo=False,
+            quiet=quiet,
+        )
+        self.initialized = False
+
+        self._socket_file = socket_file
+        """
+        @ivar: the filename of the UNIX socket to listen on
+        @type: str
+        """
+
+        self._allowed_commands = []
+        """
+        @ivar: absolute paths of all commands allowed for the operation 'call'
+        @type: list of str
+        """
+        if allowed_commands:
+            for cmd in allowed_commands:
+                if not os.path.isabs(cmd):
+                    msg = _("Allowed command %r is not an absolute path.") % (cmd)
+                    raise PrivHelperError(msg)
+                self._allowed_commands.append(os.path.normpath(cmd))
+
+        self._poll_interval = float(poll_interval)
+        """
+        @ivar: interval in seconds for checking the stop flag
+        @type: float
+        """
+
+        self._idle_timeout = float(idle_timeout)
+        """
+        @ivar: time in seconds without data, after it a connection is closed
+        @type: float
+        """
+
+        self._stop = False
+
+        self._fuser = None
+        self._fuser_lock = threading.Lock()
+
+        self._workers = set()
+        """
+        @ivar: the threads serving the accepted connections
+        @type: set of threading.Thread
+        """
+
+        self.socket = UnixSocket(
+            socket_file,
+            mode=mode,
+            owner=owner,
+            group=group,
+            appname=self.appname,
+            verbose=self.verbose,
+            base_dir=self.base_dir,
+        )
+        """
+        @ivar: the listening UNIX socket
+        @type: UnixSocket
+        """
+
+        self.initialized = True
+        if self.verbose > 3:
+            log.debug(_("Initialized."))
+
+    # -----------------------------------------------------------
+    @property
+    def socket_file(self):
+        """The filename of the UNIX socket to listen on."""
+        return self._socket_file
+
+    # -----------------------------------------------------------
+    @property
+    def allowed_commands(self):
+        """Absolute paths of all commands allowed for the operation 'call'."""
+        return self._allowed_commands
+
+    # -----------------------------------------------------------
+    @property
+    def poll_interval(self):
+        """The interval in seconds for checking the stop flag."""
+        return self._poll_interval
+
+    # -----------------------------------------------------------
+    @property
+    def idle_timeout(self):
+        """The time in seconds without data, after it a connection is closed."""
+        return self._idle_timeout
+
+    # -------------------------------------------------------------------------
+    def as_dict(self, short=False):
+        """
+        Transforms the elements of the object into a dict
+
+        @param short: don't include local properties in resulting dict.
+        @type short: bool
+
+        @return: structure as dict
+        @rtype:  dict
+        """
+
+        res = super(PbPrivHelper, self).as_dict(short=short)
+        res['socket_file'] = self.socket_file
+        res['allowed_commands'] = self.allowed_commands
+        res['poll_interval'] = self.poll_interval
+        res['idle_timeout'] = self.idle_timeout
+
+        return res
+
+    # -------------------------------------------------------------------------
+    def stop(self):
+        """Signals the main loop in run() to finish."""
+
+        self._stop = True
+
+    # -------------------------------------------------------------------------
+    def run(self):
+        """
+        The main loop of the helper. It binds to the UNIX socket, accepts
+        the connections and serves every one of them in its own thread
+        until stop() was called.
+        """
+
+        if os.path.exists(self.socket_file):
+            log.debug(_("Removing stale socket file %r ..."), self.socket_file)
+            os.remove(self.socket_file)
+
+        self.socket.bind()
+        log.info(_("Privileged helper is listening on %r."), self.socket_file)
+        self._stop = False
+
+        try:
+            while not self._stop:
+                if not self.socket.has_data(self.poll_interval):
+                    continue
+                self.socket.accept()
+                # the connection is taken over by the serving thread
+                connection = self.socket.connection
+                self.socket.connection = None
+                self.socket.client_address = None
+                worker = threading.Thread(
+                    target=self._serve_connection, args=(connection,),
+                    name='priv-helper-connection')
+                worker.daemon = True
+                self._workers.add(worker)
+                worker.start()
+        finally:
+            for worker in list(self._workers):
+                worker.join(self.poll_interval * 2)
+            self.socket.close()
+
+    # -------------------------------------------------------------------------
+    def _serve_connection(self, connection):
+        """
+        Reads the request batches from an accepted connection and sends back
+        the results, until the client closes the connection, it was idle
+        for idle_timeout seconds or stop() was called.
+        """
+
+        input_buffer = to_bytes('')
+        eol = to_bytes("\n")
+        last_data = time.time()
+
+        try:
+            while not self._stop:
+                (rlist, wlist, xlist) = select.select(
+                    [connection], [], [], self.poll_interval)
+                if not rlist:
+                    if time.time() - last_data > self.idle_timeout:
+                        log.warning(_(
+                            "Closing a connection without data for %s seconds."),
+                            self.idle_timeout)
+                        break
+                    continue
+
+                data = connection.recv(self.socket.buffer_size)
+                if not data:
+                    if self.verbose > 2:
+                        log.debug(_("Client has closed the connection."))
+                    break
+                last_data = time.time()
+
+                input_buffer += data
+                while eol in input_buffer:
+                    (line, input_buffer) = input_buffer.split(eol, 1)
+                    response = self._serve_line(to_str(line))
+                    connection.sendall(to_bytes(response + "\n"))
+                    last_data = time.time()
+        except (IOError, OSError) as e:
+            log.warning(_("Error on serving a connection: %s"), e)
+        finally:
+            connection.close()
+            self._workers.discard(threading.current_thread())
+
+    # -------------------------------------------------------------------------
+    def _serve_line(self, line):
+        """
+        Performs a single request batch and gives back the JSON encoded
+        results.
+        """
+
+        try:
+            requests = json.loads(line)
+        except ValueError as e:
+            msg = _("Got an invalid request: %s") % (e)
+            log.error(msg)
+            response = [{'ok': False, 'error': msg}]
+        else:
+            if not isinstance(requests, list):
+                requests = [requests]
+            if self.verbose > 1:
+                log.debug(_("Got a batch of %d requests."), len(requests))
+            fuser_results = self._fuser_batch(requests)
+            response = []
+            for (i, request) in enumerate(requests):
+                if i in fuser_results:
+                    response.append(fuser_results[i])
+                else:
+                    response.append(self.perform_request(request))
+
+        return json.dumps(response)
+
+    # -------------------------------------------------------------------------
+    def _fuser_batch(self, requests):
+        """
+        Performs all fuser requests of a batch by one query for every
+        combination of force and mount.
+
+        @return: the results by the index of the request in the batch
+        @rtype: dict
+
+        """
+
+        groups = {}
+        for (i, request) in enumerate(requests):
+            if not isinstance(request, dict) or request.get('op') != 'fuser':
+                continue
+            if 'path' not in request:
+                continue
+            key = (bool(request.get('force', False)), bool(request.get('mount', False)))
+            groups.setdefault(key, []).append(i)
+
+        results = {}
+        for ((force, mount), indexes) in groups.items():
+            paths = [requests[i]['path'] for i in indexes]
+            try:
+                pids = self.op_fuser(paths, force, mount)
+            except Exception:
+                # a single failing path fails the whole query, so the paths
+                # are queried again one by one to get their own results
+                for i in indexes:
+                    results[i] = self.perform_request(requests[i])
+                continue
+            for i in indexes:
+                results[i] = {'ok': True, 'result': pids[requests[i]['path']]}
+
+        return results
+
+    # -------------------------------------------------------------------------
+    def perform_request(self, request):
+        """
+        Performs a single request.
+
+        @param request: the request with the key 'op' and all operation
+                        specific keys
+        @type request: dict
+
+        @return: the result with the keys 'ok' and 'result' or 'error'
+        @rtype: dict
+
+        """
+
+        try:
+            op = request['op']
+            if op == 'statvfs':
+                result = self.op_statvfs(request['path'])
+            elif op == 'fuser':
+                result = self.op_fuser(
+                    request['path'], bool(request.get('force', False)),
+                    bool(request.get('mount', False)))
+            elif op == 'call':
+                result = self.op_call(request['cmd'])
+            else:
+                raise PrivHelperError(_("Unknown operation %r.") % (op))
+        except Exception as e:
+            if self.verbose > 1:
+                log.debug(_("Request %(req)r failed: %(err)s") % {
+                    'req': request, 'err': e})
+            return {'ok': False, 'error': "%s: %s" % (e.__class__.__name__, e)}
+
+        return {'ok': True, 'result': result}
+
+    # -------------------------------------------------------------------------
+    def op_statvfs(self, path):
+        """Executes os.statvfs() on the given path."""
+
+        st = os.statvfs(path)
+        res = {}
+        for field in STATVFS_FIELDS:
+            res[field] = getattr(st, field)
+        return res
+
+    # -------------------------------------------------------------------------
+    def op_fuser(self, paths, force=False, mount=False):
+        """
+        Retrieves the PIDs of all processes using the given paths (or
+        their whole filesystems, if mount is set) by a single query of
+        the process index.
+
+        @return: a list of PIDs for a single path, or the lists of PIDs
+                 by path for a list of paths
+        @rtype: list of int or dict
+
+        """
+
+        with self._fuser_lock:
+            if self._fuser is None:
+                from pb_base.handler.fuser import FuserHandler
+                self._fuser = FuserHandler(
+                    appname=self.appname,
+                    verbose=self.verbose,
+                    base_dir=self.base_dir,
+                    quiet=True,
+                    backend='native',
+                )
+
+        if isinstance(paths, six.string_types):
+            return self._fuser.query([paths], force=force, mount=mount)[paths]
+        return self._fuser.query(paths, force=force, mount=mount)
+
+    # -------------------------------------------------------------------------
+    def op_call(self, cmd):
+        """Executes a whitelisted command."""
+
+        if isinstance(cmd, six.string_types):
+            cmd = [cmd]
+        cmd = [str(x) for x in cmd]
+        if not cmd or os.path.normpath(cmd[0]) not in self.allowed_commands:
+            msg = _("Command %r is not allowed.") % (cmd[:1])
+            raise PrivHelperError(msg)
+
+        (ret_code, std_out, std_err) = self.call(cmd, sudo=False, quiet=True)
+        if not isinstance(std_err, six.string_types):
+            std_err = std_err.decode('utf-8')
+        return [ret_code, std_out, std_err]
+
+
+# =============================================================================
+class PrivHelperClient(PbBaseObject):
+    """
+    Client side of the privileged helper. It sends batches of requests over
+    the UNIX socket to the helper.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(
+        self, socket_file=DEFAULT_SOCKET_FILE, timeout=10,
+            appname=None, verbose=0, version=__version__, base_dir=None,
+            use_stderr=False):
+        """
+        Initialisation of the client object.
+
+        @param socket_file: the filename of the UNIX socket of the helper
+        @type socket_file: str
+        @param timeout: timeout in seconds for waiting on the response
+        @type timeout: int
+        @param appname: name of the current running application
+        @type appname: str
+        @param verbose: verbose level
+        @type verbose: int
+        @param version: the version string of the current object or application
+        @type version: str
+        @param base_dir: the base directory of all operations
+        @type base_dir: str
+        @param use_stderr: a flag indicating, that on handle_error() the output
+                           should go to STDERR, even if logging has
+                           initialized logging handlers.
+        @type use_stderr: bool
+
+        @return: None
+        """
+
+        super(PrivHelperClient, self).__init__(
+            appname=appname,
+            verbose=verbose,
+            version=version,
+            base_dir=base_dir,
+            use_stderr=use_stderr,
+            initialized=False,
+        )
+
+        self._socket_file = socket_file
+        """
+        @ivar: the filename of the UNIX socket of the helper
+        @type: str
+        """
+
+        self._timeout = int(timeout)
+        """
+        @ivar: timeout in seconds for waiting on the response
+        @type: int
+        """
+
+        self.initialized = True
+
+    # -----------------------------------------------------------
+    @property
+    def socket_file(self):
+        """The filename of the UNIX socket of the helper."""
+        return self._socket_file
+
+    # -----------------------------------------------------------
+    @property
+    def timeout(self):
+        """The timeout in seconds for waiting on the response."""
+        return self._timeout
+
+    # -------------------------------------------------------------------------
+    def as_dict(self, short=False):
+        """
+        Transforms the elements of the object into a dict
+
+        @param short: don't include local properties in resulting dict.
+        @type short: bool
+
+        @return: structure as dict
+        @rtype:  dict
+        """
+
+        res = super(PrivHelperClient, self).as_dict(short=short)
+        res['socket_file'] = self.socket_file
+        res['timeout'] = self.timeout
+
+        return res
+
+    # -------------------------------------------------------------------------
+    def available(self):
+        """Returns, whether the socket file of the helper exists."""
+
+        return os.path.exists(self.socket_file)
+
+    # -------------------------------------------------------------------------
+    def request(self, requests):
+        """
+        Sends a batch of requests to the helper and gives back the results.
+
+        @raise PrivHelperError: on communication errors or timeout
+
+        @param requests: the requests to send, see PbPrivHelper
+        @type requests: list of dict
+
+        @return: the results in the same order like the requests
+        @rtype: list of dict
+
+        """
+
+        sock = UnixSocket(
+            self.socket_file,
+            auto_remove=False,
+            appname=self.appname,
+            verbose=self.verbose,
+            base_dir=self.base_dir,
+        )
+
+        try:
+            sock.connect()
+            sock.send(json.dumps(list(requests)) + "\n")
+            start_time = time.time()
+            line = ''
+            while not line:
+                line = sock.read_line()
+                if line:
+                    break
+                if sock.interrupted:
+                    msg = _("The privileged helper has closed the connection.")
+                    raise PrivHelperError(msg)
+                if time.time() - start_time > self.timeout:
+                    msg = _("Timeout on waiting for a response from %r.") % (
+                        self.socket_file)
+                    raise PrivHelperError(msg)
+        finally:
+            sock.close()
+
+        try:
+            results = json.loads(line)
+        except ValueError as e:
+            msg = _("Got an invalid response from %(sock)r: %(err)s") % {
+                'sock': self.socket_file, 'err': e}
+            raise PrivHelperError(msg)
+
+        return results
+
+    # -------------------------------------------------------------------------
+    def _single(self, request):
+
+        result = self.request([request])[0]
+        if not result.get('ok'):
+            raise PrivHelperError(result.get('error', _('Undefined error')))
+        return result['result']
+
+    # -------------------------------------------------------------------------
+    def statvfs(self, path):
+        """
+        Executes os.statvfs() inside the helper.
+
+        @return: all fields of the statvfs result
+        @rtype: dict
+        """
+
+        return self._single({'op': 'statvfs', 'path': path})
+
+    # -------------------------------------------------------------------------
+    def fuser(self, paths, force=False, mount=False):
+        """
+        Retrieves the PIDs of all processes using the given paths with
+        one single request batch.
+
+        @raise PrivHelperError: if one of the queries failed
+
+        @param paths: the filesystem objects to check
+        @type paths: str or list of str
+        @param force: execute fuser, even that the given filesystem object
+                      doesn't seems to exists
+        @type force: bool
+        @param mount: retrieve the processes using anything on the
+                      filesystems of the given paths (like 'fuser -m')
+        @type mount: bool
+
+        @return: a list of PIDs for a single path, or a dict with the paths
+                 as keys and the lists of PIDs as values for a list of paths.
+        @rtype: list of int or dict
+
+        """
+
+        if isinstance(paths, six.string_types):
+            return self._single({
+                'op': 'fuser', 'path': paths, 'force': force, 'mount': mount})
+
+        requests = []
+        for path in paths:
+            requests.append({'op': 'fuser', 'path': path, 'force': force, 'mount': mount})
+        results = self.request(requests)
+
+        pids = {}
+        for (path, result) in zip(paths, results):
+            if not result.get('ok'):
+                raise PrivHelperError(result.get('error', _('Undefined error')))
+            pids[path] = result['result']
+        return pids
+
+    # -------------------------------------------------------------------------
+    def call(self, cmd):
+        """
+        Executes a whitelisted command inside the helper.
+
+        @return: tuple of return value, output on STDOUT and output on STDERR
+        @rtype: tuple
+        """
+
+        return tuple(self._single({'op': 'call', 'cmd': cmd}))
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, ProfitBricks GmbH, Berlin
+@summary: A module for de-duplication of identical concurrent calls.
+          If several threads are executing the same call at the same time,
+          only the first one executes it, all others are waiting for it
+          and get the same result (or exception).
+"""
+
+# Standard modules
+import sys
+import logging
+import threading
+
+# Third party modules
+from six import reraise
+
+# Own modules
+from pb_base.translate import pb_gettext, pb_ngettext
+
+__version__ = '0.1.0'
+
+log = logging.getLogger(__name__)
+
+_ = pb_gettext
+__ = pb_ngettext
+
+
+# =============================================================================
+class _InFlightCall(object):
+    """A call, which is currently executed by a thread."""
+
+    def __init__(self):
+
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+# =============================================================================
+class SingleFlight(object):
+    """
+    De-duplication of identical concurrent calls. The calls are identified
+    by a hashable key::
+
+        sf = SingleFlight()
+        result = sf.do(('df', '/var'), df_function, '/var')
+
+    Concurrent calls of do() with the same key are sharing one execution
+    of the function and its result, so the result should not be modified
+    by the callers.
+
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self):
+
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    # -------------------------------------------------------------------------
+    def in_flight(self):
+        """Gives back the number of currently executed calls."""
+
+        with self._lock:
+            return len(self._calls)
+
+    # -------------------------------------------------------------------------
+    def do(self, key, func, *args, **kwargs):
+        """
+        Executes the given function with the given arguments, if there is
+        no other execution with the same key in flight, else it waits for
+        the result of the other execution.
+
+        @param key: the key identifying identical calls
+        @type key: hashable object
+        @param func: the function to execute
+        @type func: callable
+
+        @return: the return value of the function
+
+        """
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _InFlightCall()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            log.debug(_("Waiting for the result of an identical call %r ..."), key)
+            call.event.wait()
+            if call.error is not None:
+                reraise(call.error[0], call.error[1], call.error[2])
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException:
+            call.error = sys.exc_info()
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+        if call.waiters:
+            log.debug(_("Shared the result of %(key)r with %(nr)d other callers.") % {
+                'key': key, 'nr': call.waiters})
+
+        if call.error is not None:
+            reraise(call.error[0], call.error[1], call.error[2])
+        return call.result
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, ProfitBricks GmbH, Berlin
+@summary: module for reading the mount table of the current process
+          from /proc/self/mountinfo.
+"""
+
+# Standard modules
+import os
+import re
+import stat
+import select
+import logging
+import threading
+
+# Own modules
+from pb_base.translate import pb_gettext, pb_ngettext
+
+__version__ = '0.2.2'
+
+log = logging.getLogger(__name__)
+
+_ = pb_gettext
+__ = pb_ngettext
+
+# -----------------------------------------------------------------------------
+# Module variables
+
+MOUNTINFO_FILE = os.sep + os.path.join('proc', 'self', 'mountinfo')
+
+# The kernel signals changes of the mount table by POLLPRI on this file
+MOUNTS_FILE = os.sep + os.path.join('proc', 'self', 'mounts')
+
+# Filesystem types, which are treated by df as dummy filesystems
+# (see ME_DUMMY in gnulib mountlist.c)
+DUMMY_FS_TYPES = (
+    'autofs', 'proc', 'subfs', 'debugfs', 'devpts', 'fusectl', 'fuse.portal',
+    'mqueue', 'rpc_pipefs', 'sysfs', 'devfs', 'kernfs', 'ignore', 'none')
+
+# Types of network filesystems with sources like '//server/share'
+SMB_FS_TYPES = ('smbfs', 'smb3', 'cifs')
+
+re_octal_escape = re.compile(r'\\([0-7]{3})')
+
+
+# =============================================================================
+def unescape(value):
+    """
+    Replaces the octal escape sequences of the kernel in fields of the
+    mount table (e.g. '\\040' for a space) by the original characters.
+    """
+
+    if '\\' not in value:
+        return value
+    return re_octal_escape.sub(lambda m: chr(int(m.group(1), 8)), value)
+
+
+# =============================================================================
+class MountEntry(object):
+    """
+    A single mount of the mount table, one line of /proc/self/mountinfo.
+    """
+
+    __slots__ = (
+        'mount_id', 'parent_id', 'major', 'minor', 'root', 'mount_point',
+        'options', 'fs_type', 'source', 'super_options')
+
+    # -------------------------------------------------------------------------
+    def __init__(
+            self, mount_id, parent_id, major, minor, root, mount_point,
+            options, fs_type, source, super_options):
+
+        self.mount_id = mount_id
+        self.parent_id = parent_id
+        self.major = major
+        self.minor = minor
+        self.root = root
+        self.mount_point = mount_point
+        self.options = options
+        self.fs_type = fs_type
+        self.source = source
+        self.super_options = super_options
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def from_line(cls, line):
+        """
+        Creates a MountEntry from a line of /proc/self/mountinfo.
+
+        @raise ValueError: if the line could not be evaluated
+
+        """
+
+        fields = line.split()
+        try:
+            sep = fields.index('-', 6)
+            (major, minor) = fields[2].split(':')
+            return cls(
+                mount_id=int(fields[0]),
+                parent_id=int(fields[1]),
+                major=int(major),
+                minor=int(minor),
+                root=unescape(fields[3]),
+                mount_point=unescape(fields[4]),
+                options=fields[5],
+                fs_type=fields[sep + 1],
+                source=unescape(fields[sep + 2]),
+                super_options=(fields[sep + 3] if len(fields) > sep + 3 else ''),
+            )
+        except (ValueError, IndexError):
+            raise ValueError(_("Invalid line in mount table: %r") % (line))
+
+    # -------------------------------------------------------------------------
+    @property
+    def dev(self):
+        """The device number of the mounted filesystem."""
+        return os.makedev(self.major, self.minor)
+
+    # -------------------------------------------------------------------------
+    @property
+    def dummy(self):
+        """Is this a dummy filesystem in the sense of df."""
+        return self.fs_type in DUMMY_FS_TYPES
+
+    # -------------------------------------------------------------------------
+    @property
+    def remote(self):
+        """Is this a network filesystem in the sense of df."""
+
+        if ':' in self.source or self.source == '-hosts':
+            return True
+        return self.source.startswith('//') and self.fs_type in SMB_FS_TYPES
+
+    # -------------------------------------------------------------------------
+    def __repr__(self):
+
+        return "%s(%r, %r, %r)" % (
+            self.__class__.__name__, self.source, self.mount_point, self.fs_type)
+
+    # -------------------------------------------------------------------------
+    def as_dict(self):
+        """Transforms the elements of the object into a dict."""
+
+        res = {'__class__': self.__class__.__name__}
+        for name in self.__slots__:
+            res[name] = getattr(self, name)
+        res['dummy'] = self.dummy
+        res['remote'] = self.remote
+        return res
+
+
+# =============================================================================
+def read_mountinfo(filename=MOUNTINFO_FILE):
+    """
+    Reads the mount table in the order of mounting.
+
+    @raise IOError: if the file could not be read
+    @raise ValueError: on an invalid line
+
+    @param filename: the mountinfo file to read
+    @type filename: str
+
+    @return: all mounts
+    @rtype: list of MountEntry
+
+    """
+
+    with open(filename) as fh:
+        content = fh.read()
+
+    return [MountEntry.from_line(line) for line in content.splitlines() if line.strip()]
+
+
+# =============================================================================
+def find_mount(mounts, path):
+    """
+    Searches the mount, which contains the given path, it's the mount with
+    the longest mount point above the path, which was mounted at last.
+
+    @param mounts: the mount table from read_mountinfo()
+    @type mounts: list of MountEntry
+    @param path: an absolute path without symlinks
+    @type path: str
+
+    @return: the found mount or None
+    @rtype: MountEntry or None
+
+    """
+
+    found = None
+    for entry in mounts:
+        mp = entry.mount_point
+        if path != mp and mp != os.sep and not path.startswith(mp + os.sep):
+            continue
+        if found is None or len(mp) >= len(found.mount_point):
+            found = entry
+
+    return found
+
+
+# =============================================================================
+def filesystem_devices(path, mounts=None):
+    """
+    Gives back the device numbers (st_dev) of the filesystems given by
+    a path, like 'fuser -m' does: for a block device all filesystems
+    mounted from it, else the filesystem containing the path.
+
+    @raise OSError: if the path doesn't exist
+
+    @param path: a file or directory on a filesystem or a mounted block device
+    @type path: str
+    @param mounts: the mount table, it's read, if needed and not given
+    @type mounts: list of MountEntry or None
+
+    @return: the device numbers
+    @rtype: set of int
+
+    """
+
+    st = os.stat(path)
+    if not stat.S_ISBLK(st.st_mode):
+        return set([st.st_dev])
+
+    if mounts is None:
+        mounts = read_mountinfo()
+
+    devices = set()
+    real_path = os.path.realpath(path)
+    for entry in mounts:
+        if not entry.source.startswith(os.sep):
+            continue
+        if os.path.realpath(entry.source) != real_path:
+            continue
+        try:
+            devices.add(os.stat(entry.mount_point).st_dev)
+        except OSError:
+            devices.add(entry.dev)
+    if not devices:
+        devices.add(st.st_rdev)
+
+    return devices
+
+
+# =============================================================================
+class MountTableCache(object):
+    """
+    A thread safe cache of the mount table, which is read again only,
+    if the kernel signals a change of the mount table by POLLPRI on
+    an open file descriptor of /proc/self/mounts (or on the first usage).
+    Without poll() support the mount table is read on every usage.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self, filename=MOUNTINFO_FILE, watch_file=MOUNTS_FILE):
+        """
+        @param filename: the mountinfo file to read
+        @type filename: str
+        @param watch_file: the file to poll for changes
+        @type watch_file: str
+
+        """
+
+        self.filename = filename
+        self.watch_file = watch_file
+        self.reads = 0
+        self._lock = threading.Lock()
+        self._mounts = None
+        self._fh = None
+        self._poll = None
+
+    # -------------------------------------------------------------------------
+    def _watch(self):
+
+        if self._fh is not None or not hasattr(select, 'poll'):
+            return
+        try:
+            self._fh = open(self.watch_file)
+        except IOError as e:
+            log.debug(_("Could not watch %(f)r for changes: %(e)s") % {
+                'f': self.watch_file, 'e': e})
+            return
+        self._poll = select.poll()
+        self._poll.register(self._fh.fileno(), select.POLLPRI | select.POLLERR)
+
+    # -------------------------------------------------------------------------
+    def changed(self):
+        """
+        Checks without blocking, whether the mount table has changed since
+        the last check. Without a watched file it's always True.
+        """
+
+        with self._lock:
+            self._watch()
+            if not self._changed():
+                return False
+            self._mounts = None
+            return True
+
+    # -------------------------------------------------------------------------
+    def _changed(self):
+
+        if self._poll is None:
+            return True
+        return bool(self._poll.poll(0))
+
+    # -------------------------------------------------------------------------
+    def get(self):
+        """
+        Gives back the (maybe cached) mount table.
+
+        @raise IOError: if the mount table could not be read
+        @raise ValueError: on an invalid line
+
+        @return: all mounts
+        @rtype: list of MountEntry
+
+        """
+
+        with self._lock:
+            # the file is watched before reading, so no change is missed
+            self._watch()
+            if self._mounts is None or self._changed():
+                self._mounts = read_mountinfo(self.filename)
+                self.reads += 1
+                if self.reads > 1:
+                    log.debug(_("Mount table has changed, read it again."))
+            return list(self._mounts)
+
+    # -------------------------------------------------------------------------
+    def fileno(self):
+        """
+        Gives back the file descriptor of the watched file for polling it
+        for POLLPRI by the caller (who has to call invalidate() after
+        an event), or None, if there is no watched file.
+        """
+
+        with self._lock:
+            self._watch()
+            if self._fh is None:
+                return None
+            return self._fh.fileno()
+
+    # -------------------------------------------------------------------------
+    def invalidate(self):
+        """Forces reading of the mount table on the next usage."""
+
+        with self._lock:
+            self._mounts = None
+
+    # -------------------------------------------------------------------------
+    def close(self):
+        """Closes the watched file, the mount table is not cached anymore."""
+
+        with self._lock:
+            if self._fh is not None:
+                self._poll.unregister(self._fh.fileno())
+                self._fh.close()
+            self._fh = None
+            self._poll = None
+            self._mounts = None
+
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
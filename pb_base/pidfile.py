@@ -30,9 +30,11 @@ from pb_base.object import PbBaseObject
 
 from pb_base.common import to_utf8_or_bust
 
+from pb_base.proc_index import start_ticks
+
 from pb_base.translate import pb_gettext, pb_ngettext
 
-__version__ = '0.5.4'
+__version__ = '0.6.1'
 
 log = logging.getLogger(__name__)
 
@@ -375,7 +377,7 @@ class PidFile(PbBaseObject):
                 "Writing %(pid)d into '%(pidfile)s' ...") % {
                 'pid': pid, 'pidfile': self.filename})
 
-        out = "%d\n" % (pid)
+        out = self._content(pid)
         if six.PY3:
             out = to_utf8_or_bust(out)
         try:
@@ -434,10 +436,24 @@ class PidFile(PbBaseObject):
                 'pid': pid, 'pidfile': self.filename})
 
         try:
-            fh.write("%d\n" % (pid))
+            fh.write(self._content(pid))
         finally:
             fh.close()
 
+    # -------------------------------------------------------------------------
+    def _content(self, pid):
+        """
+        Gives back the content of the pidfile: the PID in the first line
+        and the start time of the process in clock ticks after boot in the
+        second line, if it's known, to detect a reuse of the PID.
+        """
+
+        content = "%d\n" % (pid)
+        ticks = start_ticks(pid)
+        if ticks is not None:
+            content += "%d\n" % (ticks)
+        return content
+
     # -------------------------------------------------------------------------
     def check(self):
         """
@@ -515,10 +531,13 @@ class PidFile(PbBaseObject):
         # Performing content of pidfile
 
         pid = None
+        ticks = None
         line = content.strip()
-        match = re.search(r'^\s*(\d+)\s*$', line)
+        match = re.search(r'^\s*(\d+)\s*(?:\n\s*(\d+)\s*)?$', line)
         if match:
             pid = int(match.group(1))
+            if match.group(2) is not None:
+                ticks = int(match.group(2))
         else:
             msg = _("No useful information found in pidfile %(file)r: %(line)r")
             log.warn(msg % {'file': self.filename, 'line': line})
@@ -528,6 +547,16 @@ class PidFile(PbBaseObject):
             msg = _("Trying check for process with PID %d ...") % (pid)
             log.debug(msg)
 
+        # A running process with another start time than the stored one
+        # has reused the PID of the died process. Without a stored start
+        # time (or without /proc) the process is only signalled.
+        if ticks is not None:
+            current_ticks = start_ticks(pid)
+            if current_ticks is not None and current_ticks != ticks:
+                log.info(_(
+                    "Process with PID %d anonymous died, the PID was reused."), pid)
+                return True
+
         try:
             os.kill(pid, 0)
         except OSError as err:
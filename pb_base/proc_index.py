@@ -0,0 +1,624 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, ProfitBricks GmbH, Berlin
+@summary: module for an index of the files used by running processes,
+          built by scanning /proc, like the fuser command does.
+"""
+
+# Standard modules
+import os
+import time
+import errno
+import logging
+import threading
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# Own modules
+from pb_base.mountinfo import filesystem_devices
+
+from pb_base.translate import pb_gettext, pb_ngettext
+
+__version__ = '0.3.2'
+
+log = logging.getLogger(__name__)
+
+_ = pb_gettext
+__ = pb_ngettext
+
+# -----------------------------------------------------------------------------
+# Module variables
+
+PROC_DIR = os.sep + 'proc'
+
+# The kinds of access of a process to a file, like in the output of fuser
+ACCESS_FD = 'f'
+ACCESS_CWD = 'c'
+ACCESS_ROOT = 'r'
+ACCESS_EXE = 'e'
+ACCESS_MMAP = 'm'
+
+# errors of vanished processes or of processes of other users
+IGNORED_ERRNOS = (errno.ENOENT, errno.ESRCH, errno.EACCES, errno.EPERM)
+
+# Seconds, after them all files of a process are examined again on
+# a refresh of the index, also the unchanged links in /proc/<pid>
+RESCAN_INTERVAL = 30.0
+
+# The links in /proc/<pid> to the used files besides the file descriptors
+PROC_LINKS = (('cwd', ACCESS_CWD), ('root', ACCESS_ROOT), ('exe', ACCESS_EXE))
+
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+
+_boot_time = None
+_shared_index = None
+_shared_lock = threading.Lock()
+
+
+# =============================================================================
+def list_dir(path):
+    """
+    Gives back the names and paths of the entries of a directory, by
+    os.scandir() (or the scandir module), if available.
+
+    @raise OSError: if the directory could not be read
+
+    @return: the names and paths of the entries
+    @rtype: list of tuple
+
+    """
+
+    if scandir is not None:
+        return [(entry.name, entry.path) for entry in scandir(path)]
+    return [(name, os.path.join(path, name)) for name in os.listdir(path)]
+
+
+# =============================================================================
+def list_pids(proc_dir=PROC_DIR):
+    """Gives back the IDs of all running processes."""
+
+    return [int(name) for (name, path) in list_dir(proc_dir) if name.isdigit()]
+
+
+# =============================================================================
+def scan_process(pid, proc_dir=PROC_DIR):
+    """
+    Collects all files used by the given process: the targets of its open
+    file descriptors, its current working directory, its root directory,
+    its executable and its memory mapped files.
+
+    Files, which could not be examined because of missing permissions,
+    are silently omitted.
+
+    @param pid: the process ID
+    @type pid: int
+    @param proc_dir: the mount point of the proc filesystem
+    @type proc_dir: str
+
+    @return: the used files as tuples of (st_dev, st_ino, access), or None,
+             if the process doesn't exist anymore
+    @rtype: set of tuple or None
+
+    """
+
+    links = scan_links(pid, proc_dir)
+    if links is None:
+        return None
+    files = set(f for (target, f) in links.values())
+    files.update(scan_maps(pid, proc_dir))
+    return files
+
+
+# =============================================================================
+def scan_links(pid, proc_dir=PROC_DIR, known=None):
+    """
+    Examines the links of the given process to its used files: its open
+    file descriptors, its current working directory, its root directory
+    and its executable. Only links with another target than in the given
+    known links are examined by stat(), so the listing is cheap for
+    a mostly unchanged process.
+
+    Links, which could not be examined because of missing permissions,
+    are silently omitted.
+
+    @param pid: the process ID
+    @type pid: int
+    @param proc_dir: the mount point of the proc filesystem
+    @type proc_dir: str
+    @param known: the result of a former call for the same process
+    @type known: dict or None
+
+    @return: the link targets and the used files as tuples of
+             (st_dev, st_ino, access) by the names of the links (e.g. 'cwd'
+             or 'fd/3'), or None, if the process doesn't exist anymore
+    @rtype: dict or None
+
+    """
+
+    pid_dir = os.path.join(proc_dir, str(pid))
+    if known is None:
+        known = {}
+    links = {}
+
+    def examine(name, path, access):
+        try:
+            target = os.readlink(path)
+        except OSError as e:
+            return e
+        old = known.get(name)
+        if old is not None and old[0] == target:
+            links[name] = old
+            return None
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            return e
+        links[name] = (target, (st.st_dev, st.st_ino, access))
+        return None
+
+    for (name, access) in PROC_LINKS:
+        error = examine(name, os.path.join(pid_dir, name), access)
+        if error is not None and error.errno == errno.ENOENT:
+            if not os.path.exists(pid_dir):
+                return None
+
+    try:
+        entries = list_dir(os.path.join(pid_dir, 'fd'))
+    except OSError as e:
+        if e.errno not in IGNORED_ERRNOS:
+            raise
+        entries = []
+    for (name, path) in entries:
+        examine('fd/' + name, path, ACCESS_FD)
+
+    return links
+
+
+# =============================================================================
+def scan_maps(pid, proc_dir=PROC_DIR):
+    """
+    Collects the memory mapped files of the given process.
+
+    @param pid: the process ID
+    @type pid: int
+    @param proc_dir: the mount point of the proc filesystem
+    @type proc_dir: str
+
+    @return: the mapped files as tuples of (st_dev, st_ino, access)
+    @rtype: set of tuple
+
+    """
+
+    pid_dir = os.path.join(proc_dir, str(pid))
+    files = set()
+
+    try:
+        with open(os.path.join(pid_dir, 'maps')) as fh:
+            content = fh.read()
+    except (IOError, OSError):
+        content = ''
+    seen = set()
+    for line in content.splitlines():
+        fields = line.split(None, 5)
+        if len(fields) < 5 or fields[4] == '0':
+            continue
+        key = (fields[3], fields[4])
+        if key in seen:
+            continue
+        seen.add(key)
+        try:
+            (major, minor) = fields[3].split(':')
+            files.add((
+                os.makedev(int(major, 16), int(minor, 16)), int(fields[4]), ACCESS_MMAP))
+        except ValueError:
+            continue
+
+    return files
+
+
+# =============================================================================
+def read_proc_stat(pid, proc_dir=PROC_DIR):
+    """
+    Reads the status of a process from /proc/<pid>/stat.
+
+    @param pid: the process ID
+    @type pid: int
+    @param proc_dir: the mount point of the proc filesystem
+    @type proc_dir: str
+
+    @return: the state (e.g. 'S' or 'Z'), the start time in clock ticks
+             after boot, the consumed CPU time in clock ticks and the size
+             of the virtual memory, or None, if the process doesn't exist
+             or could not be examined
+    @rtype: tuple or None
+
+    """
+
+    try:
+        with open(os.path.join(proc_dir, str(pid), 'stat')) as fh:
+            content = fh.read()
+    except (IOError, OSError):
+        return None
+
+    # the command name in parentheses may contain spaces and parentheses
+    fields = content[content.rfind(')') + 2:].split()
+    try:
+        return (
+            fields[0], int(fields[19]), int(fields[11]) + int(fields[12]),
+            int(fields[20]))
+    except (IndexError, ValueError):
+        return None
+
+
+# =============================================================================
+def start_ticks(pid, proc_dir=PROC_DIR):
+    """
+    Gives back the start time of a process in clock ticks after boot
+    (field 22 of /proc/<pid>/stat). Unlike a start time in seconds since
+    the epoch it doesn't depend on steps of the system clock, so it
+    identifies a process together with its PID, e.g. for the detection
+    of a reused PID in a pidfile.
+
+    @return: the start time in clock ticks or None, if the process
+             doesn't exist or could not be examined
+    @rtype: int or None
+
+    """
+
+    proc_stat = read_proc_stat(pid, proc_dir)
+    if proc_stat is None:
+        return None
+    return proc_stat[1]
+
+
+# =============================================================================
+def boot_time(proc_dir=PROC_DIR):
+    """
+    Gives back the boot time of the system as seconds since the epoch
+    from /proc/stat, or None, if it could not be read.
+    """
+
+    global _boot_time
+
+    if _boot_time is not None and proc_dir == PROC_DIR:
+        return _boot_time
+
+    btime = None
+    try:
+        with open(os.path.join(proc_dir, 'stat')) as fh:
+            for line in fh:
+                if line.startswith('btime '):
+                    btime = int(line.split()[1])
+                    break
+    except (IOError, OSError, ValueError):
+        return None
+
+    if proc_dir == PROC_DIR:
+        _boot_time = btime
+    return btime
+
+
+# =============================================================================
+def get_proc_index():
+    """
+    Gives back the index of the running processes shared by all
+    FuserHandler objects with the backend 'native' in the current process.
+    Every refresh lists the links of all processes, callers accepting
+    a slightly outdated index should use refresh() with max_age.
+    """
+
+    global _shared_index
+
+    with _shared_lock:
+        if _shared_index is None:
+            _shared_index = ProcIndex()
+        return _shared_index
+
+
+# =============================================================================
+class ProcIndex(object):
+    """
+    An inverted index of the files used by all running processes, from
+    (st_dev, st_ino) to the IDs of the using processes, and from st_dev
+    alone for queries of whole filesystems. It's built by a scan of /proc
+    and answers queries for many files at once::
+
+        index = ProcIndex()
+        index.scan()
+        pids = index.query(['/var/lib/foo', '/dev/sdb1'])
+        pids = index.query(['/var'], mount=True)
+
+    The index may be kept up to date by refresh(), which lists the file
+    descriptors and the other links in /proc/<pid> of all processes, but
+    examines only links with a changed target by stat(). The memory
+    mapped files are collected again only of processes, whose consumed
+    CPU time or size of virtual memory has changed since the last refresh,
+    and of the current process. All files of a process are examined again
+    after rescan_interval seconds. So a refresh saves the stat() calls and
+    the reading of the memory maps of unchanged processes, not the walk
+    through /proc, which is only saved by a refresh with max_age.
+
+    Without root privileges only the processes of the current user
+    can be examined.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self, proc_dir=PROC_DIR, rescan_interval=RESCAN_INTERVAL):
+        """
+        @param proc_dir: the mount point of the proc filesystem
+        @type proc_dir: str
+        @param rescan_interval: the maximum age in seconds of the examined
+                                files of a process
+        @type rescan_interval: float
+
+        """
+
+        self.proc_dir = proc_dir
+        self.rescan_interval = rescan_interval
+        self._by_inode = {}
+        self._by_dev = {}
+        # (signature, files, scanned_at, links, mapped files) by process ID
+        self._procs = {}
+        self._lock = threading.RLock()
+        self.scanned = False
+        self.last_refresh = None
+        self.last_scanned = 0
+
+    # -------------------------------------------------------------------------
+    def scan(self):
+        """Scans all running processes and builds the index again."""
+
+        self.refresh(full=True)
+
+    # -------------------------------------------------------------------------
+    def refresh(self, max_age=None, full=False):
+        """
+        Brings the index up to date by listing the links of all processes
+        and examining only new and changed links and memory maps of them,
+        see the class description.
+
+        @param max_age: don't refresh, if the last refresh is younger than
+                        this number of seconds
+        @type max_age: float or None
+        @param full: examine all files of all processes again
+        @type full: bool
+
+        @return: the index was refreshed
+        @rtype: bool
+
+        """
+
+        with self._lock:
+            now = time.time()
+            if (max_age is not None and self.scanned and not full and
+                    now - self.last_refresh < max_age):
+                return False
+
+            pids = list_pids(self.proc_dir)
+            running = set(pids)
+            for pid in list(self._procs.keys()):
+                if pid not in running:
+                    self._forget(pid)
+
+            scanned = 0
+            own_pid = os.getpid()
+            for pid in pids:
+                proc_stat = read_proc_stat(pid, self.proc_dir)
+                if proc_stat is None:
+                    self._forget(pid)
+                    continue
+                signature = proc_stat[1:]
+                entry = self._procs.get(pid)
+                if entry is not None and entry[0][0] != signature[0]:
+                    # the PID was reused by a new process
+                    self._forget(pid)
+                    entry = None
+                rescan = full or entry is None or now - entry[2] >= self.rescan_interval
+
+                links = scan_links(pid, self.proc_dir, None if rescan else entry[3])
+                if links is None:
+                    self._forget(pid)
+                    continue
+                if rescan or entry[0] != signature or pid == own_pid:
+                    mapped = scan_maps(pid, self.proc_dir)
+                    scanned += 1
+                else:
+                    mapped = entry[4]
+                scanned_at = now if rescan else entry[2]
+
+                files = set(f for (target, f) in links.values())
+                files.update(mapped)
+                if entry is not None and entry[1] == files:
+                    files = entry[1]
+                else:
+                    if entry is not None:
+                        self._remove_files(pid, entry[1])
+                    self._add_files(pid, files)
+                self._procs[pid] = (signature, files, scanned_at, links, mapped)
+
+            self.scanned = True
+            self.last_refresh = now
+            self.last_scanned = scanned
+            log.debug(
+                _("Examined %(s)d of %(p)d processes, %(f)d files are in use."),
+                {'s': scanned, 'p': len(pids), 'f': len(self._by_inode)})
+
+        return True
+
+    # -------------------------------------------------------------------------
+    def _add_files(self, pid, files):
+
+        for (dev, ino, access) in files:
+            users = self._by_inode.get((dev, ino))
+            if users is None:
+                users = self._by_inode[(dev, ino)] = {}
+            users[pid] = users.get(pid, '') + access
+            users = self._by_dev.get(dev)
+            if users is None:
+                users = self._by_dev[dev] = {}
+            if access not in users.get(pid, ''):
+                users[pid] = users.get(pid, '') + access
+
+    # -------------------------------------------------------------------------
+    def _remove_files(self, pid, files):
+
+        for (dev, ino, access) in files:
+            for (index, key) in ((self._by_inode, (dev, ino)), (self._by_dev, dev)):
+                users = index.get(key)
+                if users is None:
+                    continue
+                users.pop(pid, None)
+                if not users:
+                    del index[key]
+
+    # -------------------------------------------------------------------------
+    def _forget(self, pid):
+
+        entry = self._procs.pop(pid, None)
+        if entry is not None:
+            self._remove_files(pid, entry[1])
+
+    # -------------------------------------------------------------------------
+    def start_time(self, pid):
+        """
+        Gives back the start time of a running process.
+
+        A process with another start time than the indexed one has reused
+        the PID of a died process, so the files of the died one are
+        removed from the index.
+
+        @param pid: the process ID
+        @type pid: int
+
+        @return: the start time in seconds since the epoch, or None, if the
+                 process doesn't exist (or could not be examined, e.g.
+                 without a mounted proc filesystem)
+        @rtype: float or None
+
+        """
+
+        proc_stat = read_proc_stat(pid, self.proc_dir)
+        with self._lock:
+            entry = self._procs.get(pid)
+            if entry is not None and (proc_stat is None or entry[0][0] != proc_stat[1]):
+                self._forget(pid)
+
+        if proc_stat is None:
+            return None
+        btime = boot_time(self.proc_dir)
+        if btime is None:
+            return None
+        return btime + float(proc_stat[1]) / CLOCK_TICKS
+
+    # -------------------------------------------------------------------------
+    def users(self, dev, ino):
+        """
+        Gives back the processes using the file with the given device
+        and inode number and their kinds of access.
+
+        @return: the kinds of access (e.g. 'fc') by process ID
+        @rtype: dict
+
+        """
+
+        with self._lock:
+            if not self.scanned:
+                self.scan()
+            return dict(self._by_inode.get((dev, ino), {}))
+
+    # -------------------------------------------------------------------------
+    def pids(self, dev, ino):
+        """
+        Gives back the sorted IDs of all processes using the file with
+        the given device and inode number.
+        """
+
+        return sorted(self.users(dev, ino).keys())
+
+    # -------------------------------------------------------------------------
+    def fs_users(self, dev):
+        """
+        Gives back the processes using any file on the filesystem with
+        the given device number and their kinds of access.
+
+        @return: the kinds of access (e.g. 'fc') by process ID
+        @rtype: dict
+
+        """
+
+        with self._lock:
+            if not self.scanned:
+                self.scan()
+            return dict(self._by_dev.get(dev, {}))
+
+    # -------------------------------------------------------------------------
+    def fs_pids(self, dev):
+        """
+        Gives back the sorted IDs of all processes using any file on
+        the filesystem with the given device number.
+        """
+
+        return sorted(self.fs_users(dev).keys())
+
+    # -------------------------------------------------------------------------
+    def query(self, paths, mount=False):
+        """
+        Gives back the IDs of all processes using the given files.
+        Not existing files are used by no process.
+
+        @param paths: the files to check
+        @type paths: list of str
+        @param mount: check the whole filesystems of the given files like
+                      'fuser -m', see filesystem_devices()
+        @type mount: bool
+
+        @return: the sorted process IDs by path
+        @rtype: dict
+
+        """
+
+        result = {}
+        for path in paths:
+            if not mount:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    result[path] = []
+                    continue
+                result[path] = self.pids(st.st_dev, st.st_ino)
+                continue
+
+            try:
+                devices = filesystem_devices(path)
+            except OSError:
+                result[path] = []
+                continue
+            pids = set()
+            for dev in devices:
+                pids.update(self.fs_users(dev).keys())
+            result[path] = sorted(pids)
+
+        return result
+
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,492 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, ProfitBricks GmbH, Berlin
+@summary: module for some Linux specific system calls, which are not
+          (or not in all Python versions) available in the os module.
+          They are called through ctypes from the C library.
+"""
+
+# Standard modules
+import sys
+import os
+import errno
+import struct
+import logging
+import platform
+import ctypes
+import ctypes.util
+
+# Own modules
+from pb_base.translate import pb_gettext, pb_ngettext
+
+__version__ = '0.2.1'
+
+log = logging.getLogger(__name__)
+
+_ = pb_gettext
+__ = pb_ngettext
+
+# -----------------------------------------------------------------------------
+# Module variables
+
+IOPRIO_CLASS_NONE = 0
+IOPRIO_CLASS_RT = 1
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_PRIO_MASK = (1 << IOPRIO_CLASS_SHIFT) - 1
+
+IOPRIO_WHO_PROCESS = 1
+
+# The level used inside the classes 'realtime' and 'best-effort',
+# if none is given (like ionice)
+IOPRIO_DEFAULT_LEVEL = 4
+
+ioprio_class_names = {
+    'none': IOPRIO_CLASS_NONE,
+    'realtime': IOPRIO_CLASS_RT,
+    'rt': IOPRIO_CLASS_RT,
+    'best-effort': IOPRIO_CLASS_BE,
+    'be': IOPRIO_CLASS_BE,
+    'idle': IOPRIO_CLASS_IDLE,
+}
+
+# Numbers of the system calls ioprio_set and ioprio_get per architecture
+ioprio_syscalls = {
+    'x86_64': (251, 252),
+    'i386': (289, 290),
+    'i686': (289, 290),
+    'aarch64': (30, 31),
+    'armv7l': (314, 315),
+    'ppc64le': (273, 274),
+    'ppc64': (273, 274),
+    's390x': (282, 283),
+}
+
+PRIO_PROCESS = 0
+
+SPLICE_F_MOVE = 1
+SPLICE_F_NONBLOCK = 2
+SPLICE_F_MORE = 4
+
+FALLOC_FL_KEEP_SIZE = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+FALLOC_FL_COLLAPSE_RANGE = 0x08
+FALLOC_FL_ZERO_RANGE = 0x10
+
+# inotify events (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+# flags of inotify_init1()
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# struct inotify_event without the name
+INOTIFY_EVENT = struct.Struct('iIII')
+
+_libc = None
+
+
+# =============================================================================
+def libc():
+    """
+    Gives back the C library as a ctypes.CDLL object, which is loaded
+    on first usage.
+    """
+
+    global _libc
+
+    if _libc is None:
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            libc_name = 'libc.so.6'
+        _libc = ctypes.CDLL(libc_name, use_errno=True)
+
+    return _libc
+
+
+# =============================================================================
+def _raise_errno(what):
+    """Raises an OSError with the current errno of the C library."""
+
+    err = ctypes.get_errno()
+    raise OSError(err, "%s: %s" % (what, os.strerror(err)))
+
+
+# =============================================================================
+def ioprio_class(value):
+    """
+    Converts the given value into a numeric I/O scheduling class.
+
+    @raise ValueError: on an invalid value
+
+    @param value: the I/O scheduling class as a number (0 - 3) or a name
+                  ('none', 'realtime', 'best-effort', 'idle')
+    @type value: int or str
+
+    @return: the numeric I/O scheduling class
+    @rtype: int
+
+    """
+
+    if isinstance(value, int):
+        if value < IOPRIO_CLASS_NONE or value > IOPRIO_CLASS_IDLE:
+            raise ValueError(_("Invalid I/O scheduling class %r.") % (value))
+        return value
+
+    name = str(value).strip().lower()
+    if name.isdigit():
+        return ioprio_class(int(name))
+    if name not in ioprio_class_names:
+        raise ValueError(_("Invalid I/O scheduling class %r.") % (value))
+    return ioprio_class_names[name]
+
+
+# =============================================================================
+def set_ioprio(ioclass, level=IOPRIO_DEFAULT_LEVEL, pid=0):
+    """
+    Sets the I/O scheduling class and level (like ionice) of the given
+    process or thread.
+
+    @raise OSError: if the system call fails or is not available
+    @raise ValueError: on invalid values for ioclass or level
+
+    @param ioclass: the I/O scheduling class, see ioprio_class()
+    @type ioclass: int or str
+    @param level: the level inside the class (0 - 7), ignored for the
+                  classes 'none' and 'idle', None means the default level 4
+    @type level: int or None
+    @param pid: the ID of the process or thread, 0 means the calling thread
+    @type pid: int
+
+    @return: None
+
+    """
+
+    ioclass = ioprio_class(ioclass)
+    if ioclass in (IOPRIO_CLASS_NONE, IOPRIO_CLASS_IDLE):
+        level = 0
+    elif level is None:
+        level = IOPRIO_DEFAULT_LEVEL
+    level = int(level)
+    if level < 0 or level > 7:
+        raise ValueError(_("Invalid I/O scheduling level %r.") % (level))
+
+    machine = platform.machine()
+    if machine not in ioprio_syscalls:
+        raise OSError(errno.ENOSYS, _(
+            "System call ioprio_set is not known on architecture %r.") % (machine))
+
+    value = (ioclass << IOPRIO_CLASS_SHIFT) | level
+    nr = ioprio_syscalls[machine][0]
+    if libc().syscall(nr, IOPRIO_WHO_PROCESS, int(pid), value) < 0:
+        _raise_errno('ioprio_set')
+
+
+# =============================================================================
+def get_ioprio(pid=0):
+    """
+    Gives back the I/O scheduling class and level of the given process
+    or thread.
+
+    @raise OSError: if the system call fails or is not available
+
+    @param pid: the ID of the process or thread, 0 means the calling thread
+    @type pid: int
+
+    @return: the I/O scheduling class and level
+    @rtype: tuple of two int
+
+    """
+
+    machine = platform.machine()
+    if machine not in ioprio_syscalls:
+        raise OSError(errno.ENOSYS, _(
+            "System call ioprio_get is not known on architecture %r.") % (machine))
+
+    nr = ioprio_syscalls[machine][1]
+    value = libc().syscall(nr, IOPRIO_WHO_PROCESS, int(pid))
+    if value < 0:
+        _raise_errno('ioprio_get')
+
+    return (value >> IOPRIO_CLASS_SHIFT, value & IOPRIO_PRIO_MASK)
+
+
+# =============================================================================
+def renice_thread(increment):
+    """
+    Increments the niceness of the calling thread only (on Linux the
+    niceness is a per-thread attribute), in difference to os.nice(),
+    which changes the niceness of the whole process in Python.
+
+    @raise OSError: if the system call fails
+
+    @param increment: the value to add to the current niceness
+    @type increment: int
+
+    @return: the new niceness of the calling thread
+    @rtype: int
+
+    """
+
+    if hasattr(os, 'setpriority'):
+        cur_nice = os.getpriority(os.PRIO_PROCESS, 0)
+        new_nice = min(cur_nice + int(increment), 19)
+        os.setpriority(os.PRIO_PROCESS, 0, new_nice)
+        return new_nice
+
+    ctypes.set_errno(0)
+    cur_nice = libc().getpriority(PRIO_PROCESS, 0)
+    if cur_nice == -1 and ctypes.get_errno():
+        _raise_errno('getpriority')
+    new_nice = min(cur_nice + int(increment), 19)
+    if libc().setpriority(PRIO_PROCESS, 0, new_nice) < 0:
+        _raise_errno('setpriority')
+    return new_nice
+
+
+# =============================================================================
+def splice(fd_in, fd_out, count, flags=0):
+    """
+    Moves up to count bytes between two file descriptors without copying
+    them into the user space, one of them must be a pipe. The current file
+    offsets of the file descriptors are used and updated.
+
+    It uses os.splice(), if available (Python >= 3.10), else the C library.
+
+    @raise OSError: if the system call fails
+
+    @param fd_in: the file descriptor to read from
+    @type fd_in: int
+    @param fd_out: the file descriptor to write to
+    @type fd_out: int
+    @param count: the maximum number of bytes to move
+    @type count: int
+    @param flags: a combination of the SPLICE_F_* flags
+    @type flags: int
+
+    @return: the number of moved bytes, 0 means end of input
+    @rtype: int
+
+    """
+
+    if hasattr(os, 'splice'):
+        return os.splice(fd_in, fd_out, count, flags=flags)
+
+    func = libc().splice
+    func.restype = ctypes.c_ssize_t
+    func.argtypes = (
+        ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p,
+        ctypes.c_size_t, ctypes.c_uint)
+    res = func(fd_in, None, fd_out, None, count, flags)
+    if res < 0:
+        _raise_errno('splice')
+    return res
+
+
+# =============================================================================
+def fallocate(fd, mode, offset, length):
+    """
+    Manipulates the allocated disk space of the given file (or block device)
+    by the Linux specific system call fallocate(2), e.g. punching holes
+    (FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE) or zeroing ranges
+    (FALLOC_FL_ZERO_RANGE).
+
+    @raise OSError: if the system call fails, EOPNOTSUPP means, that the
+                    filesystem or device doesn't support the given mode
+
+    @param fd: the file descriptor
+    @type fd: int
+    @param mode: a combination of the FALLOC_FL_* flags
+    @type mode: int
+    @param offset: the start of the range in bytes
+    @type offset: int
+    @param length: the length of the range in bytes
+    @type length: int
+
+    @return: None
+
+    """
+
+    func = libc().fallocate64
+    func.restype = ctypes.c_int
+    func.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+    if func(fd, mode, offset, length) < 0:
+        _raise_errno('fallocate')
+
+
+# =============================================================================
+def syncfs(fd):
+    """
+    Commits all buffered data and metadata of the filesystem containing
+    the given file descriptor to disk, it's a much cheaper durability
+    barrier for many files than calling fsync() for each of them.
+
+    If syncfs(2) is not available in the C library, sync(2) is used,
+    which syncs all filesystems.
+
+    @raise OSError: if the system call fails
+
+    @param fd: an open file descriptor of any file or directory of
+               the filesystem to sync
+    @type fd: int
+
+    @return: None
+
+    """
+
+    try:
+        func = libc().syncfs
+    except AttributeError:
+        log.debug(_("syncfs() not available, using sync() instead."))
+        libc().sync()
+        return
+
+    func.restype = ctypes.c_int
+    func.argtypes = (ctypes.c_int, )
+    if func(fd) < 0:
+        _raise_errno('syncfs')
+
+
+# =============================================================================
+def inotify_init(flags=IN_NONBLOCK | IN_CLOEXEC):
+    """
+    Creates a new inotify instance.
+
+    @raise OSError: if the system call fails or is not available
+
+    @param flags: a combination of IN_NONBLOCK and IN_CLOEXEC
+    @type flags: int
+
+    @return: the file descriptor of the inotify instance
+    @rtype: int
+
+    """
+
+    try:
+        func = libc().inotify_init1
+    except AttributeError:
+        raise OSError(errno.ENOSYS, _("System call inotify_init1 is not available."))
+
+    func.restype = ctypes.c_int
+    func.argtypes = (ctypes.c_int, )
+    fd = func(flags)
+    if fd < 0:
+        _raise_errno('inotify_init1')
+    return fd
+
+
+# =============================================================================
+def inotify_add_watch(fd, path, mask):
+    """
+    Adds a watch for the given events on a file or directory to an
+    inotify instance. Adding a watch for an already watched inode
+    replaces its mask.
+
+    @raise OSError: if the system call fails
+
+    @param fd: the file descriptor of the inotify instance
+    @type fd: int
+    @param path: the file or directory to watch
+    @type path: str
+    @param mask: a combination of the IN_* events
+    @type mask: int
+
+    @return: the watch descriptor
+    @rtype: int
+
+    """
+
+    if not isinstance(path, bytes):
+        path = path.encode(sys.getfilesystemencoding())
+
+    func = libc().inotify_add_watch
+    func.restype = ctypes.c_int
+    func.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+    wd = func(fd, path, mask)
+    if wd < 0:
+        _raise_errno('inotify_add_watch')
+    return wd
+
+
+# =============================================================================
+def inotify_rm_watch(fd, wd):
+    """
+    Removes a watch from an inotify instance, a watch removed already by
+    the kernel (e.g. after deleting the watched file) is ignored.
+
+    @raise OSError: if the system call fails
+
+    """
+
+    func = libc().inotify_rm_watch
+    func.restype = ctypes.c_int
+    func.argtypes = (ctypes.c_int, ctypes.c_int)
+    if func(fd, wd) < 0:
+        if ctypes.get_errno() == errno.EINVAL:
+            return
+        _raise_errno('inotify_rm_watch')
+
+
+# =============================================================================
+def read_inotify_events(fd, size=4096):
+    """
+    Reads all pending events from a non blocking inotify instance.
+
+    @raise OSError: if reading fails
+
+    @param fd: the file descriptor of the inotify instance
+    @type fd: int
+    @param size: the size of the buffer for a single read
+    @type size: int
+
+    @return: the events as tuples of (wd, mask, cookie, name)
+    @rtype: list of tuple
+
+    """
+
+    events = []
+    while True:
+        try:
+            data = os.read(fd, size)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                break
+            raise
+        if not data:
+            break
+
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            (wd, mask, cookie, length) = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((wd, mask, cookie, name))
+
+    return events
+
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -0,0 +1,417 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@copyright: © 2010 - 2016 by Frank Brehm, ProfitBricks GmbH, Berlin
+@summary: module for limiting the bandwidth and the number of I/O
+          operations of bulk data operations by token buckets.
+"""
+
+# Standard modules
+import re
+import time
+import logging
+import threading
+
+# Own modules
+from pb_base.common import bytes2human
+
+from pb_base.translate import pb_gettext, pb_ngettext
+
+__version__ = '0.1.1'
+
+log = logging.getLogger(__name__)
+
+_ = pb_gettext
+__ = pb_ngettext
+
+# -----------------------------------------------------------------------------
+# Module variables
+
+re_rate = re.compile(r'^\s*(\d+(?:\.\d*)?)\s*([kmgt]?)(?:i?b)?(?:/s)?\s*$', re.IGNORECASE)
+re_limit_line = re.compile(r'^\s*([a-z_]+)\s*[=:]\s*(.*?)\s*$', re.IGNORECASE)
+
+# the maximum time of one sleep, the remaining waiting time is recomputed
+# after each slice, so changed limits are taking effect also for waiting
+# consumers
+MAX_SLEEP = 0.1
+
+rate_factors = {
+    '': 1,
+    'k': 1024,
+    'm': 1024 ** 2,
+    'g': 1024 ** 3,
+    't': 1024 ** 4,
+}
+
+
+# =============================================================================
+def parse_rate(value):
+    """
+    Converts a rate like '50M', '1.5 GiB/s' or 200 into a number, the
+    suffixes are binary multiples. An empty value, 0, 'none' or
+    'unlimited' means no limit.
+
+    @raise ValueError: on an invalid value
+
+    @param value: the rate to convert
+    @type value: str or int or float or None
+
+    @return: the rate or None for no limit
+    @rtype: float or None
+
+    """
+
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        if value <= 0:
+            return None
+        return float(value)
+
+    value = str(value).strip()
+    if value.lower() in ('', 'none', 'unlimited', 'off'):
+        return None
+    match = re_rate.search(value)
+    if not match:
+        raise ValueError(_("Invalid rate %r.") % (value))
+    rate = float(match.group(1)) * rate_factors[match.group(2).lower()]
+    if rate <= 0:
+        return None
+    return rate
+
+
+# =============================================================================
+class TokenBucket(object):
+    """
+    A thread safe token bucket. Tokens are refilled with a constant rate up
+    to the burst size. Consumers may take more tokens than available, then
+    they are waiting, until the debt is paid off, so also requests greater
+    than the burst size are possible.
+
+    A rate of None means no limit. A new rate is only recorded by
+    set_rate() and applied by the next operation on the bucket, so it may
+    be changed safely from a signal handler interrupting a consumer.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self, rate=None, burst=None):
+        """
+        @param rate: the number of tokens per second
+        @type rate: float or None
+        @param burst: the maximum number of saved tokens, defaults to the
+                      tokens of one second
+        @type burst: float or None
+
+        """
+
+        self._lock = threading.Lock()
+        self._rate = None
+        self._burst = None
+        self._tokens = 0.0
+        self._last = time.time()
+        # the last requested (rate, burst), replaced as a whole by
+        # set_rate() and compared by identity with the applied one
+        self._requested = None
+        self._applied = None
+        self.set_rate(rate, burst)
+        self._apply_requested(self._last)
+
+    # -------------------------------------------------------------------------
+    @property
+    def rate(self):
+        """The number of tokens per second, None means no limit."""
+        return self._requested[0]
+
+    # -------------------------------------------------------------------------
+    @property
+    def burst(self):
+        """The maximum number of saved tokens."""
+        return self._requested[1]
+
+    # -------------------------------------------------------------------------
+    def _refill(self, now):
+
+        if self._rate:
+            self._tokens = min(
+                self._tokens + (now - self._last) * self._rate, self._burst)
+        self._last = now
+
+    # -------------------------------------------------------------------------
+    def set_rate(self, rate, burst=None):
+        """
+        Changes the rate and the burst size, it's taking effect for all
+        following requests and for the remaining waiting time of waiting
+        consumers. It doesn't take the lock, so it may be called from a
+        signal handler.
+        """
+
+        if rate is not None and rate <= 0:
+            rate = None
+        if rate is None:
+            burst = None
+        elif burst is None or burst <= 0:
+            burst = float(rate)
+        else:
+            burst = float(burst)
+        self._requested = (rate, burst)
+
+    # -------------------------------------------------------------------------
+    def _apply_requested(self, now):
+        """Applies the last requested rate, must be called with the lock."""
+
+        requested = self._requested
+        if requested is self._applied:
+            return
+        self._refill(now)
+        (rate, burst) = requested
+        was_unlimited = self._burst is None
+        self._rate = rate
+        self._burst = burst
+        if rate is None:
+            self._tokens = 0.0
+        elif was_unlimited:
+            self._tokens = burst
+        else:
+            self._tokens = min(self._tokens, burst)
+        self._applied = requested
+
+    # -------------------------------------------------------------------------
+    def take(self, tokens):
+        """
+        Takes the given number of tokens and gives back the debt, the
+        number of missing tokens, which must be paid off by waiting.
+
+        @rtype: float
+
+        """
+
+        with self._lock:
+            now = time.time()
+            self._apply_requested(now)
+            if not self._rate:
+                return 0.0
+            self._refill(now)
+            self._tokens -= tokens
+            return max(-self._tokens, 0.0)
+
+    # -------------------------------------------------------------------------
+    def reserve(self, tokens):
+        """
+        Takes the given number of tokens and gives back the time in seconds,
+        the caller has to wait before using them.
+        """
+
+        debt = self.take(tokens)
+        if not debt:
+            return 0.0
+        return self.wait_time(debt)
+
+    # -------------------------------------------------------------------------
+    def wait_time(self, debt):
+        """
+        Gives back the time in seconds to pay off the given debt with the
+        current rate, a pending new rate is applied before.
+        """
+
+        with self._lock:
+            self._apply_requested(time.time())
+            if not self._rate:
+                return 0.0
+            return debt / self._rate
+
+    # -------------------------------------------------------------------------
+    def pay_off(self, debt, elapsed):
+        """
+        Gives back the remaining debt after waiting the given time in
+        seconds with the current rate.
+        """
+
+        with self._lock:
+            self._apply_requested(time.time())
+            if not self._rate:
+                return 0.0
+            return max(debt - elapsed * self._rate, 0.0)
+
+    # -------------------------------------------------------------------------
+    def consume(self, tokens):
+        """
+        Takes the given number of tokens and waits, if necessary.
+
+        @return: the time waited in seconds
+        @rtype: float
+
+        """
+
+        return wait_reservations([(self, self.take(tokens))])
+
+
+# =============================================================================
+def wait_reservations(reservations):
+    """
+    Waits for the given reservations of token buckets in slices of at most
+    MAX_SLEEP seconds, the remaining waiting times are recomputed after each
+    slice, so changed rates are taking effect immediately.
+
+    @param reservations: pairs of a bucket and the debt given back by
+                         its take()
+    @type reservations: list of tuple
+
+    @return: the time waited in seconds
+    @rtype: float
+
+    """
+
+    reservations = [(bucket, debt) for (bucket, debt) in reservations if debt > 0]
+    start = last = time.time()
+    while reservations:
+        wait = max(bucket.wait_time(debt) for (bucket, debt) in reservations)
+        if wait <= 0:
+            break
+        time.sleep(min(wait, MAX_SLEEP))
+        now = time.time()
+        reservations = [
+            (bucket, bucket.pay_off(debt, now - last))
+            for (bucket, debt) in reservations]
+        reservations = [(bucket, debt) for (bucket, debt) in reservations if debt > 0]
+        last = now
+
+    return last - start
+
+
+# =============================================================================
+class IoThrottle(object):
+    """
+    A limiter of the bandwidth (bytes per second) and the I/O operations per
+    second of bulk data operations, e.g. PbBaseHandler.dump_data(). It's
+    used as a callback with the number of bytes of one I/O operation.
+
+    The limits may be changed at any time from any thread by set_limits()
+    or load_limits(), e.g. by a signal handler of a daemon.
+    """
+
+    # -------------------------------------------------------------------------
+    def __init__(self, bytes_per_sec=None, iops=None, burst_seconds=1.0):
+        """
+        @param bytes_per_sec: the maximum bandwidth, e.g. 52428800 or '50M'
+        @type bytes_per_sec: int or str or None
+        @param iops: the maximum number of I/O operations per second
+        @type iops: int or str or None
+        @param burst_seconds: the size of the buckets in seconds of the rate
+        @type burst_seconds: float
+
+        """
+
+        self.burst_seconds = float(burst_seconds)
+        self._bytes_bucket = TokenBucket()
+        self._ops_bucket = TokenBucket()
+        self.waited = 0.0
+        self.set_limits(bytes_per_sec, iops)
+
+    # -------------------------------------------------------------------------
+    @property
+    def bytes_per_sec(self):
+        """The maximum bandwidth in bytes per second, None means no limit."""
+        return self._bytes_bucket.rate
+
+    # -------------------------------------------------------------------------
+    @property
+    def iops(self):
+        """The maximum number of I/O operations per second."""
+        return self._ops_bucket.rate
+
+    # -------------------------------------------------------------------------
+    @property
+    def limited(self):
+        """Is there any limit set."""
+        return bool(self.bytes_per_sec or self.iops)
+
+    # -------------------------------------------------------------------------
+    def _burst(self, rate):
+        if rate is None:
+            return None
+        return max(rate * self.burst_seconds, 1.0)
+
+    # -------------------------------------------------------------------------
+    def set_limits(self, bytes_per_sec=None, iops=None):
+        """
+        Sets new limits, None means no limit.
+
+        @raise ValueError: on invalid values
+
+        """
+
+        bytes_rate = parse_rate(bytes_per_sec)
+        ops_rate = parse_rate(iops)
+        self._bytes_bucket.set_rate(bytes_rate, self._burst(bytes_rate))
+        self._ops_bucket.set_rate(ops_rate, self._burst(ops_rate))
+
+        bw = _('unlimited')
+        if bytes_rate:
+            bw = bytes2human(int(bytes_rate)) + '/s'
+        log.debug(_("I/O limits: bandwidth %(bw)s, IOPS %(iops)s.") % {
+            'bw': bw, 'iops': (int(ops_rate) if ops_rate else _('unlimited'))})
+
+    # -------------------------------------------------------------------------
+    def load_limits(self, filename):
+        """
+        Reads the limits from a file with lines like::
+
+            bytes_per_sec = 50M
+            iops = 200
+
+        Missing keys mean no limit, lines starting with '#' are ignored.
+
+        @raise IOError: if the file could not be read
+        @raise ValueError: on invalid values
+
+        """
+
+        limits = {'bytes_per_sec': None, 'iops': None}
+        with open(filename) as fh:
+            for line in fh:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                match = re_limit_line.search(line)
+                if not match:
+                    raise ValueError(_("Invalid line %(line)r in %(fn)r.") % {
+                        'line': line, 'fn': filename})
+                key = match.group(1).lower()
+                if key not in limits:
+                    raise ValueError(_("Invalid key %(key)r in %(fn)r.") % {
+                        'key': key, 'fn': filename})
+                limits[key] = match.group(2)
+
+        self.set_limits(limits['bytes_per_sec'], limits['iops'])
+
+    # -------------------------------------------------------------------------
+    def __call__(self, nbytes):
+
+        self.waited += wait_reservations([
+            (self._bytes_bucket, self._bytes_bucket.take(nbytes)),
+            (self._ops_bucket, self._ops_bucket.take(1))])
+
+    # -------------------------------------------------------------------------
+    def as_dict(self):
+        """Transforms the elements of the object into a dict."""
+
+        return {
+            '__class__': self.__class__.__name__,
+            'bytes_per_sec': self.bytes_per_sec,
+            'iops': self.iops,
+            'burst_seconds': self.burst_seconds,
+            'waited': self.waited,
+        }
+
+
+# =============================================================================
+
+if __name__ == "__main__":
+
+    pass
+
+# =============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
@@ -80,6 +80,30 @@ class TestPbCrc(PbBaseTestcase):
         log.debug("crc64_digest(%r): %r", self.test_str, cksum)
         self.assertEqual(cksum, '6ad3e5cbd36e21e0')
 
+    # -------------------------------------------------------------------------
+    def test_crc64_incremental(self):
+
+        log.info("Testing Crc64 from pb_base.crc ...")
+
+        import pb_base.crc
+
+        crc = pb_base.crc.Crc64()
+        crc.update(self.test_str[:10])
+        crc.update(self.test_str[10:])
+        log.debug("Crc64 of %r: %r", self.test_str, crc.hexdigest())
+        self.assertEqual(crc.value, (1792271819, 3547210208))
+        self.assertEqual(crc.hexdigest(), '6ad3e5cbd36e21e0')
+
+        data = self.test_str.encode('utf-8')
+        crc = pb_base.crc.Crc64(data[:7])
+        copied = crc.copy()
+        crc.update(memoryview(data)[7:])
+        self.assertEqual(crc.hexdigest(), '6ad3e5cbd36e21e0')
+        self.assertEqual(copied.hexdigest(), pb_base.crc.crc64_digest(self.test_str[:7]))
+
+        self.assertIsInstance(pb_base.crc.new_hash('crc64'), pb_base.crc.Crc64)
+        self.assertEqual(pb_base.crc.new_hash('md5').name, 'md5')
+
 # =============================================================================
 
 if __name__ == '__main__':
@@ -97,6 +121,7 @@ if __name__ == '__main__':
     suite.addTest(TestPbCrc('test_checksum256', verbose))
     suite.addTest(TestPbCrc('test_crc64', verbose))
     suite.addTest(TestPbCrc('test_crc64_digest', verbose))
+    suite.addTest(TestPbCrc('test_crc64_incremental', verbose))
 
     runner = unittest.TextTestRunner(verbosity=verbose)
 
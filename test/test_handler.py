@@ -126,6 +126,9 @@ class TestPbBaseHandler(PbBaseTestcase):
         log.info("Testing import of PbBaseHandler from pb_base.handler ...")
         from pb_base.handler import PbBaseHandler                   # noqa
 
+        log.info("Testing import of CallResult from pb_base.handler ...")
+        from pb_base.handler import CallResult                      # noqa
+
         log.info("Testing import of pb_base.handler.df ...")
         import pb_base.handler.df                                   # noqa
 
@@ -138,6 +141,12 @@ class TestPbBaseHandler(PbBaseTestcase):
         log.info("Testing import of DfHandler from pb_base.handler.df ...")
         from pb_base.handler.df import DfHandler                    # noqa
 
+        log.info("Testing import of DfTable from pb_base.handler.df ...")
+        from pb_base.handler.df import DfTable                      # noqa
+
+        log.info("Testing import of DfWatcher from pb_base.handler.df_watcher ...")
+        from pb_base.handler.df_watcher import DfWatcher            # noqa
+
         log.info("Testing import of pb_base.handler.fuser ...")
         import pb_base.handler.fuser                                # noqa
 
@@ -147,6 +156,21 @@ class TestPbBaseHandler(PbBaseTestcase):
         log.info("Testing import of FuserHandler from pb_base.handler.fuser ...")
         from pb_base.handler.fuser import FuserHandler              # noqa
 
+        log.info("Testing import of ProcIndex from pb_base.proc_index ...")
+        from pb_base.proc_index import ProcIndex                    # noqa
+
+        log.info("Testing import of DuHandler from pb_base.handler.du ...")
+        from pb_base.handler.du import DuHandler                    # noqa
+
+        log.info("Testing import of pb_base.handler.singleflight ...")
+        import pb_base.handler.singleflight                         # noqa
+
+        log.info("Testing import of pb_base.handler.priv_helper ...")
+        import pb_base.handler.priv_helper                          # noqa
+
+        log.info("Testing import of pb_base.copy_engine ...")
+        import pb_base.copy_engine                                  # noqa
+
     # -------------------------------------------------------------------------
     def test_command_not_found_error(self):
 
@@ -265,6 +289,635 @@ class TestPbBaseHandler(PbBaseTestcase):
         out = self.format_df_results(result).strip()
         log.debug("DF of all filesystems:\n%s", out)
 
+    # -------------------------------------------------------------------------
+    def test_exec_df_native(self):
+
+        log.info("Testing the native df backend against the df command.")
+
+        import tempfile
+
+        from pb_base.mountinfo import read_mountinfo
+        from pb_base.handler.df import DfHandler
+
+        (fd, mountinfo) = tempfile.mkstemp()
+        try:
+            os.write(fd, (
+                b'36 35 98:0 /mnt1 /mnt/with\\040space rw,noatime master:1 - '
+                b'ext3 /dev/root rw,errors=continue\n'
+                b'37 35 0:42 / /srv/nfs rw shared:7 - nfs4 server:/export rw\n'))
+            os.close(fd)
+            mounts = read_mountinfo(mountinfo)
+        finally:
+            os.remove(mountinfo)
+        self.assertEqual(mounts[0].mount_point, '/mnt/with space')
+        self.assertEqual(mounts[0].root, '/mnt1')
+        self.assertEqual(mounts[0].dev, os.makedev(98, 0))
+        self.assertEqual(mounts[0].fs_type, 'ext3')
+        self.assertFalse(mounts[0].remote)
+        self.assertTrue(mounts[1].remote)
+
+        df_cmd = DfHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+        df_native = DfHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+            backend='native',
+        )
+
+        def fs_list(result):
+            return [(r.dev, r.fs_type, r.total, r.used, r.free, r.fs) for r in result]
+
+        for kwargs in ({}, {'all_fs': True}, {'local': True}, {'fs': ['/']}):
+            log.debug("Comparing df results with %r ...", kwargs)
+            # the used space may change between both calls by other
+            # processes, so it's tried some times
+            for i in range(3):
+                (native, cmd) = (fs_list(df_native(**kwargs)), fs_list(df_cmd(**kwargs)))
+                if native == cmd:
+                    break
+            self.assertEqual(native, cmd)
+
+    # -------------------------------------------------------------------------
+    def test_exec_df_timeout(self):
+
+        log.info("Testing statvfs() calls with timeouts.")
+
+        import time
+        import threading
+
+        from pb_base.handler.df import DfHandler
+        from pb_base.handler.df import MountProbe, StatvfsPool, PathProbe
+
+        release = threading.Event()
+
+        class HangingProbe(MountProbe):
+
+            __slots__ = ()
+
+            def run(self):
+                release.wait(5)
+                super(HangingProbe, self).run()
+
+        pool = StatvfsPool(workers=2, max_threads=4)
+        probes = [HangingProbe('/'), MountProbe('/'), MountProbe('/', need_dev=True)]
+        start = time.time()
+        for probe in probes:
+            pool.submit(probe)
+        pool.wait(probes, 0.2)
+        duration = time.time() - start
+        log.debug("Waited %.3f seconds for the probes.", duration)
+        self.assertLess(duration, 2)
+        self.assertTrue(probes[0].timed_out)
+        self.assertFalse(probes[1].timed_out)
+        self.assertIsNotNone(probes[1].statvfs)
+        self.assertEqual(probes[2].dev, os.stat('/').st_dev)
+        self.assertEqual(pool.lost, 1)
+        release.set()
+        probes[0].event.wait(2)
+        self.assertIsNotNone(probes[0].statvfs)
+        self.assertEqual(pool.lost, 0)
+
+        # a burst of probes must start a worker for every probe
+        release.clear()
+        pool = StatvfsPool(workers=4, max_threads=4)
+        probes = [HangingProbe('/') for i in range(4)]
+        for probe in probes:
+            pool.submit(probe)
+        deadline = time.time() + 2
+        while time.time() < deadline:
+            if all(probe.started is not None for probe in probes):
+                break
+            time.sleep(0.01)
+        self.assertEqual([p.started is not None for p in probes], [True] * 4)
+        release.set()
+        pool.wait(probes, 2)
+        self.assertEqual([p.timed_out for p in probes], [False] * 4)
+
+        # all threads are hanging, the queued probe must time out too
+        release.clear()
+        pool = StatvfsPool(workers=1, max_threads=1)
+        probes = [HangingProbe('/'), MountProbe('/')]
+        start = time.time()
+        for probe in probes:
+            pool.submit(probe)
+        pool.wait(probes, 0.2)
+        duration = time.time() - start
+        log.debug("Waited %.3f seconds with exhausted threads.", duration)
+        self.assertLess(duration, 2)
+        self.assertTrue(probes[0].timed_out)
+        self.assertTrue(probes[1].timed_out)
+        self.assertIsNone(probes[1].started)
+        self.assertEqual(pool.lost, 1)
+        release.set()
+        probes[1].event.wait(2)
+        self.assertTrue(probes[1].finished)
+        self.assertIsNone(probes[1].statvfs)
+        self.assertEqual(pool.lost, 0)
+
+        df = DfHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+            backend='native',
+            statvfs_timeout=2,
+        )
+        result = df(['/', '/proc'])
+        self.assertEqual(len(result), 2)
+        for r in result:
+            self.assertFalse(r.timed_out)
+
+        DfHandler.isolated_mounts['/proc'] = probes[0]
+        probes[0].finished = False
+        try:
+            result = df(['/', '/proc'])
+            self.assertFalse(result[0].timed_out)
+            self.assertTrue(result[1].timed_out)
+            self.assertEqual(result[1].total, 0)
+            probes[0].finished = True
+            result = df(['/', '/proc'])
+            self.assertFalse(result[1].timed_out)
+            self.assertNotIn('/proc', DfHandler.isolated_mounts)
+        finally:
+            DfHandler.isolated_mounts.pop('/proc', None)
+
+        # listed objects are resolved with the statvfs timeout, mount points
+        # are found without touching the filesystem
+        resolved = []
+        path_probe_run = PathProbe.run
+
+        def hanging_run(probe):
+            resolved.append(probe.mount_point)
+            release.wait(5)
+            path_probe_run(probe)
+
+        release.clear()
+        df = DfHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+            backend='native',
+            statvfs_timeout=0.3,
+        )
+        PathProbe.run = hanging_run
+        try:
+            start = time.time()
+            result = df(['/', '/proc/self/status'], sync=True)
+            duration = time.time() - start
+        finally:
+            PathProbe.run = path_probe_run
+            release.set()
+        log.debug("Got df result with a hanging path in %.3f seconds.", duration)
+        self.assertLess(duration, 2)
+        self.assertEqual(resolved, ['/proc/self/status'])
+        self.assertEqual([r.fs for r in result], ['/', '/proc'])
+
+    # -------------------------------------------------------------------------
+    def test_exec_df_cache(self):
+
+        log.info("Testing caching of df results.")
+
+        from pb_base.mountinfo import MountTableCache
+        from pb_base.handler.df import DfHandler
+
+        table = MountTableCache()
+        mounts = table.get()
+        self.assertEqual(table.reads, 1)
+        self.assertFalse(table.changed())
+        self.assertEqual(len(table.get()), len(mounts))
+        self.assertEqual(table.reads, 1)
+        table.invalidate()
+        table.get()
+        self.assertEqual(table.reads, 2)
+        table.close()
+
+        df = DfHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+            backend='native',
+            cache_ttl=60,
+            cache_ttl_by_type={'tmpfs': 0},
+        )
+        df_uncached = DfHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+            backend='native',
+        )
+
+        def fs_list(result):
+            return [(r.dev, r.fs_type, r.total, r.fs) for r in result]
+
+        self.assertEqual(fs_list(df()), fs_list(df_uncached()))
+        reads = DfHandler.mount_table.reads
+        result = df(all_fs=True)
+        self.assertEqual(fs_list(result), fs_list(df_uncached(all_fs=True)))
+        self.assertEqual(DfHandler.mount_table.reads, reads)
+        for key in DfHandler.probe_cache:
+            self.assertNotIn(key[1], [r.fs for r in result if r.fs_type == 'tmpfs'])
+
+    # -------------------------------------------------------------------------
+    def test_df_table(self):
+
+        log.info("Testing columnar df results.")
+
+        import pb_base.handler.df as df_module
+        from pb_base.handler.df import DfHandler
+        from pb_base.handler.df import DfTable
+
+        rows = [
+            ('/dev/sda1', 'ext4', 100 * 1048576, 75 * 1048576, 20 * 1048576, '/', False),
+            ('tmpfs', 'tmpfs', 0, 0, 0, '/run', False),
+            ('srv:/export', 'nfs4', 0, 0, 0, '/srv', True),
+            ('/dev/sdb1', 'xfs', 200 * 1048576, 10 * 1048576, 190 * 1048576, '/var', False),
+        ]
+
+        # vectorized with NumPy (if installed) and with the module array
+        numpy = df_module.numpy
+        for use_numpy in ((True, False) if numpy is not None else (False, )):
+            log.debug("Testing DfTable with NumPy: %r", use_numpy)
+            df_module.numpy = numpy if use_numpy else None
+            try:
+                table = DfTable.from_rows(rows)
+                self.assertEqual(len(table), 4)
+                self.assertEqual(list(table['total_mb']), [100, 0, 0, 200])
+                self.assertEqual(table['used_percent'][0], 75.0)
+                self.assertNotEqual(table['used_percent'][1], table['used_percent'][1])
+
+                self.assertEqual(
+                    list(table.sort('used_percent', reverse=True)['fs']),
+                    ['/', '/var', '/run', '/srv'])
+                self.assertEqual(list(table.sort('free')['fs']), ['/run', '/srv', '/', '/var'])
+                self.assertEqual(
+                    list(table.sort('free', reverse=True)['fs']), ['/var', '/', '/run', '/srv'])
+                self.assertEqual(
+                    list(table.filter(fs_type=('ext4', 'xfs'))['dev']),
+                    ['/dev/sda1', '/dev/sdb1'])
+                self.assertEqual(list(table.filter(timed_out=True)['fs']), ['/srv'])
+                self.assertEqual(
+                    list(table.filter([p > 50 for p in table['used_percent']])['fs']), ['/'])
+                self.assertEqual(
+                    list(table.filter(fs_type='xfs', timed_out=False)['total']),
+                    [200 * 1048576])
+                results = table.to_results()
+                self.assertEqual(results[3].free_mb, 190)
+                self.assertTrue(results[2].timed_out)
+            finally:
+                df_module.numpy = numpy
+
+        if numpy is not None:
+            # the NumPy arrays must not prevent appending to the table
+            table = DfTable.from_rows(rows)
+            free = table.as_numpy('free')
+            used_percent = table.as_numpy('used_percent')
+            self.assertEqual(list(free), [r[4] for r in rows])
+            self.assertEqual(used_percent[0], 75.0)
+            table.append('/dev/sdc1', 'ext4', 1048576, 0, 1048576, '/data')
+            self.assertEqual(len(table), 5)
+            self.assertEqual(len(table.as_numpy('used_percent')), 5)
+
+        df = DfHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+            backend='native',
+        )
+        table = df(all_fs=True, as_table=True)
+        results = df(all_fs=True)
+        self.assertEqual(list(table.rows()), list(DfTable.from_results(results).rows()))
+
+    # -------------------------------------------------------------------------
+    def test_df_watcher(self):
+
+        log.info("Testing watching filesystems with watermarks.")
+
+        import time
+        import threading
+
+        from pb_base.handler.df import DfResult
+        from pb_base.handler.df_watcher import DfWatcher
+
+        watcher = DfWatcher(
+            appname=self.appname,
+            verbose=self.verbose,
+            fs='/',
+            min_interval=0.1,
+            max_interval=5,
+        )
+
+        events = []
+
+        def callback(event, df_result, watermark):
+            events.append((event, df_result.fs, round(df_result.used_percent)))
+
+        watcher.add_watermark(90, callback, fs='/test')
+        start = time.time()
+        for used in (50, 91, 88, 92, 84, 91):
+            watcher._update(DfResult(total=100, used=used, fs='/test'), start)
+            start += 1
+        self.assertEqual(events, [
+            ('high', '/test', 91), ('low', '/test', 84), ('high', '/test', 91)])
+
+        state = watcher._states['/test']
+        state.triggered.clear()
+        state.rate = 0.0
+        self.assertEqual(watcher._interval(state, 50.0), 5.0)
+        self.assertAlmostEqual(watcher._interval(state, 89.0), 0.25)
+        state.rate = 2.0
+        self.assertAlmostEqual(watcher._interval(state, 80.0), 1.25)
+        del watcher._states['/test']
+
+        events = []
+        watcher.add_watermark(0.001, callback, low=0)
+        watcher.start()
+        try:
+            for i in range(50):
+                if events:
+                    break
+                time.sleep(0.1)
+        finally:
+            watcher.stop(2)
+        self.assertFalse(watcher.running)
+        self.assertEqual(events[0][:2], ('high', '/'))
+        self.assertEqual(list(watcher.watched().keys()), ['/'])
+
+        # a thread hanging in check() keeps its wake-up pipe until its end
+        release = threading.Event()
+        checking = threading.Event()
+
+        def hanging_check():
+            checking.set()
+            release.wait(5)
+            return time.time() + 60
+
+        watcher.check = hanging_check
+        watcher.start()
+        thread = watcher._thread
+        try:
+            self.assertTrue(checking.wait(2))
+            wake_pipe = watcher._wake_pipe
+            watcher.stop(0.2)
+            self.assertTrue(thread.is_alive())
+            for fd in wake_pipe:
+                os.fstat(fd)
+        finally:
+            release.set()
+        thread.join(2)
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(watcher._wake_pipe)
+
+    # -------------------------------------------------------------------------
+    def test_fuser_native(self):
+
+        log.info("Testing the native fuser backend.")
+
+        import tempfile
+
+        from pb_base.proc_index import ProcIndex
+        from pb_base.proc_index import get_proc_index
+        from pb_base.handler.fuser import FuserHandler
+        from pb_base.handler.fuser import FuserError
+
+        fuser = FuserHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+            backend='native',
+        )
+
+        (fd, used_file) = tempfile.mkstemp()
+        (fd2, unused_file) = tempfile.mkstemp()
+        os.close(fd2)
+        try:
+            pid = os.getpid()
+            self.assertEqual(fuser(used_file), [pid])
+            self.assertEqual(fuser(unused_file), [])
+
+            result = fuser.query([used_file, unused_file, os.getcwd()])
+            self.assertEqual(result[used_file], [pid])
+            self.assertEqual(result[unused_file], [])
+            self.assertIn(pid, result[os.getcwd()])
+
+            with self.assertRaises(FuserError):
+                fuser.query([used_file, unused_file + '.missing'])
+            result = fuser.query([unused_file + '.missing'], force=True)
+            self.assertEqual(result[unused_file + '.missing'], [])
+
+            index = ProcIndex()
+            st = os.stat(used_file)
+            self.assertEqual(index.users(st.st_dev, st.st_ino), {pid: 'f'})
+            st = os.stat(sys.executable)
+            self.assertIn(pid, index.pids(st.st_dev, st.st_ino))
+
+            cached = FuserHandler(
+                appname=self.appname,
+                verbose=self.verbose,
+                backend='native',
+                index_max_age=3600,
+            )
+            self.assertEqual(cached(used_file), [pid])
+            shared = get_proc_index()
+            last_refresh = shared.last_refresh
+            self.assertEqual(cached(used_file), [pid])
+            self.assertEqual(shared.last_refresh, last_refresh)
+            fuser(used_file)
+            self.assertNotEqual(shared.last_refresh, last_refresh)
+        finally:
+            os.close(fd)
+            os.remove(used_file)
+            os.remove(unused_file)
+
+    # -------------------------------------------------------------------------
+    def test_fuser_mount(self):
+
+        log.info("Testing mount scope queries of the native fuser backend.")
+
+        import tempfile
+
+        from pb_base.mountinfo import filesystem_devices
+        from pb_base.proc_index import ProcIndex
+        from pb_base.handler.fuser import FuserHandler
+
+        fuser = FuserHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+            backend='native',
+        )
+
+        (fd, used_file) = tempfile.mkstemp()
+        (fd2, unused_file) = tempfile.mkstemp()
+        os.close(fd2)
+        try:
+            pid = os.getpid()
+            st = os.stat(used_file)
+            self.assertEqual(filesystem_devices(unused_file), set([st.st_dev]))
+
+            self.assertEqual(fuser(unused_file), [])
+            self.assertIn(pid, fuser(unused_file, mount=True))
+
+            result = fuser.query([unused_file, unused_file + '.missing'], force=True, mount=True)
+            self.assertIn(pid, result[unused_file])
+            self.assertEqual(result[unused_file + '.missing'], [])
+
+            index = ProcIndex()
+            self.assertIn('f', index.fs_users(st.st_dev)[pid])
+            self.assertIn(pid, index.fs_pids(st.st_dev))
+        finally:
+            os.close(fd)
+            os.remove(used_file)
+            os.remove(unused_file)
+
+    # -------------------------------------------------------------------------
+    def test_proc_index_refresh(self):
+
+        log.info("Testing incremental refreshing of the process index.")
+
+        import time
+        import signal
+        import tempfile
+        import subprocess
+
+        from pb_base.proc_index import ProcIndex
+        from pb_base.proc_index import read_proc_stat
+
+        index = ProcIndex()
+        index.refresh()
+        self.assertTrue(index.scanned)
+        self.assertFalse(index.refresh(max_age=3600))
+
+        (fd, used_file) = tempfile.mkstemp()
+        child = None
+        try:
+            child = subprocess.Popen(['sleep', '60'], stdin=fd)
+            while read_proc_stat(child.pid)[0] == 'R':
+                time.sleep(0.01)
+            index.refresh()
+            self.assertIn(child.pid, index.query([used_file])[used_file])
+
+            # only the new and changed processes are examined again
+            index.refresh()
+            self.assertLess(index.last_scanned, len(index._procs))
+
+            start_time = index.start_time(child.pid)
+            self.assertLess(abs(start_time - time.time()), 10)
+
+            child.kill()
+            child.wait()
+            self.assertIsNone(index.start_time(child.pid))
+            self.assertEqual(index.query([used_file])[used_file], [os.getpid()])
+            child = None
+
+            # an idle process opening a file after the first scan, nearly
+            # without consuming CPU time
+            script = (
+                "import os, signal, sys\n"
+                "files = []\n"
+                "signal.signal(signal.SIGUSR1, "
+                "lambda s, f: files.append(open(sys.argv[1])))\n"
+                "sys.stdout.write('ready\\n')\n"
+                "sys.stdout.flush()\n"
+                "while True:\n"
+                "    signal.pause()\n")
+            child = subprocess.Popen(
+                [sys.executable, '-c', script, used_file], stdout=subprocess.PIPE)
+            self.assertEqual(child.stdout.readline().strip(), b'ready')
+            while read_proc_stat(child.pid)[0] == 'R':
+                time.sleep(0.01)
+            index.refresh()
+            self.assertNotIn(child.pid, index.query([used_file])[used_file])
+
+            fd_dir = '/proc/%d/fd' % (child.pid)
+            fd_count = len(os.listdir(fd_dir))
+            child.send_signal(signal.SIGUSR1)
+            deadline = time.time() + 5
+            while len(os.listdir(fd_dir)) == fd_count and time.time() < deadline:
+                time.sleep(0.01)
+            index.refresh()
+            self.assertIn(child.pid, index.query([used_file])[used_file])
+        finally:
+            if child is not None:
+                child.kill()
+                child.wait()
+                if child.stdout:
+                    child.stdout.close()
+            os.close(fd)
+            os.remove(used_file)
+
+    # -------------------------------------------------------------------------
+    def test_du(self):
+
+        log.info("Testing the DuHandler.")
+
+        import shutil
+        import tempfile
+
+        from pb_base.handler.du import DuHandler
+        from pb_base.handler.du import DuError
+
+        du = DuHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+            workers=4,
+        )
+
+        base = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(base, 'a', 'b', 'c'))
+            os.mkdir(os.path.join(base, 'd'))
+            with open(os.path.join(base, 'a', 'b', 'data'), 'wb') as fh:
+                fh.write(b'x' * 10000)
+            with open(os.path.join(base, 'a', 'small'), 'wb') as fh:
+                fh.write(b'y' * 10)
+            os.link(os.path.join(base, 'a', 'b', 'data'), os.path.join(base, 'd', 'link'))
+            os.symlink('a', os.path.join(base, 'd', 'symlink'))
+
+            dir_sizes = 0
+            for path in (base, 'a', 'a/b', 'a/b/c', 'd'):
+                dir_sizes += os.lstat(os.path.join(base, path)).st_size
+            symlink_size = os.lstat(os.path.join(base, 'd', 'symlink')).st_size
+
+            result = du(base)
+            self.assertEqual(len(result), 1)
+            total = result[0]
+            self.assertEqual(total.path, base)
+            self.assertEqual(total.apparent, dir_sizes + 10010 + symlink_size)
+            self.assertEqual(total.files, 3)
+            self.assertEqual(total.dirs, 4)
+            self.assertEqual(total.errors, 0)
+            self.assertGreaterEqual(total.allocated, 0)
+
+            result = du(base, max_depth=1)
+            self.assertEqual(
+                [r.path for r in result],
+                [base, os.path.join(base, 'a'), os.path.join(base, 'd')])
+            self.assertEqual(result[0].apparent, total.apparent)
+            self.assertEqual(
+                result[1].apparent + result[2].apparent + os.lstat(base).st_size,
+                total.apparent)
+
+            # the hardlinked file belongs to its lowest path 'a/b/data'
+            a_sizes = 0
+            for path in ('a', 'a/b', 'a/b/c'):
+                a_sizes += os.lstat(os.path.join(base, path)).st_size
+            d_size = os.lstat(os.path.join(base, 'd')).st_size
+            for i in range(5):
+                result = du(base, max_depth=1)
+                self.assertEqual(result[1].apparent, a_sizes + 10010)
+                self.assertEqual(result[1].files, 2)
+                self.assertEqual(result[2].apparent, d_size + symlink_size)
+                self.assertEqual(result[2].files, 1)
+
+            result = du([base, os.path.join(base, 'a')], max_depth=None)
+            self.assertEqual(len(result), 5)
+            self.assertEqual(result[0].apparent, total.apparent)
+
+            result = du(os.path.join(base, 'a', 'small'), one_filesystem=True)
+            self.assertEqual(result[0].apparent, 10)
+            self.assertEqual(result[0].files, 1)
+
+            with self.assertRaises(DuError):
+                du(os.path.join(base, 'missing'))
+            with self.assertRaises(DuError):
+                du(base, max_depth=-1)
+        finally:
+            shutil.rmtree(base)
+
     # -------------------------------------------------------------------------
     def test_call_sync(self):
 
@@ -322,6 +975,748 @@ class TestPbBaseHandler(PbBaseTestcase):
         log.debug("Got STDOUT: %r", stdoutdata)
         log.debug("Got STDERR: %r", stderrdata)
 
+    # -------------------------------------------------------------------------
+    def test_call_pipeline(self):
+
+        log.info("Testing execution of a command pipeline.")
+
+        from pb_base.handler import PbBaseHandler
+
+        hdlr = PbBaseHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+
+        (rets, stdoutdata, stderrdata) = hdlr.call_pipeline([
+            ['printf', 'uhu\nbla\nblub\n'],
+            ['grep', 'b'],
+            ['wc', '-l'],
+        ])
+        log.debug("Got return values: %r.", rets)
+        log.debug("Got STDOUT: %r", stdoutdata)
+        log.debug("Got STDERR: %r", stderrdata)
+        self.assertEqual(rets, [0, 0, 0])
+        self.assertEqual(stdoutdata.strip(), '2')
+
+        (rets, stdoutdata, stderrdata) = hdlr.call_pipeline(
+            [['sh', '-c', 'echo error >&2; exit 3'], ['cat']], quiet=True)
+        log.debug("Got return values: %r.", rets)
+        self.assertEqual(rets, [3, 0])
+        self.assertEqual(stderrdata.strip(), 'error')
+
+        # the wall time must include the runtime of not captured stages
+        hdlr.reset_cmd_stats()
+        with open(os.devnull, 'wb') as devnull:
+            hdlr.call_pipeline(
+                [['sleep', '0.3'], ['cat']], stdout=devnull, drop_stderr=True)
+        stats = hdlr.cmd_stats
+        self.assertGreaterEqual(stats['sleep']['wall_time'], 0.25)
+        self.assertGreaterEqual(stats['cat']['wall_time'], 0.25)
+
+        # a not startable stage must not leave processes or pipes behind
+        fd_count = len(os.listdir('/proc/self/fd'))
+        children_file = '/proc/self/task/%d/children' % (os.getpid())
+        with self.assertRaises(OSError):
+            hdlr.call_pipeline(
+                [['sleep', '30'], ['cat'], ['/non/existing/command']], quiet=True)
+        self.assertEqual(len(os.listdir('/proc/self/fd')), fd_count)
+        if os.path.exists(children_file):
+            with open(children_file) as fh:
+                self.assertEqual(fh.read().strip(), '')
+
+    # -------------------------------------------------------------------------
+    def test_priv_helper(self):
+
+        log.info("Testing requests to a privileged helper.")
+
+        import threading
+        import time
+        import socket
+        import tempfile
+
+        from pb_base.handler.priv_helper import PbPrivHelper
+        from pb_base.handler.priv_helper import PrivHelperClient
+
+        tmp_dir = tempfile.mkdtemp()
+        socket_file = os.path.join(tmp_dir, 'helper.sock')
+        echo_cmd = os.sep + os.path.join('bin', 'echo')
+
+        helper = PbPrivHelper(
+            socket_file=socket_file,
+            allowed_commands=[echo_cmd],
+            poll_interval=0.1,
+            idle_timeout=1,
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+        thread = threading.Thread(target=helper.run)
+        thread.start()
+
+        idle = None
+        (fd, used_file) = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            while not os.path.exists(socket_file):
+                time.sleep(0.05)
+
+            # an idle client must not block the other clients
+            idle = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            idle.connect(socket_file)
+
+            client = PrivHelperClient(
+                socket_file=socket_file,
+                appname=self.appname,
+                verbose=self.verbose,
+            )
+            results = client.request([
+                {'op': 'statvfs', 'path': '/'},
+                {'op': 'call', 'cmd': [echo_cmd, 'uhu']},
+                {'op': 'call', 'cmd': ['/bin/rm', '-f', socket_file]},
+            ])
+            log.debug("Got results from helper: %s", pp(results))
+            self.assertTrue(results[0]['ok'])
+            self.assertEqual(results[0]['result']['f_frsize'], os.statvfs('/').f_frsize)
+            self.assertTrue(results[1]['ok'])
+            self.assertEqual(results[1]['result'][1].strip(), 'uhu')
+            self.assertFalse(results[2]['ok'])
+
+            missing = os.path.join(tmp_dir, 'missing')
+            results = client.request([
+                {'op': 'fuser', 'path': used_file},
+                {'op': 'fuser', 'path': missing},
+                {'op': 'fuser', 'path': tmp_dir, 'mount': True},
+                {'op': 'fuser', 'path': used_file},
+            ])
+            log.debug("Got fuser results from helper: %s", pp(results))
+            self.assertEqual(results[0], {'ok': True, 'result': [os.getpid()]})
+            self.assertFalse(results[1]['ok'])
+            self.assertTrue(results[2]['ok'])
+            self.assertIn(os.getpid(), results[2]['result'])
+            self.assertEqual(results[3], results[0])
+
+            # the idle connection is closed after the idle timeout
+            idle.settimeout(5)
+            self.assertEqual(idle.recv(10), b'')
+        finally:
+            if idle is not None:
+                idle.close()
+            helper.stop()
+            thread.join()
+            os.close(fd)
+            os.remove(used_file)
+            os.rmdir(tmp_dir)
+
+    # -------------------------------------------------------------------------
+    def test_call_result(self):
+
+        log.info("Testing execution with a CallResult object as result.")
+
+        from pb_base.handler import PbBaseHandler
+        from pb_base.handler import CallResult
+
+        hdlr = PbBaseHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+
+        result = hdlr.call(['sh', '-c', 'echo uhu; exit 2'], as_result=True, quiet=True)
+        self.assertIsInstance(result, CallResult)
+        if self.verbose > 2:
+            log.debug("Got CallResult: %s", pp(result.as_dict()))
+        self.assertEqual(result.retcode, 2)
+        self.assertEqual(result.stdout.strip(), 'uhu')
+        self.assertGreaterEqual(result.wall_time, 0)
+        self.assertIsNotNone(result.cpu_time)
+        self.assertGreater(result.max_rss, 0)
+
+        (ret, stdoutdata, stderrdata) = result
+        self.assertEqual(ret, 2)
+
+        stats = hdlr.cmd_stats
+        log.debug("Command statistics: %s", pp(stats))
+        self.assertEqual(stats['sh']['count'], 1)
+        self.assertEqual(stats['sh']['failed'], 1)
+
+        hdlr.reset_cmd_stats()
+        self.assertEqual(hdlr.cmd_stats, {})
+
+    # -------------------------------------------------------------------------
+    def test_call_io_priority(self):
+
+        log.info("Testing execution with niceness and I/O scheduling class.")
+
+        from pb_base.handler import PbBaseHandler
+
+        hdlr = PbBaseHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+
+        (ret, stdoutdata, stderrdata) = hdlr.call(
+            ['sh', '-c', 'nice'], nice=5, ionice_class='idle', quiet=True)
+        log.debug("Got niceness of child: %r", stdoutdata)
+        self.assertEqual(ret, 0)
+        self.assertEqual(int(stdoutdata.strip()), os.nice(0) + 5)
+
+        # the I/O priority is set for a separate thread, because it's
+        # an attribute of the calling thread
+        import threading
+
+        from pb_base.syscalls import set_ioprio, get_ioprio
+        from pb_base.syscalls import IOPRIO_CLASS_BE, IOPRIO_DEFAULT_LEVEL
+
+        prios = []
+
+        def set_default_level():
+            set_ioprio('best-effort', None)
+            prios.append(get_ioprio())
+
+        thread = threading.Thread(target=set_default_level)
+        thread.start()
+        thread.join()
+        self.assertEqual(prios, [(IOPRIO_CLASS_BE, IOPRIO_DEFAULT_LEVEL)])
+
+    # -------------------------------------------------------------------------
+    def test_single_flight(self):
+
+        log.info("Testing de-duplication of concurrent identical calls.")
+
+        import threading
+        import time
+
+        from pb_base.handler.singleflight import SingleFlight
+
+        sf = SingleFlight()
+        calls = []
+        results = []
+        start = threading.Event()
+
+        def slow_func(value):
+            calls.append(value)
+            time.sleep(0.3)
+            return value * 2
+
+        def worker():
+            start.wait()
+            results.append(sf.do(('double', 21), slow_func, 21))
+
+        threads = []
+        for i in range(5):
+            thread = threading.Thread(target=worker)
+            thread.start()
+            threads.append(thread)
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        log.debug("Function was executed %d times.", len(calls))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [42] * 5)
+        self.assertEqual(sf.in_flight(), 0)
+
+        def failing_func():
+            raise ValueError('uhu')
+
+        with self.assertRaises(ValueError):
+            sf.do('fail', failing_func)
+
+    # -------------------------------------------------------------------------
+    def test_dump_data_engines(self):
+
+        log.info("Testing dump_data() with all copy engines.")
+
+        import shutil
+        import tempfile
+
+        from pb_base.handler import PbBaseHandler
+        from pb_base.copy_engine import ENGINES
+
+        hdlr = PbBaseHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            src = os.path.join(tmpdir, 'source')
+            data = os.urandom(256 * 1024 + 123)
+            with open(src, 'wb') as fh:
+                fh.write(data)
+
+            for engine in ENGINES + ('auto', ):
+                log.debug("Testing copy engine %r.", engine)
+                tgt = os.path.join(tmpdir, 'target-' + engine)
+                hdlr.dump_data(src, tgt, blocksize=65536, engine=engine)
+                with open(tgt, 'rb') as fh:
+                    self.assertEqual(fh.read(), data)
+
+                hdlr.dump_data(src, tgt, blocksize=4096, iseek=2, oseek=3, engine=engine)
+                with open(tgt, 'rb') as fh:
+                    content = fh.read()
+                self.assertEqual(content[:3 * 4096], b'\0' * 3 * 4096)
+                self.assertEqual(content[3 * 4096:], data[2 * 4096:])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    # -------------------------------------------------------------------------
+    def test_dump_data_sparse(self):
+
+        log.info("Testing sparse copying by dump_data().")
+
+        import shutil
+        import tempfile
+
+        from pb_base.handler import PbBaseHandler
+
+        hdlr = PbBaseHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+
+        bs = 64 * 1024
+        tmpdir = tempfile.mkdtemp()
+        try:
+            src = os.path.join(tmpdir, 'source')
+            with open(src, 'wb') as fh:
+                fh.truncate(100 * bs)
+                fh.seek(10 * bs)
+                fh.write(b'A' * bs)
+                fh.seek(50 * bs)
+                fh.write(b'B' * 2 * bs)
+            with open(src, 'rb') as fh:
+                data = fh.read()
+
+            tgt = os.path.join(tmpdir, 'target')
+            hdlr.dump_data(src, tgt, blocksize=bs, sparse=True)
+            with open(tgt, 'rb') as fh:
+                self.assertEqual(fh.read(), data)
+            tgt_stat = os.stat(tgt)
+            log.debug(
+                "Target has a size of %d Bytes, %d Bytes allocated.",
+                tgt_stat.st_size, tgt_stat.st_blocks * 512)
+            self.assertEqual(tgt_stat.st_size, 100 * bs)
+            if os.stat(src).st_blocks * 512 < 100 * bs:
+                self.assertLess(tgt_stat.st_blocks * 512, 100 * bs)
+
+            hdlr.dump_data(src, tgt, blocksize=bs, iseek=20, oseek=5, sparse=True)
+            with open(tgt, 'rb') as fh:
+                self.assertEqual(fh.read(), b'\0' * 5 * bs + data[20 * bs:])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    # -------------------------------------------------------------------------
+    def test_dump_zeroes_modes(self):
+
+        log.info("Testing dump_zeroes() with different wipe modes.")
+
+        import shutil
+        import tempfile
+
+        from pb_base.handler import PbBaseHandler
+        from pb_base.copy_engine import WIPE_MODES
+
+        hdlr = PbBaseHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+
+        bs = 64 * 1024
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for mode in WIPE_MODES + ('auto', ):
+                log.debug("Testing wipe mode %r.", mode)
+                tgt = os.path.join(tmpdir, 'target-' + mode)
+                with open(tgt, 'wb') as fh:
+                    fh.write(b'x' * 20 * bs)
+                hdlr.dump_zeroes(tgt, blocksize=bs, seek=2, count=10, wipe_mode=mode)
+                with open(tgt, 'rb') as fh:
+                    self.assertEqual(fh.read(), b'\0' * 12 * bs)
+        finally:
+            shutil.rmtree(tmpdir)
+
+        if os.path.exists('/dev/full'):
+            hdlr.dump_zeroes('/dev/full', blocksize=bs, force=True)
+            with self.assertRaises(OSError):
+                hdlr.dump_zeroes('/dev/full', blocksize=bs, count=3)
+
+    # -------------------------------------------------------------------------
+    def test_dump_data_parallel(self):
+
+        log.info("Testing dump_data() with parallel streams.")
+
+        import shutil
+        import tempfile
+
+        from pb_base.handler import PbBaseHandler
+
+        hdlr = PbBaseHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            src = os.path.join(tmpdir, 'source')
+            data = os.urandom(1024 * 1024 + 777)
+            with open(src, 'wb') as fh:
+                fh.write(data)
+
+            for streams in (2, 3, 8):
+                log.debug("Testing copying with %d streams.", streams)
+                tgt = os.path.join(tmpdir, 'target-%d' % (streams))
+                hdlr.dump_data(src, tgt, blocksize=65536, streams=streams)
+                with open(tgt, 'rb') as fh:
+                    self.assertEqual(fh.read(), data)
+
+                hdlr.dump_data(
+                    src, tgt, blocksize=4096, iseek=3, oseek=1, streams=streams)
+                with open(tgt, 'rb') as fh:
+                    self.assertEqual(fh.read(), b'\0' * 4096 + data[3 * 4096:])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    # -------------------------------------------------------------------------
+    def test_dump_data_cache_policy(self):
+
+        log.info("Testing dump_data() and dump_zeroes() with direct I/O and cache policies.")
+
+        import shutil
+        import tempfile
+
+        from pb_base.handler import PbBaseHandler
+        from pb_base.handler import PbBaseHandlerError
+        from pb_base.copy_engine import O_DIRECT
+
+        hdlr = PbBaseHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+
+        bs = 64 * 1024
+        tmpdir = tempfile.mkdtemp()
+        try:
+            src = os.path.join(tmpdir, 'source')
+            tgt = os.path.join(tmpdir, 'target')
+            data = os.urandom(1024 * 1024 + 777)
+            with open(src, 'wb') as fh:
+                fh.write(data)
+
+            args_list = [
+                {'cache_policy': 'sequential'},
+                {'cache_policy': 'dontneed', 'sync_interval': 256 * 1024},
+            ]
+            try:
+                os.close(os.open(src, os.O_RDONLY | O_DIRECT))
+                args_list.append({'direct': True})
+                args_list.append({'direct': True, 'streams': 3})
+            except OSError as e:
+                log.debug("No direct I/O possible in %r: %s", tmpdir, e)
+
+            for kwargs in args_list:
+                log.debug("Testing with arguments %r.", kwargs)
+                hdlr.dump_data(src, tgt, blocksize=bs, **kwargs)
+                with open(tgt, 'rb') as fh:
+                    self.assertEqual(fh.read(), data)
+
+                kwargs.pop('streams', None)
+                hdlr.dump_zeroes(tgt, blocksize=bs, count=4, wipe_mode='write', **kwargs)
+                with open(tgt, 'rb') as fh:
+                    self.assertEqual(fh.read(), b'\0' * 4 * bs)
+
+            with self.assertRaises(PbBaseHandlerError):
+                hdlr.dump_data(src, tgt, blocksize=1000, direct=True)
+            with self.assertRaises(PbBaseHandlerError):
+                hdlr.dump_data(src, tgt, cache_policy='uhu')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    # -------------------------------------------------------------------------
+    def test_dump_data_checksum(self):
+
+        log.info("Testing dump_data() with inline checksum and verification.")
+
+        import shutil
+        import hashlib
+        import tempfile
+
+        from pb_base.handler import PbBaseHandler
+        from pb_base.crc import Crc64
+
+        hdlr = PbBaseHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+
+        bs = 64 * 1024
+        tmpdir = tempfile.mkdtemp()
+        try:
+            src = os.path.join(tmpdir, 'source')
+            tgt = os.path.join(tmpdir, 'target')
+            data = os.urandom(5 * bs + 7)
+            with open(src, 'wb') as fh:
+                fh.write(data)
+
+            digest = hdlr.dump_data(src, tgt, blocksize=bs, checksum='sha256')
+            self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+
+            digest = hdlr.dump_data(src, tgt, blocksize=bs, iseek=1, checksum='crc64')
+            self.assertEqual(digest, Crc64(data[bs:]).hexdigest())
+
+            with open(src, 'wb') as fh:
+                fh.truncate(20 * bs)
+                fh.seek(5 * bs)
+                fh.write(b'A' * bs)
+            with open(src, 'rb') as fh:
+                data = fh.read()
+
+            # the target must be written back before dropping its pages
+            synced = []
+            sync_for_verify = hdlr._sync_for_verify
+
+            def record_sync(fd):
+                synced.append(os.fstat(fd).st_ino)
+                sync_for_verify(fd)
+
+            hdlr._sync_for_verify = record_sync
+            digest = hdlr.dump_data(
+                src, tgt, blocksize=bs, sparse=True, checksum='sha1', verify=True)
+            self.assertEqual(digest, hashlib.sha1(data).hexdigest())
+            if hasattr(os, 'posix_fadvise'):
+                self.assertEqual(synced, [os.stat(tgt).st_ino])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    # -------------------------------------------------------------------------
+    def test_dump_data_resume(self):
+
+        log.info("Testing progress and resuming of dump_data() from a checkpoint.")
+
+        import json
+        import errno
+        import shutil
+        import hashlib
+        import tempfile
+
+        from pb_base.handler import PbBaseHandler
+
+        hdlr = PbBaseHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+
+        bs = 64 * 1024
+        tmpdir = tempfile.mkdtemp()
+        try:
+            src = os.path.join(tmpdir, 'source')
+            tgt = os.path.join(tmpdir, 'target')
+            cp_file = os.path.join(tmpdir, 'checkpoint')
+            data = os.urandom(64 * bs + 5)
+            with open(src, 'wb') as fh:
+                fh.write(data)
+
+            reports = []
+            hdlr.dump_data(
+                src, tgt, blocksize=bs, progress=reports.append, progress_interval=0)
+            log.debug("Last progress report: %r", reports[-1])
+            self.assertTrue(reports[-1]['finished'])
+            self.assertEqual(reports[-1]['bytes'], len(data))
+            self.assertEqual(reports[-1]['total'], len(data))
+
+            def interrupt(info):
+                if info['bytes'] >= 40 * bs and not info['finished']:
+                    raise OSError(errno.EIO, 'interrupted')
+
+            with self.assertRaises(OSError):
+                hdlr.dump_data(
+                    src, tgt, blocksize=bs, checksum='sha256', checkpoint_file=cp_file,
+                    checkpoint_interval=16 * bs, progress=interrupt, progress_interval=0)
+            with open(cp_file) as fh:
+                record = json.load(fh)
+            log.debug("Checkpoint record: %r", record)
+            self.assertEqual(record['offset'], 32 * bs)
+
+            reports = []
+            digest = hdlr.dump_data(
+                src, tgt, blocksize=bs, checksum='sha256', checkpoint_file=cp_file,
+                resume=True, verify=True, progress=reports.append, progress_interval=0)
+            self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+            self.assertGreater(reports[0]['bytes'], 32 * bs)
+            self.assertFalse(os.path.exists(cp_file))
+            with open(tgt, 'rb') as fh:
+                self.assertEqual(fh.read(), data)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    # -------------------------------------------------------------------------
+    def test_read_file(self):
+
+        log.info("Testing read_file() in text and binary mode.")
+
+        import threading
+        import tempfile
+
+        from pb_base.handler import PbBaseHandler
+
+        hdlr = PbBaseHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+
+        data = os.urandom(128 * 1024)
+        (fd, filename) = tempfile.mkstemp()
+        try:
+            os.write(fd, b'line 1\nline 2\n' + data)
+            os.close(fd)
+
+            content = hdlr.read_file(filename, binary=True)
+            self.assertEqual(content, b'line 1\nline 2\n' + data)
+
+            content = hdlr.read_file(filename, binary=True, use_mmap=True)
+            self.assertEqual(content, b'line 1\nline 2\n' + data)
+
+            content = hdlr.read_file(filename, binary=True, max_bytes=7, use_mmap=True)
+            self.assertEqual(content, b'line 1\n')
+
+            result = []
+
+            def read_in_thread():
+                result.append(hdlr.read_file(filename, binary=True, max_bytes=6))
+
+            self.assertFalse(hdlr._alarm_warned)
+            thread = threading.Thread(target=read_in_thread)
+            thread.start()
+            thread.join()
+            self.assertEqual(result, [b'line 1'])
+            # the timeout couldn't be enforced outside the main thread
+            self.assertTrue(hdlr._alarm_warned)
+        finally:
+            os.remove(filename)
+
+        (fd, filename) = tempfile.mkstemp()
+        try:
+            os.write(fd, b'line 1\nline 2\nline 3\n')
+            os.close(fd)
+            content = hdlr.read_file(filename)
+            self.assertEqual(content, 'line 1\nline 2\nline 3\n')
+            content = hdlr.read_file(filename, max_bytes=14)
+            self.assertEqual(content, 'line 1\nline 2\n')
+        finally:
+            os.remove(filename)
+
+        content = hdlr.read_file('/proc/self/stat', quiet=True)
+        log.debug("Content of /proc/self/stat: %r", content)
+        self.assertTrue(content.startswith(str(os.getpid())))
+
+    # -------------------------------------------------------------------------
+    def test_write_file(self):
+
+        log.info("Testing write_file() and write_files().")
+
+        import stat
+        import shutil
+        import tempfile
+
+        from pb_base.handler import PbBaseHandler
+        from pb_base.handler import PbBaseHandlerError
+
+        hdlr = PbBaseHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'state')
+
+            hdlr.write_file(filename, 'running\n', must_exists=False)
+            with open(filename, 'rb') as fh:
+                self.assertEqual(fh.read(), b'running\n')
+
+            os.chmod(filename, 0o640)
+            data = bytearray(b'\x00\x01binary\xff')
+            hdlr.write_file(filename, memoryview(data), atomic=True)
+            with open(filename, 'rb') as fh:
+                self.assertEqual(fh.read(), bytes(data))
+            self.assertEqual(stat.S_IMODE(os.stat(filename).st_mode), 0o640)
+
+            with self.assertRaises(PbBaseHandlerError):
+                hdlr.write_file(filename, 'x', sync='always')
+
+            files = {}
+            for i in range(20):
+                files[os.path.join(tmpdir, 'state-%02d' % (i))] = 'value %d\n' % (i)
+            hdlr.write_files(files, must_exists=False, atomic=True)
+            hdlr.write_files(list(files.items())[:5], sync='data')
+            for fn in files:
+                with open(fn) as fh:
+                    self.assertEqual(fh.read(), files[fn])
+            self.assertEqual(sorted(os.listdir(tmpdir)), sorted(
+                ['state'] + [os.path.basename(fn) for fn in files]))
+
+            with self.assertRaises(IOError):
+                hdlr.write_files([
+                    (os.path.join(tmpdir, 'state-00'), 'new'),
+                    (os.path.join(tmpdir, 'missing'), 'new')])
+            with open(os.path.join(tmpdir, 'state-00')) as fh:
+                self.assertEqual(fh.read(), 'value 0\n')
+        finally:
+            shutil.rmtree(tmpdir)
+
+    # -------------------------------------------------------------------------
+    def test_follow_file(self):
+
+        log.info("Testing following a file with rotation and truncation.")
+
+        import time
+        import shutil
+        import tempfile
+        import threading
+
+        from pb_base.handler import PbBaseHandler
+
+        hdlr = PbBaseHandler(
+            appname=self.appname,
+            verbose=self.verbose,
+        )
+
+        def writer(filename):
+            time.sleep(0.2)
+            with open(filename, 'a') as fh:
+                fh.write('one\ntw')
+                fh.flush()
+                time.sleep(0.1)
+                fh.write('o\n')
+            time.sleep(0.2)
+            with open(filename, 'r+') as fh:
+                fh.truncate(0)
+            with open(filename, 'a') as fh:
+                fh.write('truncated\n')
+            time.sleep(0.2)
+            fh = open(filename, 'a')
+            os.rename(filename, filename + '.1')
+            open(filename, 'w').write('new\n')
+            fh.write('old\n')
+            fh.close()
+
+        base = tempfile.mkdtemp()
+        try:
+            for use_inotify in (None, False):
+                filename = os.path.join(base, 'follow-%s.log' % (use_inotify))
+                with open(filename, 'w') as fh:
+                    fh.write('existing\n')
+                thread = threading.Thread(target=writer, args=(filename, ))
+                thread.start()
+                lines = list(hdlr.follow_file(
+                    filename, timeout=1.0, use_inotify=use_inotify, poll_interval=0.05))
+                thread.join()
+                log.debug("Got lines with use_inotify=%r: %r", use_inotify, lines)
+                self.assertEqual(lines, ['one\n', 'two\n', 'truncated\n', 'old\n', 'new\n'])
+
+            filename = os.path.join(base, 'created.log')
+            lines = list(hdlr.follow_file(filename, timeout=0.2, binary=True))
+            self.assertEqual(lines, [])
+        finally:
+            shutil.rmtree(base)
+
 # =============================================================================
 
 
@@ -342,10 +1737,34 @@ if __name__ == '__main__':
     suite.addTest(TestPbBaseHandler('test_generic_handler_object', verbose))
     suite.addTest(TestPbBaseHandler('test_call_sync', verbose))
     suite.addTest(TestPbBaseHandler('test_call_async', verbose))
+    suite.addTest(TestPbBaseHandler('test_call_pipeline', verbose))
+    suite.addTest(TestPbBaseHandler('test_call_result', verbose))
+    suite.addTest(TestPbBaseHandler('test_call_io_priority', verbose))
+    suite.addTest(TestPbBaseHandler('test_single_flight', verbose))
+    suite.addTest(TestPbBaseHandler('test_dump_data_engines', verbose))
+    suite.addTest(TestPbBaseHandler('test_dump_data_sparse', verbose))
+    suite.addTest(TestPbBaseHandler('test_dump_zeroes_modes', verbose))
+    suite.addTest(TestPbBaseHandler('test_dump_data_parallel', verbose))
+    suite.addTest(TestPbBaseHandler('test_dump_data_cache_policy', verbose))
+    suite.addTest(TestPbBaseHandler('test_dump_data_checksum', verbose))
+    suite.addTest(TestPbBaseHandler('test_dump_data_resume', verbose))
+    suite.addTest(TestPbBaseHandler('test_read_file', verbose))
+    suite.addTest(TestPbBaseHandler('test_write_file', verbose))
+    suite.addTest(TestPbBaseHandler('test_follow_file', verbose))
+    suite.addTest(TestPbBaseHandler('test_priv_helper', verbose))
     suite.addTest(TestPbBaseHandler('test_df_handler_object', verbose))
     suite.addTest(TestPbBaseHandler('test_fuser_handler_object', verbose))
     suite.addTest(TestPbBaseHandler('test_exec_df_root', verbose))
     suite.addTest(TestPbBaseHandler('test_exec_df_all', verbose))
+    suite.addTest(TestPbBaseHandler('test_exec_df_native', verbose))
+    suite.addTest(TestPbBaseHandler('test_exec_df_timeout', verbose))
+    suite.addTest(TestPbBaseHandler('test_exec_df_cache', verbose))
+    suite.addTest(TestPbBaseHandler('test_df_table', verbose))
+    suite.addTest(TestPbBaseHandler('test_df_watcher', verbose))
+    suite.addTest(TestPbBaseHandler('test_fuser_native', verbose))
+    suite.addTest(TestPbBaseHandler('test_fuser_mount', verbose))
+    suite.addTest(TestPbBaseHandler('test_proc_index_refresh', verbose))
+    suite.addTest(TestPbBaseHandler('test_du', verbose))
 
     runner = unittest.TextTestRunner(verbosity=verbose)
 
@@ -373,6 +373,51 @@ class TestPbLockHandler(PbBaseTestcase):
         finally:
             self.remove_lockfile(lockfile)
 
+    # -------------------------------------------------------------------------
+    def test_reused_pid_lockfile(self):
+
+        log.info("Testing creation lockfile with a PID reused by a younger process.")
+
+        from pb_base.handler.lock import PbLockHandler
+        from pb_base.proc_index import start_ticks
+
+        locker = PbLockHandler(
+            appname='test_lock',
+            verbose=self.verbose,
+            lockdir=self.lock_dir,
+        )
+
+        pid = os.getpid()
+        ticks = start_ticks(pid)
+        self.assertFalse(locker.dead(pid))
+        self.assertFalse(locker.dead(pid, ticks))
+        self.assertTrue(locker.dead(pid, ticks + 1))
+
+        # the modification time of a lockfile doesn't matter
+        an_hour_ago = time.time() - 3600
+        lockfile = self.create_lockfile("%d\n%d\n" % (pid, ticks))
+        os.utime(lockfile, (an_hour_ago, an_hour_ago))
+        try:
+            self.assertTrue(locker.check_lockfile(lockfile, use_pid=True))
+        finally:
+            self.remove_lockfile(lockfile)
+
+        lockfile = self.create_lockfile("%d\n%d\n" % (pid, ticks + 1))
+        result = None
+
+        try:
+            result = locker.create_lockfile(
+                lockfile,
+                delay_start=0.2,
+                delay_increase=0.4,
+                max_delay=5
+            )
+            locker.remove_lockfile(lockfile)
+            if not result:
+                self.fail("PbLockHandler should be able to create the lockfile.")
+        finally:
+            self.remove_lockfile(lockfile)
+
 # =============================================================================
 
 
@@ -399,6 +444,7 @@ if __name__ == '__main__':
     suite.addTest(TestPbLockHandler('test_invalid_lockfile1', verbose))
     suite.addTest(TestPbLockHandler('test_invalid_lockfile2', verbose))
     suite.addTest(TestPbLockHandler('test_invalid_lockfile3', verbose))
+    suite.addTest(TestPbLockHandler('test_reused_pid_lockfile', verbose))
 
     runner = unittest.TextTestRunner(verbosity=verbose)
 
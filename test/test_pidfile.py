@@ -146,7 +146,7 @@ class TestPidFile(PbBaseTestcase):
             elif not fcontent:
                 self.fail("Pidfile %r seems to be empty.", pidfile_normal)
             else:
-                match = re.search(r'^\s*(\d+)\s*$', fcontent)
+                match = re.search(r'^\s*(\d+)\s*(?:\n\s*\d+\s*)?$', fcontent)
                 if not match:
                     self.fail(
                         "Pidfile %r with invalid content: %r",
@@ -241,6 +241,52 @@ class TestPidFile(PbBaseTestcase):
             del pid_file2
             del pid_file1
 
+    # -------------------------------------------------------------------------
+    def test_check_reused_pid(self):
+
+        log.info("Test checking of a PID file with a PID reused by a younger process.")
+
+        import time
+
+        from pb_base.pidfile import PidFile
+        from pb_base.pidfile import PidFileInUseError
+        from pb_base.proc_index import start_ticks
+
+        pid_file = PidFile(
+            filename=pidfile_normal,
+            appname='test_pidfile',
+            verbose=self.verbose,
+        )
+
+        pid = os.getpid()
+        ticks = start_ticks(pid)
+
+        def write_pidfile(content):
+            fh = open(pidfile_normal, 'w')
+            try:
+                fh.write(content)
+            finally:
+                fh.close()
+
+        try:
+            # without a start time the process is only signalled
+            write_pidfile("%d\n" % (pid))
+            with self.assertRaises(PidFileInUseError):
+                pid_file.check()
+
+            # the modification time of the pidfile doesn't matter
+            write_pidfile("%d\n%d\n" % (pid, ticks))
+            an_hour_ago = time.time() - 3600
+            os.utime(pidfile_normal, (an_hour_ago, an_hour_ago))
+            with self.assertRaises(PidFileInUseError):
+                pid_file.check()
+
+            write_pidfile("%d\n%d\n" % (pid, ticks + 1))
+            self.assertTrue(pid_file.check())
+        finally:
+            del pid_file
+            os.remove(pidfile_normal)
+
 
 # =============================================================================
 
@@ -262,6 +308,7 @@ if __name__ == '__main__':
     suite.addTest(TestPidFile('test_create_forbidden', verbose))
     suite.addTest(TestPidFile('test_create_invalid', verbose))
     suite.addTest(TestPidFile('test_create_concurrent', verbose))
+    suite.addTest(TestPidFile('test_check_reused_pid', verbose))
 
     runner = unittest.TextTestRunner(verbosity=verbose)
 
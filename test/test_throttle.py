@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+@author: Frank Brehm
+@contact: frank.brehm@profitbricks.com
+@organization: Profitbricks GmbH
+@copyright: © 2010 - 2016 by Profitbricks GmbH
+@license: GPL3
+@summary: test script (and module) for unit tests on throttle module
+"""
+
+import os
+import sys
+import time
+import logging
+import tempfile
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+libdir = os.path.abspath(os.path.join(os.path.dirname(sys.argv[0]), '..'))
+sys.path.insert(0, libdir)
+
+from general import PbBaseTestcase, get_arg_verbose, init_root_logger
+
+log = logging.getLogger('test_throttle')
+
+
+# =============================================================================
+class TestPbThrottle(PbBaseTestcase):
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+        pass
+
+    # -------------------------------------------------------------------------
+    def test_import(self):
+
+        log.info("Testing import of pb_base.throttle ...")
+        import pb_base.throttle                                 # noqa
+
+        log.info("Testing import of TokenBucket from pb_base.throttle ...")
+        from pb_base.throttle import TokenBucket                # noqa
+
+        log.info("Testing import of IoThrottle from pb_base.throttle ...")
+        from pb_base.throttle import IoThrottle                 # noqa
+
+    # -------------------------------------------------------------------------
+    def test_parse_rate(self):
+
+        log.info("Testing parse_rate() from pb_base.throttle ...")
+
+        from pb_base.throttle import parse_rate
+
+        self.assertEqual(parse_rate('50M'), 50 * 1024 * 1024)
+        self.assertEqual(parse_rate('1.5 GiB/s'), 1.5 * 1024 * 1024 * 1024)
+        self.assertEqual(parse_rate(200), 200)
+        self.assertIsNone(parse_rate(None))
+        self.assertIsNone(parse_rate(0))
+        self.assertIsNone(parse_rate('unlimited'))
+        with self.assertRaises(ValueError):
+            parse_rate('fast')
+
+    # -------------------------------------------------------------------------
+    def test_token_bucket(self):
+
+        log.info("Testing TokenBucket from pb_base.throttle ...")
+
+        from pb_base.throttle import TokenBucket
+
+        bucket = TokenBucket()
+        self.assertEqual(bucket.consume(10 ** 9), 0)
+
+        bucket = TokenBucket(rate=100, burst=10)
+        self.assertEqual(bucket.reserve(10), 0)
+        wait = bucket.reserve(20)
+        log.debug("Waiting time for 20 tokens: %r", wait)
+        self.assertGreater(wait, 0.15)
+        self.assertLess(wait, 0.25)
+
+        bucket.set_rate(None)
+        self.assertEqual(bucket.reserve(1000), 0)
+
+    # -------------------------------------------------------------------------
+    def test_token_bucket_rate_change(self):
+
+        log.info("Testing changing the rate of a TokenBucket while waiting ...")
+
+        import threading
+
+        from pb_base.throttle import TokenBucket
+
+        # a debt of 10 seconds, paid off after lifting the limit
+        bucket = TokenBucket(rate=10, burst=10)
+        timer = threading.Timer(0.3, bucket.set_rate, [None])
+        timer.start()
+        start = time.time()
+        try:
+            bucket.consume(110)
+        finally:
+            timer.cancel()
+        duration = time.time() - start
+        log.debug("Waited %.3f seconds until the limit was lifted.", duration)
+        self.assertGreater(duration, 0.25)
+        self.assertLess(duration, 1.0)
+
+        # like a signal handler interrupting a consumer holding the lock
+        bucket = TokenBucket(rate=100, burst=10)
+        with bucket._lock:
+            bucket.set_rate(1000, 50)
+            self.assertEqual(bucket.rate, 1000)
+            self.assertEqual(bucket._rate, 100)
+            self.assertEqual(bucket._tokens, 10)
+        self.assertEqual(bucket.reserve(10), 0)
+        self.assertEqual(bucket._rate, 1000)
+        self.assertEqual(bucket._burst, 50)
+
+    # -------------------------------------------------------------------------
+    def test_io_throttle(self):
+
+        log.info("Testing IoThrottle from pb_base.throttle ...")
+
+        from pb_base.throttle import IoThrottle
+
+        throttle = IoThrottle(bytes_per_sec=1000, iops=None)
+        start = time.time()
+        for i in range(15):
+            throttle(100)
+        duration = time.time() - start
+        log.debug("Needed %.3f seconds for 1500 Bytes with 1000 Bytes/s.", duration)
+        self.assertGreater(duration, 0.4)
+
+        throttle.set_limits(None, iops=50)
+        self.assertIsNone(throttle.bytes_per_sec)
+        self.assertEqual(throttle.iops, 50)
+
+        (fd, limit_file) = tempfile.mkstemp()
+        try:
+            os.write(fd, b'# limits\nbytes_per_sec = 10M\niops: 200\n')
+            os.close(fd)
+            throttle.load_limits(limit_file)
+        finally:
+            os.remove(limit_file)
+        self.assertEqual(throttle.bytes_per_sec, 10 * 1024 * 1024)
+        self.assertEqual(throttle.iops, 200)
+        self.assertTrue(throttle.limited)
+
+# =============================================================================
+
+if __name__ == '__main__':
+
+    verbose = get_arg_verbose()
+    if verbose is None:
+        verbose = 0
+    init_root_logger(verbose)
+
+    log.info("Starting tests ...")
+
+    suite = unittest.TestSuite()
+
+    suite.addTest(TestPbThrottle('test_import', verbose))
+    suite.addTest(TestPbThrottle('test_parse_rate', verbose))
+    suite.addTest(TestPbThrottle('test_token_bucket', verbose))
+    suite.addTest(TestPbThrottle('test_token_bucket_rate_change', verbose))
+    suite.addTest(TestPbThrottle('test_io_throttle', verbose))
+
+    runner = unittest.TextTestRunner(verbosity=verbose)
+
+    result = runner.run(suite)
+
+# =============================================================================
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4